@@ -1,11 +1,22 @@
-import os
+import logging
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Dict, Optional
 
 from dotenv import load_dotenv
+from fastapi import Request
 from pydantic_settings import BaseSettings
-from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
+from services.metrics import TimedQueuePool
+
+logger = logging.getLogger(__name__)
+
+# Before the modules that read their tuning knobs from os.environ at import
 load_dotenv()
 
 
@@ -13,30 +24,233 @@ class Settings(BaseSettings):
     database_url: str
     openai_api_key: str
 
+    # Connection pool tuning (ignored for SQLite)
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30  # seconds to wait for a pooled connection
+    db_pool_recycle: int = 1800  # seconds before a connection is replaced
+    db_pool_pre_ping: bool = True
+
+    # Optional read replica for read-only endpoints (see SessionRouter)
+    database_replica_url: Optional[str] = None
+    db_replica_sticky_seconds: float = 5  # reads stay on the primary this long after the user's own write
+    db_replica_retry_seconds: float = 30  # reads skip an unreachable replica this long
+
     class Config:
         env_file = ".env"
         extra = "ignore"
 
 
-settings = Settings()
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Read on first use, so importing this module needs neither the environment nor a database"""
+    settings = Settings()
+    # Production-only: require DATABASE_URL (e.g., PostgreSQL)
+    if not settings.database_url:
+        raise RuntimeError("DATABASE_URL is required for production.")
+    return settings
+
+
+def async_database_url(url: str) -> str:
+    """Map a plain DATABASE_URL onto its asyncio driver (asyncpg / aiosqlite)"""
+    for prefix in ("postgresql://", "postgres://", "postgresql+psycopg2://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+
+def engine_options(url: str) -> dict:
+    settings = get_settings()
+    if url.startswith("sqlite"):
+        # In-memory databases keep SQLAlchemy's single-connection pool
+        return {} if ":memory:" in url else {"poolclass": TimedQueuePool}
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def database_url() -> str:
+    return async_database_url(get_settings().database_url)
+
+
+def replica_database_url() -> Optional[str]:
+    url = get_settings().database_replica_url
+    return async_database_url(url) if url else None
+
+
+class _LazySessionmaker(async_sessionmaker):
+    """Binds itself to its engine when a session is opened, creating the engine on first use"""
+
+    def __init__(self, engine: Callable[[], AsyncEngine], **kw):
+        super().__init__(**kw)
+        self._engine = engine
+
+    def __call__(self, **local_kw) -> AsyncSession:
+        engine = self._engine()
+        if self.kw.get("bind") is not engine:
+            self.configure(bind=engine)
+        return super().__call__(**local_kw)
+
+
+PRIMARY = "primary"
+REPLICA = "replica"
+
+_engines: Dict[str, AsyncEngine] = {}
+
+
+def _cached_engine(pool: str, url: str) -> AsyncEngine:
+    if pool not in _engines:
+        # The pool's logging name labels its metrics (see metrics.TimedQueuePool)
+        _engines[pool] = create_async_engine(url, pool_logging_name=pool, **engine_options(url))
+    return _engines[pool]
+
 
-# Production-only: require DATABASE_URL (e.g., PostgreSQL)
-if not settings.database_url:
-    raise RuntimeError("DATABASE_URL is required for production.")
+def get_engine() -> AsyncEngine:
+    """
+    The primary's engine, created on first use (creating it doesn't connect yet).
+    The API creates it in its lifespan; scripts get it from their first session.
+    """
+    return _cached_engine(PRIMARY, database_url())
 
-engine = create_engine(settings.database_url)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def get_replica_engine() -> Optional[AsyncEngine]:
+    """The read replica's engine, or None without DATABASE_REPLICA_URL"""
+    url = replica_database_url()
+    return _cached_engine(REPLICA, url) if url else None
+
+
+async def dispose_engine():
+    """Close the connections of all engines; the next use creates new ones"""
+    engines = list(_engines.values())
+    _engines.clear()
+    for engine in engines:
+        await engine.dispose()
+
+
+# expire_on_commit=False: objects stay usable after commit without lazy reloads,
+# which AsyncSession cannot do implicitly
+SessionLocal = _LazySessionmaker(get_engine, autoflush=False, expire_on_commit=False)
+ReplicaSessionLocal = _LazySessionmaker(get_replica_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+class SessionRouter:
+    """
+    Picks the database for read-only requests. Reads go to the replica when
+    one is configured, except:
+    - for DB_REPLICA_STICKY_SECONDS after the user's own write, so replication
+      lag can't hide it from them (record_write; per process, like the
+      in-process response cache)
+    - for DB_REPLICA_RETRY_SECONDS after a connection error on the replica;
+      the first session after that checks the replica before it is used
+    Everything else, and all writes, use the primary.
+    """
+
+    # Expired entries are dropped once this many users are remembered
+    STICKY_USERS_PRUNE = 10000
+
+    def __init__(self):
+        self._primary_until: Dict[int, float] = {}
+        self._replica_down_until = 0.0
+        self._replica_suspect = False
+        self.stats = {"primary": 0, "replica": 0, "sticky": 0, "replica_errors": 0}
+
+    def record_write(self, user_id: int):
+        """Call after committing a change to the user's data"""
+        settings = get_settings()
+        if not settings.database_replica_url or settings.db_replica_sticky_seconds <= 0:
+            return
+        now = time.monotonic()
+        self._primary_until[user_id] = now + settings.db_replica_sticky_seconds
+        if len(self._primary_until) > self.STICKY_USERS_PRUNE:
+            self._primary_until = {user: until for user, until in self._primary_until.items() if until > now}
+
+    def _use_replica(self, user_id: int) -> bool:
+        if not get_settings().database_replica_url:
+            return False
+        now = time.monotonic()
+        if now < self._replica_down_until:
+            return False
+        if now < self._primary_until.get(user_id, 0.0):
+            self.stats["sticky"] += 1
+            return False
+        return True
+
+    def _replica_failed(self, error: Exception):
+        self.stats["replica_errors"] += 1
+        self._replica_suspect = True
+        self._replica_down_until = time.monotonic() + get_settings().db_replica_retry_seconds
+        logger.warning("Read replica failed, reading from the primary: %s", error)
+
+    @asynccontextmanager
+    async def read_session(self, user_id: int) -> AsyncIterator[AsyncSession]:
+        """A session for reading the user's data, on the replica or the primary"""
+        session = None
+        if self._use_replica(user_id):
+            session = ReplicaSessionLocal()
+            if self._replica_suspect:
+                # The first session after a failure connects up front, so a
+                # replica that is still down costs no request
+                try:
+                    await session.connection()
+                    self._replica_suspect = False
+                except (OperationalError, InterfaceError, OSError) as e:
+                    await session.close()
+                    self._replica_failed(e)
+                    session = None
+
+        if session is None:
+            self.stats["primary"] += 1
+            async with SessionLocal() as session:
+                yield session
+            return
+
+        # Otherwise not connected up front: requests answered from the response cache never use it
+        self.stats["replica"] += 1
+        try:
+            async with session:
+                yield session
+        except (OperationalError, InterfaceError, OSError) as e:
+            # This request fails; the next ones read from the primary for a while
+            self._replica_failed(e)
+            raise
+
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        return {
+            **self.stats,
+            "replica_down": int(now < self._replica_down_until),
+            "sticky_users": sum(1 for until in self._primary_until.values() if until > now),
+        }
+
+
+session_router = SessionRouter()
+
+
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
+
+
+async def get_read_db(request: Request):
+    """FastAPI dependency for read-only endpoints: a session chosen by session_router"""
+    # The auth settings are only needed (and required) by the API, not by scripts importing this module
+    from services.auth import get_current_user_id, oauth2_scheme
+
+    user_id = await get_current_user_id(await oauth2_scheme(request))
+    async with session_router.read_session(user_id) as db:
         yield db
-    finally:
-        db.close()
 
 
-def ensure_optional_time_column():
-    return
+def dialect_insert(db: AsyncSession, model):
+    """INSERT construct for the session's dialect, supporting ON CONFLICT upserts"""
+    if db.bind.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
@@ -1,14 +1,53 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
 
-from database import Base, engine
-from fastapi import FastAPI
+from database import dispose_engine, get_engine, get_replica_engine, session_router
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routers import ai_analysis, diet_plan, food_logs
+from routers import ai_analysis, auth, diet_plan, food_logs, jobs
+from services import ai_service, diet_prompt, metrics, nutrient_engine, nutrition, readiness
+from services.auth import token_cache
+from services.analysis_cache import analysis_cache
+from services.job_queue import worker_pool
+from services.rate_limit import rate_limiter
+from services.response_cache import response_cache
+from services.single_flight import analysis_flights, llm_flights
+
+metrics.expose_stats("fitbuddy_analysis_cache", "Nutrient analysis cache", analysis_cache.snapshot)
+metrics.expose_stats("fitbuddy_nutrient_engine", "Analyses by the local nutrient engine", lambda: nutrient_engine.stats)
+metrics.expose_stats("fitbuddy_daily_summaries", "Daily summaries served stored or generated", lambda: nutrition.summary_stats)
+metrics.expose_stats("fitbuddy_analysis_flights", "Coalesced food log analyses", analysis_flights.snapshot)
+metrics.expose_stats("fitbuddy_llm_flights", "Coalesced LLM analyses", llm_flights.snapshot)
+metrics.expose_stats("fitbuddy_auth_token_cache", "Verified access token cache", token_cache.snapshot)
+metrics.expose_stats("fitbuddy_response_cache", "Per-user GET response cache", response_cache.snapshot)
+metrics.expose_stats("fitbuddy_llm_breaker", "LLM circuit breaker", ai_service.llm_breaker.snapshot)
+metrics.expose_stats("fitbuddy_db_reads", "Read-only sessions by database", session_router.snapshot)
+metrics.expose_stats("fitbuddy_rate_limit", "Per-user rate limits and LLM budgets", rate_limiter.snapshot)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing here connects or waits: the engine and the LLM client open
+    # connections on first use and the schema is managed by migrations, so
+    # /health answers right away and /ready once the database does
+    metrics.instrument_engine(get_engine())
+    replica = get_replica_engine()
+    if replica is not None:
+        metrics.instrument_engine(replica, "replica")
+    worker_pool.start()
+    # Loaded in the background (it may be downloaded), so the first diet plan doesn't wait for it
+    tokenizer = asyncio.create_task(diet_prompt.load_encoding(ai_service.DIET_PLAN_MODEL))
+    yield
+    tokenizer.cancel()
+    await worker_pool.stop()
+    await ai_service.close_client()
+    await dispose_engine()
 
-# Create tables (use real migrations in production)
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
+    lifespan=lifespan,
     title="FitBuddy API",
     description="Food tracking and diet planning API",
     version="1.0.0",
@@ -27,10 +66,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so it times everything including CORS handling
+app.add_middleware(metrics.MetricsMiddleware)
 # Include routers
+app.include_router(auth.router, prefix="/api/auth", tags=["Auth"])
 app.include_router(food_logs.router, prefix="/api/food-logs", tags=["Food Logs"])
 app.include_router(ai_analysis.router, prefix="/api/ai", tags=["AI Analysis"])
 app.include_router(diet_plan.router, prefix="/api/diet-plan", tags=["Diet Plan"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["Jobs"])
 
 
 @app.get("/")
@@ -40,4 +83,21 @@ async def root():
 
 @app.get("/health")
 async def health():
+    """Liveness: the process is up, nothing else is checked"""
     return {"status": "healthy"}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: whether the database (and the LLM, if required) can serve requests"""
+    is_ready, checks = await readiness.readiness()
+    return JSONResponse(
+        {"status": "ready" if is_ready else "unavailable", "checks": checks},
+        status_code=200 if is_ready else 503,
+    )
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,68 @@
+"""Baseline schema, as previously created by Base.metadata.create_all
+
+Databases created before migrations existed should be stamped instead of
+upgraded:  alembic stamp 0001_baseline
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_baseline"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+meal_time = sa.Enum("MORNING", "AFTERNOON", "EVENING", name="mealtime")
+
+
+def upgrade():
+    op.create_table(
+        "food_logs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer()),
+        sa.Column("date", sa.String()),
+        sa.Column("meal_time", meal_time),
+        sa.Column("time", sa.String(), nullable=True),
+        sa.Column("food_description", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+    )
+    op.create_index("ix_food_logs_id", "food_logs", ["id"])
+    op.create_index("ix_food_logs_user_id", "food_logs", ["user_id"])
+    op.create_index("ix_food_logs_date", "food_logs", ["date"])
+    op.create_index("ix_food_logs_meal_time", "food_logs", ["meal_time"])
+
+    op.create_table(
+        "food_analyses",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("food_log_id", sa.Integer(), sa.ForeignKey("food_logs.id", ondelete="CASCADE")),
+        sa.Column("calories", sa.Float()),
+        sa.Column("protein", sa.Float()),
+        sa.Column("carbs", sa.Float()),
+        sa.Column("fats", sa.Float()),
+        sa.Column("fiber", sa.Float()),
+        sa.Column("summary", sa.Text()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_food_analyses_id", "food_analyses", ["id"])
+    op.create_index("ix_food_analyses_food_log_id", "food_analyses", ["food_log_id"])
+
+    op.create_table(
+        "diet_plans",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer()),
+        sa.Column("recommendations", sa.Text()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+    )
+    op.create_index("ix_diet_plans_id", "diet_plans", ["id"])
+    op.create_index("ix_diet_plans_user_id", "diet_plans", ["user_id"])
+
+
+def downgrade():
+    for table in ("diet_plans", "food_analyses", "food_logs"):
+        op.drop_table(table)
+    meal_time.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,157 @@
+"""Typed date/time columns, covering food log index, unique analysis per log
+
+Converts food_logs.date to DATE and food_logs.time to TIME, adds a covering
+index on (user_id, date, meal_time) INCLUDE (id), and makes
+food_analyses.food_log_id unique. Duplicate analyses are removed first
+(the oldest is kept).
+
+Also adds the tables introduced since the baseline: nutrient_cache,
+daily_nutrient_totals and jobs. Databases that already got them from
+Base.metadata.create_all keep nutrient_cache and jobs; daily_nutrient_totals
+is derived data, so it is recreated and backfilled from food_logs and
+food_analyses either way.
+
+Revision ID: 0002_typed_dates_and_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_typed_dates_and_indexes"
+down_revision = "0001_baseline"
+branch_labels = None
+depends_on = None
+
+job_kind = sa.Enum("ANALYZE", "SUMMARIZE", "DIET_PLAN", name="jobkind")
+job_status = sa.Enum("PENDING", "RUNNING", "DONE", "FAILED", name="jobstatus")
+
+# Same as services.nutrient_rollup.rebuild
+BACKFILL_DAILY_NUTRIENT_TOTALS = """
+INSERT INTO daily_nutrient_totals
+    (user_id, date, calories, protein, carbs, fats, fiber, log_count, analysis_count)
+SELECT
+    food_logs.user_id, food_logs.date,
+    COALESCE(SUM(food_analyses.calories), 0), COALESCE(SUM(food_analyses.protein), 0),
+    COALESCE(SUM(food_analyses.carbs), 0), COALESCE(SUM(food_analyses.fats), 0),
+    COALESCE(SUM(food_analyses.fiber), 0),
+    COUNT(food_logs.id), COUNT(food_analyses.id)
+FROM food_logs
+LEFT OUTER JOIN food_analyses ON food_analyses.food_log_id = food_logs.id
+WHERE food_logs.user_id IS NOT NULL AND food_logs.date IS NOT NULL
+GROUP BY food_logs.user_id, food_logs.date
+"""
+
+
+def upgrade():
+    conn = op.get_bind()
+    is_sqlite = conn.dialect.name == "sqlite"
+    existing = set(sa.inspect(conn).get_table_names())
+
+    op.execute("UPDATE food_logs SET time = NULL WHERE time = ''")
+    if is_sqlite:
+        # SQLite stores TIME as text and expects seconds
+        op.execute(
+            sa.text("UPDATE food_logs SET time = time || :seconds WHERE length(time) = 5")
+            .bindparams(seconds=":00")
+        )
+
+    # SQLite keeps ISO text either way; a batch table copy would CAST it to a number
+    if not is_sqlite:
+        op.alter_column(
+            "food_logs", "date", type_=sa.Date(), existing_type=sa.String(),
+            postgresql_using="date::date",
+        )
+        op.alter_column(
+            "food_logs", "time", type_=sa.Time(), existing_type=sa.String(), existing_nullable=True,
+            postgresql_using="time::time",
+        )
+    op.create_index(
+        "ix_food_logs_user_date", "food_logs", ["user_id", "date", "meal_time"],
+        postgresql_include=["id"],
+    )
+
+    op.execute(
+        "DELETE FROM food_analyses WHERE id NOT IN "
+        "(SELECT MIN(id) FROM food_analyses GROUP BY food_log_id)"
+    )
+    op.drop_index("ix_food_analyses_food_log_id", table_name="food_analyses")
+    op.create_index("ix_food_analyses_food_log_id", "food_analyses", ["food_log_id"], unique=True)
+
+    if "nutrient_cache" not in existing:
+        op.create_table(
+            "nutrient_cache",
+            sa.Column("cache_key", sa.String(64), primary_key=True),
+            sa.Column("version", sa.String()),
+            sa.Column("normalized_description", sa.Text(), nullable=False),
+            sa.Column("calories", sa.Float()),
+            sa.Column("protein", sa.Float()),
+            sa.Column("carbs", sa.Float()),
+            sa.Column("fats", sa.Float()),
+            sa.Column("fiber", sa.Float()),
+            sa.Column("summary", sa.Text()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_nutrient_cache_version", "nutrient_cache", ["version"])
+
+    if "daily_nutrient_totals" in existing:
+        op.drop_table("daily_nutrient_totals")
+    op.create_table(
+        "daily_nutrient_totals",
+        sa.Column("user_id", sa.Integer(), primary_key=True),
+        sa.Column("date", sa.Date(), primary_key=True),
+        sa.Column("calories", sa.Float(), nullable=False),
+        sa.Column("protein", sa.Float(), nullable=False),
+        sa.Column("carbs", sa.Float(), nullable=False),
+        sa.Column("fats", sa.Float(), nullable=False),
+        sa.Column("fiber", sa.Float(), nullable=False),
+        sa.Column("log_count", sa.Integer(), nullable=False),
+        sa.Column("analysis_count", sa.Integer(), nullable=False),
+    )
+    op.execute(BACKFILL_DAILY_NUTRIENT_TOTALS)
+
+    if "jobs" not in existing:
+        op.create_table(
+            "jobs",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer()),
+            sa.Column("kind", job_kind, nullable=False),
+            sa.Column("payload", sa.JSON(), nullable=False),
+            sa.Column("status", job_status, nullable=False),
+            sa.Column("result", sa.JSON(), nullable=True),
+            sa.Column("error", sa.Text(), nullable=True),
+            sa.Column("attempts", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+            sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        )
+        op.create_index("ix_jobs_id", "jobs", ["id"])
+        op.create_index("ix_jobs_user_id", "jobs", ["user_id"])
+        op.create_index("ix_jobs_status_id", "jobs", ["status", "id"])
+
+
+def downgrade():
+    is_sqlite = op.get_bind().dialect.name == "sqlite"
+
+    for table in ("jobs", "daily_nutrient_totals", "nutrient_cache"):
+        op.drop_table(table)
+    for enum in (job_status, job_kind):
+        enum.drop(op.get_bind(), checkfirst=True)
+
+    op.drop_index("ix_food_analyses_food_log_id", table_name="food_analyses")
+    op.create_index("ix_food_analyses_food_log_id", "food_analyses", ["food_log_id"])
+
+    op.drop_index("ix_food_logs_user_date", table_name="food_logs")
+    if is_sqlite:
+        # Back to HH:MM, dropping the seconds the upgrade added (and the
+        # microseconds SQLAlchemy writes for TIME since)
+        op.execute("UPDATE food_logs SET time = substr(time, 1, 5) WHERE length(time) > 5")
+    else:
+        op.alter_column(
+            "food_logs", "time", type_=sa.String(), existing_type=sa.Time(), existing_nullable=True,
+            postgresql_using="to_char(time, 'HH24:MI')",
+        )
+        op.alter_column(
+            "food_logs", "date", type_=sa.String(), existing_type=sa.Date(),
+            postgresql_using="to_char(date, 'YYYY-MM-DD')",
+        )
@@ -0,0 +1,28 @@
+"""Record which engine produced each food analysis
+
+Adds food_analyses.engine ("local" for the offline nutrient engine, "llm"
+for the model). Existing rows all came from the LLM.
+
+Revision ID: 0003_analysis_engine
+Revises: 0002_typed_dates_and_indexes
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_analysis_engine"
+down_revision = "0002_typed_dates_and_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "food_analyses",
+        sa.Column("engine", sa.String(length=16), nullable=False, server_default="llm"),
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("food_analyses") as batch_op:
+        batch_op.drop_column("engine")
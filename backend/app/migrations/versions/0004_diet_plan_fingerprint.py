@@ -0,0 +1,81 @@
+"""Diet plan recommendations as JSON, input fingerprint
+
+Adds diet_plans.input_fingerprint and converts diet_plans.recommendations
+from the Python repr of a dict (what used to be stored) to JSON (JSONB on
+PostgreSQL). Rows that can't be parsed are kept as a single general
+recommendation.
+
+Revision ID: 0004_diet_plan_fingerprint
+Revises: 0003_analysis_engine
+Create Date: 2026-10-18
+"""
+import ast
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0004_diet_plan_fingerprint"
+down_revision = "0003_analysis_engine"
+branch_labels = None
+depends_on = None
+
+JSON_TYPE = sa.JSON().with_variant(postgresql.JSONB(), "postgresql")
+
+
+def _parse(text):
+    if text is None:
+        return None
+    for parse in (json.loads, ast.literal_eval):
+        try:
+            value = parse(text)
+        except (ValueError, SyntaxError):
+            continue
+        if isinstance(value, dict):
+            return value
+    return {"high_calorie_foods": [], "general_recommendations": [text], "meal_timing_suggestions": ""}
+
+
+def upgrade():
+    op.add_column("diet_plans", sa.Column("input_fingerprint", sa.String(length=64), nullable=True))
+    op.add_column("diet_plans", sa.Column("recommendations_json", JSON_TYPE, nullable=True))
+
+    plans = sa.table(
+        "diet_plans",
+        sa.column("id", sa.Integer),
+        sa.column("recommendations", sa.Text),
+        sa.column("recommendations_json", JSON_TYPE),
+    )
+    conn = op.get_bind()
+    for plan_id, text in conn.execute(sa.select(plans.c.id, plans.c.recommendations)).all():
+        conn.execute(
+            plans.update().where(plans.c.id == plan_id).values(recommendations_json=_parse(text))
+        )
+
+    with op.batch_alter_table("diet_plans") as batch_op:
+        batch_op.drop_column("recommendations")
+        batch_op.alter_column("recommendations_json", new_column_name="recommendations")
+
+
+def downgrade():
+    op.add_column("diet_plans", sa.Column("recommendations_text", sa.Text, nullable=True))
+
+    plans = sa.table(
+        "diet_plans",
+        sa.column("id", sa.Integer),
+        sa.column("recommendations", JSON_TYPE),
+        sa.column("recommendations_text", sa.Text),
+    )
+    conn = op.get_bind()
+    for plan_id, value in conn.execute(sa.select(plans.c.id, plans.c.recommendations)).all():
+        conn.execute(
+            plans.update().where(plans.c.id == plan_id).values(
+                recommendations_text=None if value is None else json.dumps(value)
+            )
+        )
+
+    with op.batch_alter_table("diet_plans") as batch_op:
+        batch_op.drop_column("recommendations")
+        batch_op.alter_column("recommendations_text", new_column_name="recommendations")
+        batch_op.drop_column("input_fingerprint")
@@ -0,0 +1,68 @@
+"""Users, single food log index per user
+
+Adds the users table. Drops the single-column indexes on food_logs.user_id,
+date and meal_time: every food log query filters on user_id first and is
+served by ix_food_logs_user_date, and the extra indexes only slowed writes
+(and tempted SQLite's planner away from the composite index).
+
+Data from before accounts existed was all stored as user 1. If there is any,
+user 1 is created here as a placeholder account that can't sign in, so the
+food logs aren't handed to whoever registers first; they stay unreachable
+until their owner claims the account with services.legacy_owner.
+
+Revision ID: 0005_users
+Revises: 0004_diet_plan_fingerprint
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005_users"
+down_revision = "0004_diet_plan_fingerprint"
+branch_labels = None
+depends_on = None
+
+# Keep in step with services.legacy_owner
+LEGACY_OWNER_EMAIL = "legacy-owner@fitbuddy.invalid"
+# Not a hash passlib recognizes, so no password matches it
+UNUSABLE_PASSWORD = "!"
+USER_DATA_TABLES = ("food_logs", "diet_plans", "daily_nutrient_totals", "jobs")
+
+SINGLE_COLUMN_INDEXES = {
+    "ix_food_logs_user_id": "user_id",
+    "ix_food_logs_date": "date",
+    "ix_food_logs_meal_time": "meal_time",
+}
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("email", sa.String(length=255), nullable=False),
+        sa.Column("hashed_password", sa.String(length=255), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    conn = op.get_bind()
+    if any(conn.execute(sa.text(f"SELECT 1 FROM {table} LIMIT 1")).first() for table in USER_DATA_TABLES):
+        # The first row of the new table, so it gets id 1 on every backend
+        conn.execute(
+            sa.text("INSERT INTO users (email, hashed_password) VALUES (:email, :password)"),
+            {"email": LEGACY_OWNER_EMAIL, "password": UNUSABLE_PASSWORD},
+        )
+
+    for name in SINGLE_COLUMN_INDEXES:
+        op.drop_index(name, table_name="food_logs")
+
+
+def downgrade():
+    for name, column in SINGLE_COLUMN_INDEXES.items():
+        op.create_index(name, "food_logs", [column])
+
+    op.drop_index("ix_users_email", table_name="users")
+    op.drop_index("ix_users_id", table_name="users")
+    op.drop_table("users")
@@ -0,0 +1,25 @@
+"""Deferred jobs
+
+Adds jobs.run_after: jobs whose LLM call couldn't be made (provider down or
+circuit breaker open) go back to pending and aren't claimed before then.
+
+Revision ID: 0006_job_run_after
+Revises: 0005_users
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006_job_run_after"
+down_revision = "0005_users"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("jobs", sa.Column("run_after", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("jobs") as batch_op:
+        batch_op.drop_column("run_after")
@@ -0,0 +1,36 @@
+"""Stored daily summaries
+
+Adds daily_summaries: the latest AI summary per (user_id, date) with a
+fingerprint of the food logs it covers, so unchanged days are served from
+the table and new meals are folded into the previous summary.
+
+Revision ID: 0007_daily_summaries
+Revises: 0006_job_run_after
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0007_daily_summaries"
+down_revision = "0006_job_run_after"
+branch_labels = None
+depends_on = None
+
+JSON_TYPE = sa.JSON().with_variant(postgresql.JSONB(), "postgresql")
+
+
+def upgrade():
+    op.create_table(
+        "daily_summaries",
+        sa.Column("user_id", sa.Integer(), primary_key=True),
+        sa.Column("date", sa.Date(), primary_key=True),
+        sa.Column("summary", sa.Text(), nullable=False),
+        sa.Column("input_fingerprint", sa.String(length=64), nullable=False),
+        sa.Column("log_digests", JSON_TYPE, nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+
+
+def downgrade():
+    op.drop_table("daily_summaries")
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Enum, ForeignKey, Index
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Time, Text, Enum, ForeignKey, Index, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from database import Base
 import enum
@@ -8,14 +9,35 @@ class MealTime(str, enum.Enum):
     AFTERNOON = "afternoon"
     EVENING = "evening"
 
+class JobKind(str, enum.Enum):
+    ANALYZE = "analyze"
+    SUMMARIZE = "summarize"
+    DIET_PLAN = "diet_plan"
+
+class JobStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String(255), nullable=False, unique=True, index=True)  # stored lowercased
+    hashed_password = Column(String(255), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class FoodLog(Base):
     __tablename__ = "food_logs"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)  # For future multi-user support
-    date = Column(String, index=True)  # YYYY-MM-DD format
-    meal_time = Column(Enum(MealTime), index=True)
-    time = Column(String, nullable=True)  # Optional HH:MM
+    # No single-column indexes: every query filters on user_id first and
+    # is served by ix_food_logs_user_date below
+    user_id = Column(Integer)
+    date = Column(Date)
+    meal_time = Column(Enum(MealTime))
+    time = Column(Time, nullable=True)  # Optional time of the meal
     food_description = Column(Text, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -24,22 +46,82 @@ class FoodAnalysis(Base):
     __tablename__ = "food_analyses"
 
     id = Column(Integer, primary_key=True, index=True)
-    food_log_id = Column(Integer, ForeignKey("food_logs.id", ondelete="CASCADE"), index=True)
+    food_log_id = Column(Integer, ForeignKey("food_logs.id", ondelete="CASCADE"), index=True, unique=True)
     calories = Column(Float)
     protein = Column(Float)  # in grams
     carbs = Column(Float)  # in grams
     fats = Column(Float)  # in grams
     fiber = Column(Float)  # in grams
     summary = Column(Text)
+    engine = Column(String(16), nullable=False, default="llm", server_default="llm")  # "local" or "llm"
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
-Index("ix_food_logs_user_date", "user_id", "date")
+# Covers the per-user date range scans; INCLUDE (id) makes them index-only on PostgreSQL
+Index("ix_food_logs_user_date", FoodLog.user_id, FoodLog.date, FoodLog.meal_time, postgresql_include=["id"])
+
+class DailyNutrientTotal(Base):
+    __tablename__ = "daily_nutrient_totals"
+
+    # Rollup of food_logs/food_analyses maintained by services.nutrient_rollup
+    user_id = Column(Integer, primary_key=True)
+    date = Column(Date, primary_key=True)
+    calories = Column(Float, nullable=False, default=0)
+    protein = Column(Float, nullable=False, default=0)  # in grams
+    carbs = Column(Float, nullable=False, default=0)  # in grams
+    fats = Column(Float, nullable=False, default=0)  # in grams
+    fiber = Column(Float, nullable=False, default=0)  # in grams
+    log_count = Column(Integer, nullable=False, default=0)
+    analysis_count = Column(Integer, nullable=False, default=0)
 
 class DietPlan(Base):
     __tablename__ = "diet_plans"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True)
-    recommendations = Column(Text)  # JSON string of recommendations
+    recommendations = Column(JSON().with_variant(JSONB(), "postgresql"))
+    input_fingerprint = Column(String(64))  # sha256 of the logs, analyses and prompt version it was built from
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class DailySummary(Base):
+    __tablename__ = "daily_summaries"
+
+    # Latest AI summary of a day, kept up to date by services.nutrition.summarize_day
+    user_id = Column(Integer, primary_key=True)
+    date = Column(Date, primary_key=True)
+    summary = Column(Text, nullable=False)
+    input_fingerprint = Column(String(64), nullable=False)  # sha256 of the included logs and the prompt version
+    log_digests = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=False)  # food log id -> digest of its prompt input
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class NutrientCacheEntry(Base):
+    __tablename__ = "nutrient_cache"
+
+    cache_key = Column(String(64), primary_key=True)  # sha256 of version + normalized description
+    version = Column(String, index=True)  # Prompt/model version that produced the entry
+    normalized_description = Column(Text, nullable=False)
+    calories = Column(Float)
+    protein = Column(Float)  # in grams
+    carbs = Column(Float)  # in grams
+    fats = Column(Float)  # in grams
+    fiber = Column(Float)  # in grams
+    summary = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, index=True)
+    kind = Column(Enum(JobKind), nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.PENDING)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    run_after = Column(DateTime(timezone=True), nullable=True)  # deferred while the LLM is unavailable
+
+Index("ix_jobs_status_id", Job.status, Job.id)
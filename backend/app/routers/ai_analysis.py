@@ -1,120 +1,307 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List, Dict
-from database import get_db
+import asyncio
+import datetime as dt
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from pydantic import ValidationError
+from pydantic_core import to_json
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from database import SessionLocal, get_db, get_read_db
 import models
 import schemas
-from services import ai_service
+from services import ai_service, job_queue, nutrient_engine, nutrition, sse, trends
+from services.rate_limit import ANALYZE, GENERATE, rate_limited, rate_limiter
+from services.auth import get_current_user_id
+from services.response_cache import response_cache
+from services.analysis_cache import analysis_cache, normalize_description
+from services.single_flight import analysis_flights, llm_flights
 
 router = APIRouter()
 
+# Food descriptions packed into a single batch analysis prompt
+ANALYSIS_BATCH_SIZE = int(os.getenv("ANALYSIS_BATCH_SIZE", "20"))
+
 @router.post("/analyze", response_model=schemas.FoodAnalysisResponse)
 async def analyze_food(
     request: schemas.FoodAnalysisRequest,
-    db: Session = Depends(get_db)
+    user_id: int = Depends(rate_limited(ANALYZE)),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Analyze a food log entry and extract nutritional information. While the
+    LLM is unavailable this returns 503 with Retry-After and queues an
+    analysis job instead (its URL is in the Location header).
+    """
+    try:
+        return await nutrition.analyze_food_log(user_id, request.food_log_id)
+    except HTTPException as e:
+        if e.status_code != 503:
+            raise
+        await db.rollback()
+        job = job_queue.enqueue(
+            db, user_id, models.JobKind.ANALYZE,
+            food_log_id=request.food_log_id, run_after=job_queue.retry_time(e)
+        )
+        await db.commit()
+        raise HTTPException(
+            status_code=503, detail=f"{e.detail}; queued as job {job.id}",
+            headers={**e.headers, "Location": f"/api/jobs/{job.id}"}
+        )
+
+@router.post("/analyze/batch", response_model=schemas.FoodAnalysisBatchResponse)
+async def analyze_food_batch(
+    request: schemas.FoodAnalysisBatchRequest,
+    user_id: int = Depends(rate_limited(ANALYZE)),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Analyze a food log entry and extract nutritional information"""
-    food_log = db.query(models.FoodLog).filter(
-        models.FoodLog.id == request.food_log_id,
-        models.FoodLog.user_id == 1
-    ).first()
-
-    if not food_log:
-        raise HTTPException(status_code=404, detail="Food log not found")
-
-    # Check if analysis already exists
-    existing_analysis = db.query(models.FoodAnalysis).filter(
-        models.FoodAnalysis.food_log_id == request.food_log_id
-    ).first()
-
-    if existing_analysis:
-        return existing_analysis
-
-    # Get AI analysis
-    analysis_data = await ai_service.analyze_food_nutrients(food_log.food_description)
-
-    # Save analysis to database
-    db_analysis = models.FoodAnalysis(
-        food_log_id=request.food_log_id,
-        calories=analysis_data.get("calories", 0),
-        protein=analysis_data.get("protein", 0),
-        carbs=analysis_data.get("carbs", 0),
-        fats=analysis_data.get("fats", 0),
-        fiber=analysis_data.get("fiber", 0),
-        summary=analysis_data.get("summary", "")
+    """
+    Analyze many food log entries, packing the descriptions into as few LLM
+    calls as possible. Each LLM call counts against the analyze rate limit.
+    """
+    query = select(
+        models.FoodLog.id,
+        models.FoodLog.user_id,
+        models.FoodLog.date,
+        models.FoodLog.food_description,
+        models.FoodAnalysis.id.label("analysis_id")
+    ).outerjoin(
+        models.FoodAnalysis, models.FoodAnalysis.food_log_id == models.FoodLog.id
+    ).where(models.FoodLog.user_id == user_id)
+    if request.food_log_ids is not None:
+        query = query.where(models.FoodLog.id.in_(request.food_log_ids))
+    else:
+        query = query.where(
+            models.FoodLog.date >= request.start_date,
+            models.FoodLog.date <= request.end_date
+        )
+    rows = (await db.execute(query.order_by(models.FoodLog.id))).all()
+
+    # Logs that already have analyses are skipped
+    pending = [row for row in rows if row.analysis_id is None]
+    existing_count = len(rows) - len(pending)
+    if not pending:
+        return {
+            "analyses": await _analyses_for_logs(db, [row.id for row in rows]),
+            "created": 0,
+            "existing": existing_count
+        }
+
+    descriptions = list(dict.fromkeys(food_log.food_description for food_log in pending))
+    results = {}
+    for description in descriptions:
+        estimate = nutrient_engine.estimate(description)
+        if estimate is not None:
+            results[description] = estimate
+    results.update(await analysis_cache.get_many(
+        db, [description for description in descriptions if description not in results]
+    ))
+    misses = [description for description in descriptions if description not in results]
+
+    if misses:
+        # End the read transaction, releasing the pooled connection while waiting on the LLM
+        await db.commit()
+
+        # Identical normalized descriptions only need to be analyzed once
+        by_normalized = {}
+        for description in misses:
+            by_normalized.setdefault(normalize_description(description), []).append(description)
+        # Descriptions already being analyzed by another request are awaited, not re-sent
+        joined = {
+            normalized: task
+            for normalized in by_normalized
+            if (task := llm_flights.in_flight((user_id, normalized))) is not None
+        }
+        unique = [group[0] for normalized, group in by_normalized.items() if normalized not in joined]
+
+        chunks = [
+            unique[i:i + ANALYSIS_BATCH_SIZE]
+            for i in range(0, len(unique), ANALYSIS_BATCH_SIZE)
+        ]
+        # Each LLM call counts as an analyze request; the first was taken by rate_limited
+        await rate_limiter.take(user_id, ANALYZE, len(chunks) - 1)
+        chunk_results = await asyncio.gather(
+            *(ai_service.analyze_food_nutrients_batch(chunk) for chunk in chunks)
+        )
+
+        analyzed = {}
+        for chunk, items in zip(chunks, chunk_results):
+            for description, item in zip(chunk, items):
+                try:
+                    analyzed[description] = schemas.AnalyzedNutrients.model_validate(item).model_dump()
+                except ValidationError:
+                    # The model dropped or mangled this item; analyze it on its own below
+                    pass
+        # All at once; the LLM concurrency limit in ai_service bounds the calls in flight
+        retried = [description for chunk in chunks for description in chunk if description not in analyzed]
+        retried_results = await asyncio.gather(
+            *(ai_service.analyze_food_nutrients(description) for description in retried)
+        )
+        analyzed.update(zip(retried, retried_results))
+
+        for description, analysis_data in analyzed.items():
+            await analysis_cache.put(db, description, analysis_data)
+            for same in by_normalized[normalize_description(description)]:
+                results[same] = analysis_data
+
+        for normalized, task in joined.items():
+            analysis_data = await asyncio.shield(task)
+            for same in by_normalized[normalized]:
+                results[same] = analysis_data
+
+    # Failed analyses (LLM down or circuit open) are deferred rather than stored as zeros
+    analyzed = [food_log for food_log in pending if not results[food_log.food_description].get("failed")]
+    deferred = len(pending) - len(analyzed)
+
+    # Bulk insert the new analyses and update the rollup in one transaction;
+    # logs analyzed concurrently by another request are left as they are
+    created = await nutrition.insert_analyses(
+        db, analyzed, [results[food_log.food_description] for food_log in analyzed]
     )
-    db.add(db_analysis)
-    db.commit()
-    db.refresh(db_analysis)
+    await db.commit()
+    if created:
+        await response_cache.invalidate(user_id)
 
-    return db_analysis
+    return {
+        "analyses": await _analyses_for_logs(db, [row.id for row in rows]),
+        "created": len(created),
+        "existing": len(rows) - len(created) - deferred,
+        "deferred": deferred
+    }
+
+async def _analyses_for_logs(db: AsyncSession, food_log_ids: List[int]):
+    result = await db.execute(
+        select(models.FoodAnalysis).where(
+            models.FoodAnalysis.food_log_id.in_(food_log_ids)
+        ).order_by(models.FoodAnalysis.food_log_id)
+    )
+    return result.scalars().all()
 
 @router.post("/summarize")
 async def summarize_daily_food(
     request: schemas.FoodSummaryRequest,
-    db: Session = Depends(get_db)
+    force: bool = False,
+    user_id: int = Depends(rate_limited(GENERATE)),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get AI summary of all food logged for a specific date"""
-    food_logs = db.query(models.FoodLog).filter(
-        models.FoodLog.date == request.date,
-        models.FoodLog.user_id == 1
-    ).all()
+    """
+    Get AI summary of all food logged for a specific date. The stored summary
+    is returned (cached=true) if no logs changed since it was generated, and
+    new logs are added to it rather than summarizing the whole day again,
+    unless force is set. While the LLM is unavailable this returns 503 with
+    Retry-After.
+    """
+    return await nutrition.summarize_day(db, user_id, request.date, force=force)
 
-    if not food_logs:
-        return {"summary": "No food logged for this date."}
-
-    # Get analyses for each log
-    logs_with_analysis = []
-    for log in food_logs:
-        analysis = db.query(models.FoodAnalysis).filter(
-            models.FoodAnalysis.food_log_id == log.id
-        ).first()
-
-        logs_with_analysis.append({
-            "meal_time": log.meal_time.value,
-            "time": log.time,
-            "food_description": log.food_description,
-            "calories": analysis.calories if analysis else None
-        })
+@router.post("/summarize/stream")
+async def stream_daily_summary(
+    request: schemas.FoodSummaryRequest,
+    force: bool = False,
+    user_id: int = Depends(rate_limited(GENERATE)),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Stream the daily summary as Server-Sent Events while it is generated.
+    A stored summary covering the current logs is sent as the done event right away.
+    If generation fails, an error event is sent instead of done.
+    """
+    logs, digests, stored = await nutrition.load_day_summary_inputs(db, user_id, request.date)
+    # Release the connection before the response starts streaming
+    await db.commit()
+    if force:
+        stored = None
+    summary = nutrition.stored_day_summary(stored, digests)
+    new_logs = nutrition.new_day_logs(stored, logs, digests)
 
-    summary = await ai_service.summarize_daily_food(logs_with_analysis)
+    async def events():
+        if not logs:
+            yield sse.format_event(
+                {"summary": "No food logged for this date."}, event="done"
+            )
+            return
+        if summary is not None:
+            yield sse.format_event({"summary": summary, "date": request.date, "cached": True}, event="done")
+            return
+        chunks = []
+        if new_logs is not None:
+            deltas = ai_service.stream_daily_summary(new_logs, stored.summary)
+        else:
+            deltas = ai_service.stream_daily_summary(logs)
+        try:
+            async for delta in deltas:
+                chunks.append(delta)
+                yield sse.delta_event(delta)
+        except Exception:
+            # Nothing is stored, the deltas sent so far are to be discarded
+            yield sse.format_event({"detail": nutrition.summary_unavailable().detail}, event="error")
+            return
+        generated = "".join(chunks).strip()
+        # Use a fresh session rather than relying on the request one outliving the response
+        async with SessionLocal() as session:
+            await nutrition.save_day_summary(
+                session, user_id, request.date, generated, digests, incremental=new_logs is not None
+            )
+        yield sse.format_event(
+            {"summary": generated, "date": request.date, "cached": False}, event="done"
+        )
 
-    return {"summary": summary, "date": request.date}
+    return sse.event_stream(events())
 
 @router.get("/nutrients/{date}")
 async def get_daily_nutrients(
-    date: str,
-    db: Session = Depends(get_db)
+    date: dt.date,
+    request: Request,
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get total nutrients for a specific date"""
-    food_logs = db.query(models.FoodLog).filter(
-        models.FoodLog.date == date,
-        models.FoodLog.user_id == 1
-    ).all()
-
-    total_calories = 0
-    total_protein = 0
-    total_carbs = 0
-    total_fats = 0
-    total_fiber = 0
-
-    for log in food_logs:
-        analysis = db.query(models.FoodAnalysis).filter(
-            models.FoodAnalysis.food_log_id == log.id
-        ).first()
-
-        if analysis:
-            total_calories += analysis.calories
-            total_protein += analysis.protein
-            total_carbs += analysis.carbs
-            total_fats += analysis.fats
-            total_fiber += analysis.fiber
+    async def load():
+        # Totals are maintained incrementally by services.nutrient_rollup
+        totals = await db.get(models.DailyNutrientTotal, (user_id, date))
+        if not totals:
+            totals = models.DailyNutrientTotal(calories=0, protein=0, carbs=0, fats=0, fiber=0)
+
+        return {
+            "date": date,
+            "calories": round(totals.calories, 2),
+            "protein": round(totals.protein, 2),
+            "carbs": round(totals.carbs, 2),
+            "fats": round(totals.fats, 2),
+            "fiber": round(totals.fiber, 2)
+        }
+
+    return await response_cache.cached(request, user_id, load)
 
+@router.get("/trends", response_model=schemas.TrendsResponse)
+async def get_nutrient_trends(
+    start_date: Optional[dt.date] = None,
+    end_date: Optional[dt.date] = None,
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Rolling 7/30-day averages, meal-time distribution, macro ratios and streaks (default: last 90 days)"""
+    result = await trends.nutrient_trends(db, user_id, start_date, end_date)
+    # Years of daily series are tens of thousands of values; serialize them once
+    # instead of validating and re-encoding through the response model
+    return Response(content=to_json(result), media_type="application/json")
+
+@router.get("/cache/stats")
+async def get_analysis_cache_stats(
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Hit/miss counters for the nutrient analysis cache, the local nutrient
+    engine, request coalescing, the response cache and stored daily summaries.
+    They are this worker's totals across all users, also exported on /metrics.
+    """
     return {
-        "date": date,
-        "calories": round(total_calories, 2),
-        "protein": round(total_protein, 2),
-        "carbs": round(total_carbs, 2),
-        "fats": round(total_fats, 2),
-        "fiber": round(total_fiber, 2)
+        **analysis_cache.snapshot(),
+        "nutrient_engine": nutrient_engine.stats,
+        "responses": response_cache.snapshot(),
+        "daily_summaries": nutrition.summary_stats,
+        "single_flight": {
+            "analyses": analysis_flights.snapshot(),
+            "llm": llm_flights.snapshot(),
+        },
     }
@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db
+import models
+import schemas
+from services import auth
+
+router = APIRouter()
+
+@router.post("/register", response_model=schemas.UserResponse, status_code=201)
+async def register(
+    user: schemas.UserCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """Create an account; sign in with POST /api/auth/token"""
+    db_user = models.User(email=user.email, hashed_password=await auth.hash_password(user.password))
+    db.add(db_user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="An account with this email already exists")
+    return db_user
+
+@router.post("/token", response_model=schemas.Token)
+async def login(
+    form: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_db)
+):
+    """Exchange an email (as username) and password for a bearer access token"""
+    result = await db.execute(
+        select(models.User.id, models.User.hashed_password).where(models.User.email == form.username.lower())
+    )
+    user = result.first()
+    # Release the connection during the (slow) password check
+    await db.commit()
+    if not await auth.verify_password(form.password, user.hashed_password if user else None):
+        raise HTTPException(
+            status_code=401,
+            detail="Incorrect email or password",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return {
+        "access_token": auth.create_access_token(user.id),
+        "expires_in": auth.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    }
+
+@router.get("/me", response_model=schemas.UserResponse)
+async def get_me(
+    user_id: int = Depends(auth.get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """The signed-in user's account"""
+    user = await db.get(models.User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
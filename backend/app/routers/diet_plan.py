@@ -1,120 +1,90 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict
-from database import get_db
+from database import SessionLocal, get_db, get_read_db
 import models
 import schemas
-from services import ai_service
+from services import ai_service, nutrition, sse
+from services.auth import get_current_user_id
+from services.rate_limit import GENERATE, rate_limited
+from services.response_cache import response_cache
 
 router = APIRouter()
 
+def _plan_response(plan: models.DietPlan, **flags) -> schemas.DietPlanResponse:
+    return schemas.DietPlanResponse.model_validate(plan).model_copy(update=flags)
+
 @router.post("/generate", response_model=schemas.DietPlanResponse)
 async def generate_diet_plan(
-    db: Session = Depends(get_db)
+    force: bool = False,
+    user_id: int = Depends(rate_limited(GENERATE)),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Generate a personalized diet plan based on 3-4 days of food logs"""
-    user_id = 1  # Default user_id for now
-
-    # Get food logs from the last 4 days
-    end_date = datetime.now().date()
-    start_date = end_date - timedelta(days=4)
-
-    food_logs = db.query(models.FoodLog).filter(
-        models.FoodLog.user_id == user_id,
-        models.FoodLog.date >= start_date.strftime("%Y-%m-%d"),
-        models.FoodLog.date <= end_date.strftime("%Y-%m-%d")
-    ).order_by(models.FoodLog.date).all()
-
-    if len(food_logs) < 3:
-        raise HTTPException(
-            status_code=400,
-            detail="Need at least 3 days of food logs to generate a diet plan"
-        )
-
-    # Group logs by date
-    logs_by_date = {}
-    for log in food_logs:
-        if log.date not in logs_by_date:
-            logs_by_date[log.date] = []
-
-        analysis = db.query(models.FoodAnalysis).filter(
-            models.FoodAnalysis.food_log_id == log.id
-        ).first()
-
-        logs_by_date[log.date].append({
-            "meal_time": log.meal_time.value,
-            "time": log.time,
-            "food_description": log.food_description,
-            "calories": analysis.calories if analysis else 0
-        })
-
-    # Calculate average daily totals
-    daily_totals = []
-    for date, logs in logs_by_date.items():
-        total_calories = sum(log.get("calories", 0) for log in logs)
-        daily_totals.append(total_calories)
-
-    # Get detailed nutrient totals for AI
-    nutrient_totals = {"avg_calories": sum(daily_totals) / len(daily_totals) if daily_totals else 0}
-
-    # Prepare history for AI
-    food_history = [
-        {"date": date, "logs": logs}
-        for date, logs in logs_by_date.items()
-    ]
-
-    # Get more detailed nutrient info
-    all_analyses = []
-    for log in food_logs:
-        analysis = db.query(models.FoodAnalysis).filter(
-            models.FoodAnalysis.food_log_id == log.id
-        ).first()
-        if analysis:
-            all_analyses.append(analysis)
-
-    if all_analyses:
-        nutrient_totals["avg_protein"] = sum(a.protein for a in all_analyses) / len(all_analyses)
-        nutrient_totals["avg_carbs"] = sum(a.carbs for a in all_analyses) / len(all_analyses)
-        nutrient_totals["avg_fats"] = sum(a.fats for a in all_analyses) / len(all_analyses)
-
-    # Generate recommendations using AI
-    recommendations = await ai_service.generate_diet_recommendations(
-        food_history, nutrient_totals
-    )
-
-    # Save or update diet plan
-    existing_plan = db.query(models.DietPlan).filter(
-        models.DietPlan.user_id == user_id
-    ).order_by(models.DietPlan.created_at.desc()).first()
-
-    if existing_plan:
-        existing_plan.recommendations = str(recommendations)
-        db.commit()
-        db.refresh(existing_plan)
-        return existing_plan
-    else:
-        db_plan = models.DietPlan(
-            user_id=user_id,
-            recommendations=str(recommendations)
-        )
-        db.add(db_plan)
-        db.commit()
-        db.refresh(db_plan)
-        return db_plan
+    """
+    Generate a personalized diet plan based on 3-4 days of food logs.
+    The stored plan is returned (cached=true) if none of the logs, analyses or
+    the prompt changed since it was generated, unless force is set.
+    """
+    return await nutrition.generate_diet_plan(db, user_id, force=force)
+
+@router.post("/generate/stream")
+async def stream_diet_plan(
+    force: bool = False,
+    user_id: int = Depends(rate_limited(GENERATE)),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Stream the diet plan as Server-Sent Events while it is generated; the
+    plan is saved once the model finishes and returned in the done event.
+    An up-to-date stored plan is sent as the done event right away.
+    """
+    # Raises 400 before any event is sent if there isn't enough history
+    plan, fingerprint = await nutrition.cached_diet_plan(db, user_id)
+    if plan and not force:
+        await db.commit()
+
+        async def cached_events():
+            yield sse.format_event(_plan_response(plan, cached=True), event="done")
+
+        return sse.event_stream(cached_events())
+
+    food_history, nutrient_totals = await nutrition.load_diet_plan_inputs(db, user_id)
+    await db.commit()
+
+    async def events():
+        stream = ai_service.DietRecommendationsStream(food_history, nutrient_totals)
+        async for delta in stream:
+            yield sse.delta_event(delta)
+        recommendations = stream.result()
+        if recommendations.get("failed"):
+            # The previous plan is kept; see nutrition.llm_unavailable
+            yield sse.format_event(
+                {"detail": "Diet plan generation is temporarily unavailable, try again later"}, event="error"
+            )
+            return
+        # Use a fresh session rather than relying on the request one outliving the response
+        async with SessionLocal() as session:
+            plan = await nutrition.save_diet_plan(session, user_id, recommendations, fingerprint)
+        yield sse.format_event(_plan_response(plan), event="done")
+
+    return sse.event_stream(events())
 
 @router.get("/", response_model=schemas.DietPlanResponse)
 async def get_diet_plan(
-    db: Session = Depends(get_db)
+    request: Request,
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get the latest diet plan for the user"""
-    user_id = 1  # Default user_id for now
+    """Get the latest diet plan for the user, flagged stale if its inputs have changed since"""
+    async def load():
+        diet_plan = await nutrition.latest_diet_plan(db, user_id)
 
-    diet_plan = db.query(models.DietPlan).filter(
-        models.DietPlan.user_id == user_id
-    ).order_by(models.DietPlan.created_at.desc()).first()
+        if not diet_plan:
+            raise HTTPException(status_code=404, detail="No diet plan found. Generate one first.")
 
-    if not diet_plan:
-        raise HTTPException(status_code=404, detail="No diet plan found. Generate one first.")
+        fingerprint, _ = await nutrition.diet_plan_fingerprint(db, user_id)
+        return _plan_response(diet_plan, stale=diet_plan.input_fingerprint != fingerprint)
 
-    return diet_plan
+    # stale depends on the window of days the plan is built from, which moves at midnight
+    window = "/".join(day.isoformat() for day in nutrition.diet_plan_window())
+    return await response_cache.cached(request, user_id, load, vary=window)
@@ -1,95 +1,298 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
-from sqlalchemy.orm import Session
-from typing import List
-from database import get_db
+import base64
+import datetime as dt
+import json
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic_core import to_json
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from database import get_db, get_read_db, session_router
 import models
 import schemas
+from services import food_log_io, job_queue, nutrient_rollup
+from services.auth import get_current_user_id
+from services.response_cache import response_cache
 
 router = APIRouter()
 
+# Queue an analysis job for every new food log so results are ready early
+AUTO_ANALYZE = os.getenv("AUTO_ANALYZE", "false").lower() == "true"
+
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+# Keyset order: newest date first, then meal time, with id as tie-breaker
+KEYSET_COLUMNS = (models.FoodLog.date, models.FoodLog.meal_time, models.FoodLog.id)
+KEYSET_ORDER = (models.FoodLog.date.desc(), models.FoodLog.meal_time, models.FoodLog.id)
+
+def _encode_cursor(key) -> str:
+    date, meal_time, food_log_id = key
+    raw = json.dumps([date.isoformat(), meal_time.value, food_log_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        date, meal_time, food_log_id = json.loads(raw)
+        return dt.date.fromisoformat(date), models.MealTime(meal_time), int(food_log_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _keyset_condition(key):
+    """Rows at or after key in KEYSET_ORDER (the cursor is the first row of a page)"""
+    date, meal_time, food_log_id = key
+    return or_(
+        models.FoodLog.date < date,
+        and_(
+            models.FoodLog.date == date,
+            or_(
+                models.FoodLog.meal_time > meal_time,
+                and_(models.FoodLog.meal_time == meal_time, models.FoodLog.id >= food_log_id)
+            )
+        )
+    )
+
+def _projection(fields: Optional[str]):
+    if not fields:
+        return [getattr(models.FoodLog, name) for name in schemas.FoodLogResponse.model_fields]
+
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in schemas.FoodLogResponse.model_fields]
+    if unknown or not names:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return [getattr(models.FoodLog, name) for name in dict.fromkeys(names)]
+
+def _row_dict(keys, row):
+    values = dict(zip(keys, row))
+    if "time" in values:
+        values["time"] = schemas.format_time(values["time"])
+    return values
+
+async def _stream_rows(query, keys, user_id: int):
+    """Serialize rows into a JSON array as they arrive from a server-side cursor"""
+    # A dedicated session: the request's session is closed once the response starts
+    async with session_router.read_session(user_id) as db:
+        result = await db.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        yield b"["
+        first = True
+        async for rows in result.partitions():
+            chunk = b",".join(to_json(_row_dict(keys, row)) for row in rows)
+            yield chunk if first else b"," + chunk
+            first = False
+        yield b"]"
+
+async def get_user_food_log(db: AsyncSession, user_id: int, food_log_id: int):
+    result = await db.execute(
+        select(models.FoodLog).where(
+            models.FoodLog.user_id == user_id,
+            models.FoodLog.id == food_log_id
+        )
+    )
+    return result.scalars().first()
+
+async def get_analysis(db: AsyncSession, food_log_id: int):
+    result = await db.execute(
+        select(models.FoodAnalysis).where(models.FoodAnalysis.food_log_id == food_log_id)
+    )
+    return result.scalars().first()
+
 @router.post("/", response_model=schemas.FoodLogResponse)
 async def create_food_log(
     food_log: schemas.FoodLogCreate,
-    db: Session = Depends(get_db)
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a new food log entry"""
     db_food_log = models.FoodLog(
-        user_id=1,  # Default user_id for now
+        user_id=user_id,
         date=food_log.date,
         meal_time=food_log.meal_time,
         time=food_log.time,
         food_description=food_log.food_description
     )
     db.add(db_food_log)
-    db.commit()
-    db.refresh(db_food_log)
+    await db.flush()
+    await nutrient_rollup.log_added(db, db_food_log)
+    if AUTO_ANALYZE:
+        job_queue.enqueue(db, db_food_log.user_id, models.JobKind.ANALYZE, food_log_id=db_food_log.id)
+    await db.commit()
+    await response_cache.invalidate(user_id)
+    await db.refresh(db_food_log)
     return db_food_log
 
 @router.get("/", response_model=List[schemas.FoodLogResponse])
 async def get_food_logs(
-    date: str = None,
-    db: Session = Depends(get_db)
+    request: Request,
+    date: Optional[dt.date] = None,
+    start_date: Optional[dt.date] = None,
+    end_date: Optional[dt.date] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get food logs, optionally filtered by date"""
-    query = db.query(models.FoodLog).filter(models.FoodLog.user_id == 1)
+    """
+    Get food logs, newest first, optionally filtered by date or date range.
+    With limit set, the X-Next-Cursor response header holds the cursor for
+    the next page. fields=id,date,... returns only the listed columns.
+    Responses carry an ETag; If-None-Match gets a 304 while nothing changed.
+    """
+    return await response_cache.cached(request, user_id, lambda: _list_food_logs(
+        db, user_id, date, start_date, end_date, limit, cursor, fields
+    ))
+
+async def _list_food_logs(db, user_id, date, start_date, end_date, limit, cursor, fields):
+    columns = _projection(fields)
+    conditions = [models.FoodLog.user_id == user_id]
     if date:
-        query = query.filter(models.FoodLog.date == date)
-    return query.order_by(models.FoodLog.date.desc(), models.FoodLog.meal_time).all()
+        conditions.append(models.FoodLog.date == date)
+    if start_date:
+        conditions.append(models.FoodLog.date >= start_date)
+    if end_date:
+        conditions.append(models.FoodLog.date <= end_date)
+    if cursor:
+        conditions.append(_keyset_condition(_decode_cursor(cursor)))
+
+    headers = {}
+    if limit is not None:
+        # The first key past this page, read from the index, is the next cursor
+        result = await db.execute(
+            select(*KEYSET_COLUMNS).where(*conditions).order_by(*KEYSET_ORDER)
+            .offset(limit).limit(1)
+        )
+        next_key = result.first()
+        if next_key is not None:
+            headers["X-Next-Cursor"] = _encode_cursor(next_key)
+
+    query = select(*columns).where(*conditions).order_by(*KEYSET_ORDER)
+    if limit is not None:
+        query = query.limit(limit)
+
+    return StreamingResponse(
+        _stream_rows(query, [column.key for column in columns], user_id),
+        media_type="application/json",
+        headers=headers
+    )
+
+@router.post(
+    "/import",
+    response_model=schemas.FoodLogImportResponse,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        media_type: {"schema": {"type": "string"}} for media_type in food_log_io.MEDIA_TYPES.values()
+    }}}
+)
+async def import_food_logs(
+    request: Request,
+    format: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Import food logs from a CSV (header with date, meal_time, food_description
+    and optionally time) or NDJSON body, parsed as it is uploaded. Invalid rows
+    are skipped and reported; valid ones are committed in batches as they arrive.
+    """
+    upload = food_log_io.upload_format(request.headers.get("content-type"), format)
+    parse = food_log_io.csv_records if upload == food_log_io.CSV else food_log_io.ndjson_records
+    return await food_log_io.import_food_logs(db, user_id, parse(request.stream()))
+
+@router.get("/export")
+async def export_food_logs(
+    format: str = Query(food_log_io.CSV, pattern="^(csv|ndjson)$"),
+    start_date: Optional[dt.date] = None,
+    end_date: Optional[dt.date] = None,
+    user_id: int = Depends(get_current_user_id)
+):
+    """Stream all food logs, oldest first, with their analyzed nutrients as CSV or NDJSON"""
+    conditions = [models.FoodLog.user_id == user_id]
+    if start_date:
+        conditions.append(models.FoodLog.date >= start_date)
+    if end_date:
+        conditions.append(models.FoodLog.date <= end_date)
+
+    query = select(
+        models.FoodLog.id,
+        models.FoodLog.date,
+        models.FoodLog.meal_time,
+        models.FoodLog.time,
+        models.FoodLog.food_description,
+        *(getattr(models.FoodAnalysis, field) for field in nutrient_rollup.NUTRIENT_FIELDS)
+    ).outerjoin(
+        models.FoodAnalysis, models.FoodAnalysis.food_log_id == models.FoodLog.id
+    ).where(*conditions).order_by(models.FoodLog.date, models.FoodLog.id)
+
+    return StreamingResponse(
+        food_log_io.export_rows(query, format, user_id),
+        media_type=food_log_io.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="food-logs.{format}"'}
+    )
 
 @router.get("/{food_log_id}", response_model=schemas.FoodLogResponse)
 async def get_food_log(
     food_log_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get a specific food log by ID"""
-    food_log = db.query(models.FoodLog).filter(
-        models.FoodLog.id == food_log_id,
-        models.FoodLog.user_id == 1
-    ).first()
-    if not food_log:
-        raise HTTPException(status_code=404, detail="Food log not found")
-    return food_log
+    async def load():
+        food_log = await get_user_food_log(db, user_id, food_log_id)
+        if not food_log:
+            raise HTTPException(status_code=404, detail="Food log not found")
+        return schemas.FoodLogResponse.model_validate(food_log)
+
+    return await response_cache.cached(request, user_id, load)
 
 @router.put("/{food_log_id}", response_model=schemas.FoodLogResponse)
 async def update_food_log(
     food_log_id: int,
     food_log: schemas.FoodLogCreate,
-    db: Session = Depends(get_db)
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
 ):
     """Update a food log entry"""
-    db_food_log = db.query(models.FoodLog).filter(
-        models.FoodLog.id == food_log_id,
-        models.FoodLog.user_id == 1
-    ).first()
+    db_food_log = await get_user_food_log(db, user_id, food_log_id)
     if not db_food_log:
         raise HTTPException(status_code=404, detail="Food log not found")
 
+    old_date = db_food_log.date
     db_food_log.date = food_log.date
     db_food_log.meal_time = food_log.meal_time
     db_food_log.time = food_log.time
     db_food_log.food_description = food_log.food_description
-    db.commit()
-    db.refresh(db_food_log)
+
+    if old_date != db_food_log.date:
+        analysis = await get_analysis(db, food_log_id)
+        await nutrient_rollup.log_moved(db, db_food_log, old_date, analysis)
+    await db.commit()
+    await response_cache.invalidate(user_id)
+    await db.refresh(db_food_log)
     return db_food_log
 
 @router.delete("/{food_log_id}", status_code=204)
 async def delete_food_log(
     food_log_id: int,
-    db: Session = Depends(get_db)
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete a food log entry"""
-    db_food_log = db.query(models.FoodLog).filter(
-        models.FoodLog.id == food_log_id,
-        models.FoodLog.user_id == 1
-    ).first()
+    db_food_log = await get_user_food_log(db, user_id, food_log_id)
     if not db_food_log:
         raise HTTPException(status_code=404, detail="Food log not found")
 
+    analysis = await get_analysis(db, food_log_id)
+    await nutrient_rollup.log_removed(db, db_food_log, analysis)
+
     # Delete related analysis first for quicker cleanup
-    db.query(models.FoodAnalysis).filter(
-        models.FoodAnalysis.food_log_id == food_log_id
-    ).delete(synchronize_session=False)
+    await db.execute(
+        delete(models.FoodAnalysis).where(models.FoodAnalysis.food_log_id == food_log_id)
+    )
 
-    db.delete(db_food_log)
-    db.commit()
+    await db.delete(db_food_log)
+    await db.commit()
+    await response_cache.invalidate(user_id)
     return Response(status_code=204)
@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db
+import models
+import schemas
+from services import job_queue
+from services.rate_limit import ANALYZE, GENERATE, rate_limiter
+from services.auth import get_current_user_id
+
+router = APIRouter()
+
+@router.post("/", response_model=schemas.JobResponse, status_code=202)
+async def create_job(
+    request: schemas.JobCreate,
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """Queue an analysis, daily summary or diet plan job; poll GET /api/jobs/{id} for the result"""
+    # Queued work counts against the same limits as the endpoints doing it directly
+    await rate_limiter.enforce(user_id, ANALYZE if request.kind == models.JobKind.ANALYZE else GENERATE)
+    payload = {}
+    if request.food_log_id is not None:
+        payload["food_log_id"] = request.food_log_id
+    if request.date:
+        payload["date"] = request.date.isoformat()
+
+    job = job_queue.enqueue(db, user_id, request.kind, **payload)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+@router.get("/stats")
+async def get_job_stats(
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """Number of the user's queued, running, finished and failed jobs"""
+    return await job_queue.job_stats(db, user_id)
+
+@router.get("/{job_id}", response_model=schemas.JobResponse)
+async def get_job(
+    job_id: int,
+    user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the status and, once finished, the result of a job"""
+    result = await db.execute(
+        select(models.Job).where(
+            models.Job.user_id == user_id,
+            models.Job.id == job_id
+        )
+    )
+    job = result.scalars().first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -1,27 +1,68 @@
-from pydantic import BaseModel
-from typing import Optional, List
+import datetime as dt
+from pydantic import BaseModel, Field, field_serializer, field_validator, model_validator
+from typing import Any, Dict, Optional, List
 from datetime import datetime
-from models import MealTime
+from models import JobKind, JobStatus, MealTime
+
+def format_time(value: Optional[dt.time]) -> Optional[str]:
+    """Meal times are exchanged as HH:MM"""
+    return value.strftime("%H:%M") if value is not None else None
+
+class UserCreate(BaseModel):
+    email: str = Field(max_length=255, pattern=r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+    password: str = Field(min_length=8, max_length=72)  # bcrypt ignores bytes past 72
+
+    @field_validator("email")
+    @classmethod
+    def normalize_email(cls, value: str) -> str:
+        return value.lower()
+
+class UserResponse(BaseModel):
+    id: int
+    email: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class Token(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int  # seconds
 
 class FoodLogCreate(BaseModel):
-    date: str
+    date: dt.date
     meal_time: MealTime
     food_description: str
-    time: str | None = None
+    time: dt.time | None = None
 
 class FoodLogResponse(BaseModel):
     id: int
     user_id: int
-    date: str
+    date: dt.date
     meal_time: MealTime
-    time: str | None = None
+    time: dt.time | None = None
     food_description: str
     created_at: datetime
     updated_at: Optional[datetime] = None
 
+    @field_serializer("time")
+    def serialize_time(self, value: Optional[dt.time]):
+        return format_time(value)
+
     class Config:
         from_attributes = True
 
+class FoodLogImportError(BaseModel):
+    line: int
+    error: str
+
+class FoodLogImportResponse(BaseModel):
+    imported: int
+    skipped: int
+    # The first invalid rows (not all of them if there are many)
+    errors: List[FoodLogImportError]
+
 class NutrientBreakdown(BaseModel):
     calories: float
     protein: float
@@ -38,6 +79,7 @@ class FoodAnalysisResponse(BaseModel):
     fats: float
     fiber: float
     summary: str
+    engine: str
     created_at: datetime
 
     class Config:
@@ -46,8 +88,71 @@ class FoodAnalysisResponse(BaseModel):
 class FoodAnalysisRequest(BaseModel):
     food_log_id: int
 
+class FoodAnalysisBatchRequest(BaseModel):
+    food_log_ids: Optional[List[int]] = None
+    start_date: Optional[dt.date] = None
+    end_date: Optional[dt.date] = None
+
+    @model_validator(mode="after")
+    def check_selection(self):
+        if self.food_log_ids is None and not (self.start_date and self.end_date):
+            raise ValueError("Provide food_log_ids or both start_date and end_date")
+        return self
+
+class AnalyzedNutrients(NutrientBreakdown):
+    summary: str = ""
+
+class FoodAnalysisBatchResponse(BaseModel):
+    analyses: List[FoodAnalysisResponse]
+    created: int
+    existing: int
+    deferred: int = 0  # not analyzed because the LLM was unavailable; retry later
+
 class FoodSummaryRequest(BaseModel):
-    date: str
+    date: dt.date
+
+class NutrientSeries(BaseModel):
+    """One value per day of the range; null where no food was logged in the window"""
+    calories: List[Optional[float]]
+    protein: List[Optional[float]]
+    carbs: List[Optional[float]]
+    fats: List[Optional[float]]
+    fiber: List[Optional[float]]
+
+class MacroRatios(BaseModel):
+    protein: float
+    carbs: float
+    fats: float
+
+class MealTimeShare(BaseModel):
+    meal_time: MealTime
+    logs: int
+    calories: float
+    log_share: float
+    calorie_share: float
+    avg_calories_per_log: float
+
+class Streaks(BaseModel):
+    current: int
+    longest: int
+    longest_start: Optional[dt.date] = None
+    longest_end: Optional[dt.date] = None
+
+class TrendsResponse(BaseModel):
+    start_date: dt.date
+    end_date: dt.date
+    days: int
+    days_logged: int
+    # Days with analyzed logs, which the averages, daily series and macro ratios cover
+    days_analyzed: int
+    averages: NutrientBreakdown
+    dates: List[dt.date]
+    daily: NutrientSeries
+    rolling_7d: NutrientSeries
+    rolling_30d: NutrientSeries
+    macro_ratios: MacroRatios
+    meal_times: List[MealTimeShare]
+    streaks: Streaks
 
 class FoodReplacement(BaseModel):
     current_food: str
@@ -59,9 +164,42 @@ class FoodReplacement(BaseModel):
 class DietPlanResponse(BaseModel):
     id: int
     user_id: int
-    recommendations: str
+    recommendations: Dict[str, Any]
     created_at: datetime
     updated_at: Optional[datetime] = None
+    # Food logs or analyses in the plan's window changed since it was generated
+    stale: bool = False
+    # Returned as stored instead of generated, since its inputs were unchanged
+    cached: bool = False
+
+    class Config:
+        from_attributes = True
+
+class JobCreate(BaseModel):
+    kind: JobKind
+    food_log_id: Optional[int] = None
+    date: Optional[dt.date] = None
+
+    @model_validator(mode="after")
+    def check_payload(self):
+        if self.kind == JobKind.ANALYZE and self.food_log_id is None:
+            raise ValueError("food_log_id is required for analyze jobs")
+        if self.kind == JobKind.SUMMARIZE and not self.date:
+            raise ValueError("date is required for summarize jobs")
+        return self
+
+class JobResponse(BaseModel):
+    id: int
+    kind: JobKind
+    status: JobStatus
+    payload: dict
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    attempts: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    run_after: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -1,23 +1,153 @@
+import asyncio
+import hashlib
 import json
 import os
-from typing import Dict, List
+import random
+from functools import lru_cache
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Type
 
-from dotenv import load_dotenv
-from openai import OpenAI
+from services import diet_prompt, metrics
+from services.rate_limit import rate_limiter
+from services.circuit_breaker import CircuitBreaker
 
-load_dotenv()
+# Tuning knobs for the LLM path, all overridable from the environment
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
 
-# Client automatically looks for os.environ['OPENAI_API_KEY']
-# client = OpenAI()
+# The openai package takes about as long to import as the rest of the app,
+# so it is imported together with the client on the first LLM call
+_client = None
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Bounds the number of LLM calls in flight per worker
+_llm_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
 
+# Fails LLM calls fast while the provider is down or slow (see services.circuit_breaker)
+llm_breaker = CircuitBreaker("LLM")
 
-async def analyze_food_nutrients(food_description: str) -> Dict:
+
+def get_client():
+    """The AsyncOpenAI client, created on first use"""
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+
+        # Client automatically looks for os.environ['OPENAI_API_KEY']
+        # Retries are handled by _chat_completion so the client itself never retries.
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            timeout=OPENAI_TIMEOUT,
+            max_retries=0,
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
+
+
+@lru_cache(maxsize=None)
+def _retryable_errors() -> Tuple[Type[BaseException], ...]:
+    import openai
+
+    return (
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+        asyncio.TimeoutError,
+    )
+
+
+async def _chat_completion(operation: str, **kwargs):
     """
-    Use AI to analyze food and extract nutritional information
+    Run a chat completion without blocking the event loop, bounded by the
+    concurrency limit and retried with exponential backoff on transient errors.
+    operation names the calling ai_service function in the LLM metrics.
+    Raises CircuitOpenError without calling out while the breaker is open.
+    """
+    attempt = 0
+    with metrics.LLMCall(operation) as call:
+        while True:
+            try:
+                # Checked before queueing for a slot too, so rejections don't wait
+                llm_breaker.check()
+                async with _llm_semaphore:
+                    with llm_breaker.call(_retryable_errors()):
+                        response = await asyncio.wait_for(
+                            get_client().chat.completions.create(**kwargs), OPENAI_TIMEOUT
+                        )
+                call.record_usage(response.usage)
+                await rate_limiter.charge(response.usage)
+                return response
+            except _retryable_errors():
+                if attempt >= OPENAI_MAX_RETRIES:
+                    raise
+                call.retry()
+                # Full jitter so retries from many requests don't line up
+                delay = OPENAI_BACKOFF_BASE * (2**attempt)
+                await asyncio.sleep(random.uniform(0, delay))
+                attempt += 1
+
+
+async def _chat_completion_stream(operation: str, **kwargs) -> AsyncIterator[str]:
     """
-    prompt = f"""Analyze the following food description and provide nutritional information in JSON format.
+    Streaming variant of _chat_completion yielding content deltas. The
+    concurrency slot is held until the stream ends; only opening the stream
+    is retried, since tokens already sent to the client can't be taken back.
+    """
+    attempt = 0
+    with metrics.LLMCall(operation) as call:
+        llm_breaker.check()
+        async with _llm_semaphore:
+            while True:
+                try:
+                    # Only the time to open the stream counts as the call's latency
+                    with llm_breaker.call(_retryable_errors()):
+                        stream = await asyncio.wait_for(
+                            get_client().chat.completions.create(
+                                stream=True, stream_options={"include_usage": True}, **kwargs
+                            ),
+                            OPENAI_TIMEOUT,
+                        )
+                    break
+                except _retryable_errors():
+                    if attempt >= OPENAI_MAX_RETRIES:
+                        raise
+                    call.retry()
+                    delay = OPENAI_BACKOFF_BASE * (2**attempt)
+                    await asyncio.sleep(random.uniform(0, delay))
+                    attempt += 1
+
+            async for chunk in stream:
+                # With include_usage the last chunk carries the token counts and no choices
+                call.record_usage(chunk.usage)
+                if chunk.usage is not None:
+                    await rate_limiter.charge(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+
+def _parse_json_content(content: str):
+    content = content.strip()
+    # Remove markdown code blocks if present
+    if content.startswith("```json"):
+        content = content[7:]
+    if content.startswith("```"):
+        content = content[3:]
+    if content.endswith("```"):
+        content = content[:-3]
+    return json.loads(content.strip())
+
+
+ANALYSIS_MODEL = "gpt-4o-mini"
+ANALYSIS_SYSTEM_PROMPT = "You are a nutrition expert. Always respond with valid JSON only."
+ANALYSIS_PROMPT = """Analyze the following food description and provide nutritional information in JSON format.
 
 Food: {food_description}
 
@@ -33,13 +163,31 @@ Return a JSON object with the following structure:
 
 Be as accurate as possible. If the food description is vague, make reasonable estimates based on typical serving sizes."""
 
+# Changes whenever the analysis prompt or model changes, so cached analyses
+# produced by an older prompt/model are not served
+ANALYSIS_VERSION = hashlib.sha256(
+    f"{ANALYSIS_MODEL}\n{ANALYSIS_SYSTEM_PROMPT}\n{ANALYSIS_PROMPT}".encode()
+).hexdigest()[:16]
+
+
+# Summary of the fallback returned when an analysis fails (see services.reanalysis)
+ANALYSIS_FAILED_PREFIX = "Unable to analyze:"
+
+
+async def analyze_food_nutrients(food_description: str) -> Dict:
+    """
+    Use AI to analyze food and extract nutritional information
+    """
+    prompt = ANALYSIS_PROMPT.format(food_description=food_description)
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        response = await _chat_completion(
+            "analyze_food_nutrients",
+            model=ANALYSIS_MODEL,
             messages=[
                 {
                     "role": "system",
-                    "content": "You are a nutrition expert. Always respond with valid JSON only.",
+                    "content": ANALYSIS_SYSTEM_PROMPT,
                 },
                 {"role": "user", "content": prompt},
             ],
@@ -47,17 +195,7 @@ Be as accurate as possible. If the food description is vague, make reasonable es
             response_format={"type": "json_object"},
         )
 
-        content = response.choices[0].message.content.strip()
-        # Remove markdown code blocks if present
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.startswith("```"):
-            content = content[3:]
-        if content.endswith("```"):
-            content = content[:-3]
-        content = content.strip()
-
-        return json.loads(content)
+        return _parse_json_content(response.choices[0].message.content)
     except Exception as e:
         # Fallback values if AI fails
         return {
@@ -66,122 +204,237 @@ Be as accurate as possible. If the food description is vague, make reasonable es
             "carbs": 0,
             "fats": 0,
             "fiber": 0,
-            "summary": f"Unable to analyze: {str(e)}",
+            "summary": f"{ANALYSIS_FAILED_PREFIX} {str(e)}",
+            "failed": True,
         }
 
 
-async def summarize_daily_food(food_logs: List[Dict]) -> str:
+ANALYSIS_BATCH_PROMPT = """Analyze each of the following numbered food descriptions and provide nutritional information in JSON format.
+
+Foods:
+{food_list}
+
+Return a JSON object with one entry per food, using the same index numbers:
+{{
+    "items": [
+        {{
+            "index": <number>,
+            "calories": <number>,
+            "protein": <number in grams>,
+            "carbs": <number in grams>,
+            "fats": <number in grams>,
+            "fiber": <number in grams>,
+            "summary": "<brief summary of the food and its nutritional value>"
+        }}
+    ]
+}}
+
+Be as accurate as possible. If a food description is vague, make reasonable estimates based on typical serving sizes."""
+
+
+async def analyze_food_nutrients_batch(food_descriptions: List[str]) -> List[Dict]:
     """
-    Summarize all food logs for a day
+    Analyze several food descriptions in a single LLM call.
+    Returns the raw per-item dicts keyed by position; items the model
+    omitted or mangled are None so the caller can fall back per item.
     """
-    if not food_logs:
-        return "No food logged for this day."
-
     food_list = "\n".join(
-        [f"- {log['meal_time']}: {log['food_description']}" for log in food_logs]
+        f"{index}. {description}" for index, description in enumerate(food_descriptions)
     )
 
-    prompt = f"""Summarize the following food intake for the day and provide insights:
+    try:
+        response = await _chat_completion(
+            "analyze_food_nutrients_batch",
+            model=ANALYSIS_MODEL,
+            messages=[
+                {
+                    "role": "system",
+                    "content": ANALYSIS_SYSTEM_PROMPT,
+                },
+                {"role": "user", "content": ANALYSIS_BATCH_PROMPT.format(food_list=food_list)},
+            ],
+            temperature=0.3,
+            response_format={"type": "json_object"},
+        )
+        items = _parse_json_content(response.choices[0].message.content).get("items", [])
+    except Exception:
+        return [None] * len(food_descriptions)
 
-{food_list}
+    results = [None] * len(food_descriptions)
+    for item in items:
+        index = item.get("index") if isinstance(item, dict) else None
+        if isinstance(index, int) and 0 <= index < len(results):
+            results[index] = item
+    return results
 
-Provide a concise summary (2-3 sentences) of the day's eating pattern, highlighting:
-- Overall nutritional balance
+
+SUMMARY_MODEL = "gpt-4o-mini"
+SUMMARY_SYSTEM_PROMPT = "You are a nutrition expert providing daily food summaries."
+SUMMARY_GUIDELINES = """- Overall nutritional balance
 - Meal timing and distribution
 - Any notable patterns or concerns ( don't go with negative values, when highlighting the concerns )
 - The daily target for protein intake is around 80 to 100 grams. Just mention a small feedback, after the evening food is logged"""
+SUMMARY_PROMPT = """Summarize the following food intake for the day and provide insights:
+
+{food_list}
+
+Provide a concise summary (2-3 sentences) of the day's eating pattern, highlighting:
+{guidelines}"""
+SUMMARY_UPDATE_PROMPT = """Here is a summary of the food eaten so far today:
+
+{previous_summary}
+
+These meals have been logged since:
+
+{food_list}
+
+Update the summary to cover the whole day. Provide a concise summary (2-3 sentences) of the day's eating pattern, highlighting:
+{guidelines}"""
+
+# Part of every stored summary's fingerprint, so prompt or model changes make stored summaries stale
+SUMMARY_VERSION = hashlib.sha256(
+    f"{SUMMARY_MODEL}\n{SUMMARY_SYSTEM_PROMPT}\n{SUMMARY_PROMPT}\n{SUMMARY_UPDATE_PROMPT}\n{SUMMARY_GUIDELINES}".encode()
+).hexdigest()[:16]
+
+def _daily_summary_request(food_logs: List[Dict], previous_summary: Optional[str] = None) -> Dict:
+    food_list = "\n".join(
+        [f"- {log['meal_time']}: {log['food_description']}" for log in food_logs]
+    )
+
+    if previous_summary is None:
+        prompt = SUMMARY_PROMPT.format(food_list=food_list, guidelines=SUMMARY_GUIDELINES)
+    else:
+        prompt = SUMMARY_UPDATE_PROMPT.format(
+            previous_summary=previous_summary, food_list=food_list, guidelines=SUMMARY_GUIDELINES
+        )
+
+    return dict(
+        model=SUMMARY_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": SUMMARY_SYSTEM_PROMPT,
+            },
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.5,
+    )
+
+
+async def summarize_daily_food(food_logs: List[Dict], previous_summary: Optional[str] = None) -> Optional[str]:
+    """
+    Summarize all food logs for a day, or with previous_summary, update that
+    summary of the day so far with the food logs added since. Returns None
+    if the LLM call fails.
+    """
+    if not food_logs:
+        return previous_summary or "No food logged for this day."
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a nutrition expert providing daily food summaries.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.5,
+        response = await _chat_completion(
+            "summarize_daily_food", **_daily_summary_request(food_logs, previous_summary)
         )
 
         return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"Unable to generate summary: {str(e)}"
+    except Exception:
+        return None
 
 
-async def generate_diet_recommendations(
-    food_history: List[Dict], nutrient_totals: Dict
-) -> Dict:
+async def stream_daily_summary(food_logs: List[Dict], previous_summary: Optional[str] = None) -> AsyncIterator[str]:
     """
-    Analyze 3-4 days of food data and generate diet recommendations
+    Same as summarize_daily_food, yielding the summary text as it is generated.
+    LLM errors are raised, possibly after some of the text was yielded.
     """
-    history_text = ""
-    for day_data in food_history:
-        history_text += f"\nDate: {day_data['date']}\n"
-        for log in day_data["logs"]:
-            history_text += f"  {log['meal_time']}: {log['food_description']} (Calories: {log.get('calories', 'N/A')})\n"
+    if not food_logs:
+        yield previous_summary or "No food logged for this day."
+        return
 
-    prompt = f"""Analyze the following food intake history over the past few days and provide personalized diet recommendations:
+    async for delta in _chat_completion_stream(
+        "stream_daily_summary", **_daily_summary_request(food_logs, previous_summary)
+    ):
+        yield delta
 
-{history_text}
 
-Average daily totals:
-- Calories: {nutrient_totals.get("avg_calories", 0):.0f}
-- Protein: {nutrient_totals.get("avg_protein", 0):.1f}g
-- Carbs: {nutrient_totals.get("avg_carbs", 0):.1f}g
-- Fats: {nutrient_totals.get("avg_fats", 0):.1f}g
+DIET_PLAN_MODEL = "gpt-4o-mini"
+# Part of every diet plan's input fingerprint, so prompt, model or budget changes make stored plans stale
+DIET_PLAN_VERSION = hashlib.sha256(
+    f"{DIET_PLAN_MODEL}\n{diet_prompt.SYSTEM_PROMPT}\n{diet_prompt.DIET_PLAN_MAX_PROMPT_TOKENS}".encode()
+).hexdigest()[:16]
 
-Provide recommendations in JSON format:
-{{
-    "high_calorie_foods": [
-        {{
-            "food": "<food name>",
-            "calories": <number>,
-            "issue": "<why it's problematic>",
-            "replacement": "<suggested replacement>",
-            "replacement_calories": <number>,
-            "benefit": "<why replacement is better>"
-        }}
-    ],
-    "general_recommendations": [
-        "<recommendation 1>",
-        "<recommendation 2>"
-    ],
-    "meal_timing_suggestions": "<suggestions about meal timing>"
-}}
 
-Focus on identifying high-calorie, low-nutrition foods and suggesting healthier alternatives that the user might already be eating or can easily prepare."""
+def _diet_recommendations_request(food_history: List[Dict], nutrient_totals: Dict) -> Dict:
+    prompt, _ = diet_prompt.build_user_prompt(food_history, nutrient_totals, DIET_PLAN_MODEL)
+
+    return dict(
+        model=DIET_PLAN_MODEL,
+        messages=[
+            # Identical for every user, so provider-side prompt caching can reuse it
+            {"role": "system", "content": diet_prompt.SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.5,
+        response_format={"type": "json_object"},
+        # Routes all diet plan requests to the same provider-side prompt cache
+        extra_body={"prompt_cache_key": f"diet-plan-{DIET_PLAN_VERSION}"},
+    )
+
+
+def _fallback_recommendations(e: Exception) -> Dict:
+    return {
+        "high_calorie_foods": [],
+        "general_recommendations": [
+            f"Unable to generate recommendations: {str(e)}"
+        ],
+        "meal_timing_suggestions": "",
+        "failed": True,
+    }
+
 
+async def generate_diet_recommendations(
+    food_history: List[Dict], nutrient_totals: Dict
+) -> Dict:
+    """
+    Analyze 3-4 days of food data and generate diet recommendations
+    """
+    await diet_prompt.load_encoding(DIET_PLAN_MODEL)
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a nutrition expert providing personalized diet recommendations. Always respond with valid JSON only.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.5,
-            response_format={"type": "json_object"},
+        response = await _chat_completion(
+            "generate_diet_recommendations",
+            **_diet_recommendations_request(food_history, nutrient_totals)
         )
 
-        content = response.choices[0].message.content.strip()
-        # Remove markdown code blocks if present
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.startswith("```"):
-            content = content[3:]
-        if content.endswith("```"):
-            content = content[:-3]
-        content = content.strip()
-
-        return json.loads(content)
+        return _parse_json_content(response.choices[0].message.content)
     except Exception as e:
-        return {
-            "high_calorie_foods": [],
-            "general_recommendations": [
-                f"Unable to generate recommendations: {str(e)}"
-            ],
-            "meal_timing_suggestions": "",
-        }
+        return _fallback_recommendations(e)
+
+
+class DietRecommendationsStream:
+    """
+    Streams the raw JSON text of the diet recommendations while assembling it;
+    once iteration finishes, result() returns the parsed recommendations
+    """
+
+    def __init__(self, food_history: List[Dict], nutrient_totals: Dict):
+        self._food_history = food_history
+        self._nutrient_totals = nutrient_totals
+        self._chunks: List[str] = []
+        self._error: Exception = None
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        # Built here rather than in the constructor: measuring it needs the tokenizer loaded
+        await diet_prompt.load_encoding(DIET_PLAN_MODEL)
+        request = _diet_recommendations_request(self._food_history, self._nutrient_totals)
+        try:
+            async for delta in _chat_completion_stream("stream_diet_recommendations", **request):
+                self._chunks.append(delta)
+                yield delta
+        except Exception as e:
+            self._error = e
+
+    def result(self) -> Dict:
+        if self._error is not None:
+            return _fallback_recommendations(self._error)
+        try:
+            return _parse_json_content("".join(self._chunks))
+        except ValueError as e:
+            return _fallback_recommendations(e)
@@ -0,0 +1,166 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from database import dialect_insert
+from services.ai_service import ANALYSIS_VERSION
+from services.food_text import normalize_description
+
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "2048"))
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", str(30 * 24 * 3600)))  # seconds
+
+NUTRIENT_FIELDS = ("calories", "protein", "carbs", "fats", "fiber", "summary")
+
+
+def cache_key(normalized_description: str) -> str:
+    return hashlib.sha256(f"{ANALYSIS_VERSION}:{normalized_description}".encode()).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Two-tier cache of nutrient analyses: an in-process LRU in front of the
+    persistent nutrient_cache table. Keys include ANALYSIS_VERSION, so changing
+    the prompt or model invalidates every existing entry.
+    """
+
+    def __init__(self, maxsize: int = ANALYSIS_CACHE_SIZE, ttl: int = ANALYSIS_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+    def _get_memory(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return data
+
+    def _put_memory(self, key: str, data: Dict, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get(self, db: AsyncSession, food_description: str) -> Optional[Dict]:
+        """Return a cached analysis for the description, or None on a miss"""
+        key = cache_key(normalize_description(food_description))
+
+        data = self._get_memory(key)
+        if data is not None:
+            self.stats["memory_hits"] += 1
+            return data
+
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        result = await db.execute(
+            select(models.NutrientCacheEntry).where(
+                models.NutrientCacheEntry.cache_key == key,
+                models.NutrientCacheEntry.created_at >= cutoff
+            )
+        )
+        entry = result.scalars().first()
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["db_hits"] += 1
+        return self._remember(entry)
+
+    def _remember(self, entry: models.NutrientCacheEntry) -> Dict:
+        """Promote a persistent entry into the LRU for the rest of its TTL"""
+        data = {field: getattr(entry, field) for field in NUTRIENT_FIELDS}
+        created_at = entry.created_at
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        remaining = self.ttl - (datetime.now(timezone.utc) - created_at).total_seconds()
+        self._put_memory(entry.cache_key, data, max(remaining, 0))
+        return data
+
+    async def get_many(self, db: AsyncSession, food_descriptions: List[str]) -> Dict[str, Dict]:
+        """Batch lookup; returns the hits keyed by original description"""
+        keys = {description: cache_key(normalize_description(description)) for description in food_descriptions}
+        found = {}
+        pending = {}
+        for description, key in keys.items():
+            data = self._get_memory(key)
+            if data is not None:
+                self.stats["memory_hits"] += 1
+                found[description] = data
+            else:
+                pending.setdefault(key, []).append(description)
+
+        if pending:
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+            result = await db.execute(
+                select(models.NutrientCacheEntry).where(
+                    models.NutrientCacheEntry.cache_key.in_(list(pending)),
+                    models.NutrientCacheEntry.created_at >= cutoff
+                )
+            )
+            entries = result.scalars().all()
+            for entry in entries:
+                data = self._remember(entry)
+                for description in pending.pop(entry.cache_key):
+                    self.stats["db_hits"] += 1
+                    found[description] = data
+            self.stats["misses"] += sum(len(descriptions) for descriptions in pending.values())
+
+        return found
+
+    async def put(self, db: AsyncSession, food_description: str, data: Dict):
+        """Store a successful analysis in both tiers; failed analyses are never cached"""
+        if data.get("failed"):
+            return
+
+        normalized = normalize_description(food_description)
+        key = cache_key(normalized)
+        values = {field: data.get(field, 0) for field in NUTRIENT_FIELDS}
+        values["summary"] = data.get("summary", "")
+
+        stmt = dialect_insert(db, models.NutrientCacheEntry).values(
+            cache_key=key,
+            version=ANALYSIS_VERSION,
+            normalized_description=normalized,
+            **values,
+        )
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=["cache_key"],
+            set_={**values, "created_at": datetime.now(timezone.utc)},
+        ))
+        self._put_memory(key, values, self.ttl)
+
+    async def purge_stale(self, db: AsyncSession) -> int:
+        """Delete persistent entries from older prompt/model versions or past their TTL"""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        result = await db.execute(
+            delete(models.NutrientCacheEntry).where(
+                (models.NutrientCacheEntry.version != ANALYSIS_VERSION)
+                | (models.NutrientCacheEntry.created_at < cutoff)
+            )
+        )
+        await db.commit()
+        return result.rowcount
+
+    def snapshot(self) -> Dict:
+        lookups = sum(self.stats.values())
+        hits = self.stats["memory_hits"] + self.stats["db_hits"]
+        return {
+            **self.stats,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._entries),
+            "version": ANALYSIS_VERSION,
+        }
+
+
+analysis_cache = AnalysisCache()
@@ -0,0 +1,132 @@
+"""
+Per-request user identity: bcrypt password hashes (passlib) and signed
+HS256 access tokens (python-jose).
+
+A token carries the user id, so identifying a request needs no database
+lookup. Verified tokens are also remembered in an in-process LRU until they
+expire, so repeat requests skip the HMAC and JSON decoding as well; the
+cache is keyed by the whole token string, so a forged token can't hit it.
+Tokens are stateless: they stay valid until they expire.
+"""
+import logging
+import os
+import secrets
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+from passlib.context import CryptContext
+
+# Without auth, requests with no token act as this user (the pre-accounts default)
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "true").lower() == "true"
+DEFAULT_USER_ID = 1
+
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", str(7 * 24 * 60)))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "100000"))
+JWT_ALGORITHM = "HS256"
+
+SECRET_KEY = os.getenv("SECRET_KEY")
+if not SECRET_KEY:
+    if AUTH_REQUIRED:
+        raise RuntimeError("SECRET_KEY is required (or set AUTH_REQUIRED=false for local development).")
+    # Tokens signed with this die with the process and aren't shared between workers
+    SECRET_KEY = secrets.token_urlsafe(32)
+
+# passlib 1.7.4 logs a harmless traceback when it reads the bcrypt version
+logging.getLogger("passlib").setLevel(logging.ERROR)
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token", auto_error=False)
+
+
+async def hash_password(password: str) -> str:
+    # bcrypt takes ~0.1-1 s of CPU; keep it off the event loop
+    return await run_in_threadpool(pwd_context.hash, password)
+
+
+async def verify_password(password: str, hashed_password: Optional[str]) -> bool:
+    if hashed_password is None or not pwd_context.identify(hashed_password):
+        # Spend the same time as a real check so unknown emails (and accounts
+        # that can't sign in, see services.legacy_owner) can't be told apart
+        await run_in_threadpool(pwd_context.dummy_verify)
+        return False
+    return await run_in_threadpool(pwd_context.verify, password, hashed_password)
+
+
+def create_access_token(user_id: int, expires_in: int = ACCESS_TOKEN_EXPIRE_MINUTES * 60) -> str:
+    now = int(time.time())
+    return jwt.encode(
+        {"sub": str(user_id), "iat": now, "exp": now + expires_in},
+        SECRET_KEY,
+        algorithm=JWT_ALGORITHM,
+    )
+
+
+class TokenCache:
+    """LRU of verified tokens: token -> (user_id, expires_at)"""
+
+    def __init__(self, maxsize: int = AUTH_TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "rejected": 0}
+
+    def get(self, token: str) -> Optional[int]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        user_id, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return user_id
+
+    def put(self, token: str, user_id: int, expires_at: float):
+        if self.maxsize <= 0:
+            return
+        self._entries[token] = (user_id, expires_at)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "size": len(self._entries)}
+
+
+token_cache = TokenCache()
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+def verify_token(token: str) -> int:
+    """The user id of a valid, unexpired access token; 401 otherwise"""
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        token_cache.stats["hits"] += 1
+        return user_id
+
+    token_cache.stats["misses"] += 1
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        user_id = int(claims["sub"])
+        expires_at = float(claims["exp"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        # Invalid tokens aren't cached, so garbage can't evict valid entries
+        token_cache.stats["rejected"] += 1
+        raise _unauthorized("Invalid or expired token")
+    token_cache.put(token, user_id, expires_at)
+    return user_id
+
+
+async def get_current_user_id(token: Optional[str] = Depends(oauth2_scheme)) -> int:
+    """FastAPI dependency: the id of the user making the request"""
+    if token is None:
+        if not AUTH_REQUIRED:
+            return DEFAULT_USER_ID
+        raise _unauthorized("Not authenticated")
+    return verify_token(token)
@@ -0,0 +1,156 @@
+"""
+Circuit breaker for the LLM provider.
+
+Closed: calls go through and their outcomes are kept in a sliding window.
+Errors and calls slower than LLM_SLOW_CALL_SECONDS both count as failures,
+so a provider that is up but degraded trips the breaker as well as one that
+is down. Once at least LLM_BREAKER_MIN_CALLS outcomes are in the window and
+the failed share reaches LLM_BREAKER_FAILURE_RATE, the breaker opens.
+
+Open: calls fail immediately with CircuitOpenError for LLM_BREAKER_OPEN_SECONDS
+instead of each waiting out timeouts and retries.
+
+Half-open: after that, LLM_BREAKER_HALF_OPEN_PROBES calls are let through as
+probes (everyone else is still rejected). If they all succeed in time the
+breaker closes; any failed probe opens it again.
+
+State is per process; each worker learns about an outage from its own calls.
+"""
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+LLM_SLOW_CALL_SECONDS = float(os.getenv("LLM_SLOW_CALL_SECONDS", "10"))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+LLM_BREAKER_HALF_OPEN_PROBES = int(os.getenv("LLM_BREAKER_HALF_OPEN_PROBES", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# Exported as a gauge: 0 closed, 1 half-open, 2 open
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable (circuit open), retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        window: int = LLM_BREAKER_WINDOW,
+        min_calls: int = LLM_BREAKER_MIN_CALLS,
+        failure_rate: float = LLM_BREAKER_FAILURE_RATE,
+        slow_call_seconds: float = LLM_SLOW_CALL_SECONDS,
+        open_seconds: float = LLM_BREAKER_OPEN_SECONDS,
+        half_open_probes: int = LLM_BREAKER_HALF_OPEN_PROBES,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)  # True for each failed or slow call
+        self._open_until = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self.stats = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    def retry_after(self) -> float:
+        """Seconds until calls may be let through again; 0 when closed"""
+        if self.state == CLOSED:
+            return 0.0
+        return max(self._open_until - time.monotonic(), 1.0)
+
+    def check(self):
+        """Raise CircuitOpenError if a call would be rejected right now"""
+        if self.state == OPEN and time.monotonic() < self._open_until:
+            self.stats["rejected"] += 1
+            raise CircuitOpenError(self.name, self.retry_after())
+
+    def _admit(self) -> bool:
+        """Let a call through or raise CircuitOpenError; True if the call is a probe"""
+        self.check()
+        if self.state == OPEN:
+            self.state = HALF_OPEN
+            self._probes = self._probe_successes = 0
+            logger.info("%s circuit half-open, probing", self.name)
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.name, self.retry_after())
+            self._probes += 1
+            return True
+        return False
+
+    @contextmanager
+    def call(self, failures: Tuple[Type[BaseException], ...] = (Exception,)):
+        """
+        Guard one call: raises CircuitOpenError instead of entering when open.
+        Exceptions of the failures types count against the provider; others
+        (bad requests, cancellation) are passed through without an outcome.
+        """
+        probe = self._admit()
+        self.stats["calls"] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        except failures:
+            self.stats["failures"] += 1
+            self._record(False, probe)
+            raise
+        except BaseException:
+            if probe:
+                self._probes -= 1
+            raise
+        elapsed = time.perf_counter() - started
+        if elapsed >= self.slow_call_seconds:
+            self.stats["slow_calls"] += 1
+            self._record(False, probe)
+        else:
+            self._record(True, probe)
+
+    def _record(self, ok: bool, probe: bool):
+        if probe:
+            if self.state != HALF_OPEN:
+                return
+            if not ok:
+                self._open("probe failed")
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self.state = CLOSED
+                self._outcomes.clear()
+                logger.warning("%s circuit closed", self.name)
+            return
+
+        # Late results of calls admitted before the breaker opened don't count
+        if self.state != CLOSED:
+            return
+        self._outcomes.append(not ok)
+        failed = sum(self._outcomes)
+        if len(self._outcomes) >= self.min_calls and failed / len(self._outcomes) >= self.failure_rate:
+            self._open(f"{failed} of the last {len(self._outcomes)} calls failed or were slow")
+
+    def _open(self, reason: str):
+        self.state = OPEN
+        self._open_until = time.monotonic() + self.open_seconds
+        self._outcomes.clear()
+        self.stats["opened"] += 1
+        logger.warning("%s circuit open for %.0fs: %s", self.name, self.open_seconds, reason)
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "state": self.state, "state_code": STATE_CODES[self.state]}
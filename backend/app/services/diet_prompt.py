@@ -0,0 +1,196 @@
+"""
+Compact diet plan prompts within a token budget.
+
+The instructions and output schema never change, so they form a fixed
+system message: every diet plan request starts with the same prefix, which
+provider-side prompt caching can reuse. The user message holds only the data:
+
+    FOODS  id|kcal|times|description   each distinct food once (by normalized description)
+    DAYS   date|kcal|protein|carbs|fats|fiber|m:ids a:ids e:ids
+    AVG    kcal|protein|carbs|fats|fiber per analyzed day
+
+Daily macros come from the rollup instead of being re-derived by the model,
+and a food eaten every day costs one line instead of one per meal. If the
+data still exceeds DIET_PLAN_MAX_PROMPT_TOKENS (counted with the model's
+tokenizer, loaded off the event loop by load_encoding), the least significant foods (fewest calories over the window)
+are left out of FOODS and counted as "+N" in their meals.
+"""
+import asyncio
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import tiktoken
+
+from services.food_text import normalize_description
+
+logger = logging.getLogger(__name__)
+
+DIET_PLAN_MAX_PROMPT_TOKENS = int(os.getenv("DIET_PLAN_MAX_PROMPT_TOKENS", "1500"))
+# Longest a request waits for the tokenizer to load (it may be downloaded) before approximating
+TIKTOKEN_LOAD_TIMEOUT = float(os.getenv("TIKTOKEN_LOAD_TIMEOUT", "5"))
+# Longer descriptions are cut; they are usually recipes or repeated notes
+DESCRIPTION_MAX_CHARS = 80
+
+SYSTEM_PROMPT = """You are a nutrition expert giving personalized diet recommendations. Respond with valid JSON only:
+{"high_calorie_foods":[{"food":str,"calories":number,"issue":str,"replacement":str,"replacement_calories":number,"benefit":str}],"general_recommendations":[str],"meal_timing_suggestions":str}
+Focus on high-calorie, low-nutrition foods and healthier alternatives the user already eats or can easily prepare.
+
+The user's recent food log:
+FOODS id|kcal|times eaten|description (? = not analyzed)
+DAYS date|kcal|protein g|carbs g|fats g|fiber g|meals (m: morning, a: afternoon, e: evening, then food ids; +N = foods not listed)
+AVG kcal|protein g|carbs g|fats g|fiber g per analyzed day"""
+
+MACROS = ("calories", "protein", "carbs", "fats", "fiber")
+_MEAL_CODES = {"morning": "m", "afternoon": "a", "evening": "e"}
+
+# Roughly how the GPT tokenizers split text: short digit runs, words, single symbols
+_APPROXIMATE_TOKEN_RE = re.compile(r"\d{1,3}| ?[A-Za-z]{1,8}|\s+|[^\sA-Za-z\d]")
+
+
+# Models whose tokenizer load finished: the encoding, or None if it couldn't be loaded
+_encodings: Dict[str, object] = {}
+_encoding_loads: Dict[str, asyncio.Future] = {}
+
+
+def _load_encoding(model: str):
+    # tiktoken downloads the encoding on first use, without a timeout; with
+    # TIKTOKEN_CACHE_DIR pointing at a filled cache (as in the Docker image) it is read from disk
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except Exception as e:
+        logger.warning("No tokenizer for %s, approximating token counts: %s", model, e)
+        encoding = None
+    _encodings[model] = encoding
+    return encoding
+
+
+async def load_encoding(model: str):
+    """
+    Load the model's tokenizer in a thread, waiting at most TIKTOKEN_LOAD_TIMEOUT
+    seconds for it. Token counts are approximated until it has loaded.
+    """
+    if model in _encodings:
+        return
+    load = _encoding_loads.get(model)
+    if load is None:
+        load = _encoding_loads[model] = asyncio.ensure_future(asyncio.to_thread(_load_encoding, model))
+    try:
+        await asyncio.wait_for(asyncio.shield(load), TIKTOKEN_LOAD_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Loading the %s tokenizer is taking long, approximating token counts meanwhile", model)
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Tokens in text; approximated unless load_encoding has loaded the model's tokenizer"""
+    encoding = _encodings.get(model)
+    if encoding is None:
+        return len(_APPROXIMATE_TOKEN_RE.findall(text))
+    return len(encoding.encode(text))
+
+
+def _number(value: Optional[float]) -> str:
+    return "?" if value is None else f"{value:.0f}"
+
+
+def _shorten(description: str) -> str:
+    description = " ".join(description.split())
+    if len(description) <= DESCRIPTION_MAX_CHARS:
+        return description
+    return description[:DESCRIPTION_MAX_CHARS - 1].rstrip() + "…"
+
+
+class _Food:
+    def __init__(self, description: str):
+        self.description = _shorten(description)
+        self.calories: List[float] = []
+        self.count = 0
+
+    @property
+    def kcal(self) -> Optional[float]:
+        return sum(self.calories) / len(self.calories) if self.calories else None
+
+    @property
+    def weight(self) -> float:
+        # Total calories over the window; unanalyzed foods rank by frequency alone
+        return self.count * (self.kcal or 1)
+
+
+def _collect_foods(food_history: List[Dict]) -> Tuple[List[_Food], List[Dict[str, List[int]]]]:
+    """Distinct foods in order of first appearance, and each day's meals as food indexes"""
+    foods: List[_Food] = []
+    by_key: Dict[str, int] = {}
+    days = []
+    for day in food_history:
+        meals: Dict[str, List[int]] = {}
+        for log in day["logs"]:
+            key = normalize_description(log["food_description"]) or log["food_description"]
+            index = by_key.get(key)
+            if index is None:
+                index = by_key[key] = len(foods)
+                foods.append(_Food(log["food_description"]))
+            food = foods[index]
+            food.count += 1
+            if log.get("calories") is not None:
+                food.calories.append(log["calories"])
+            meals.setdefault(log["meal_time"], []).append(index)
+        days.append(meals)
+    return foods, days
+
+
+def _render(food_history: List[Dict], nutrient_totals: Dict, foods: List[_Food], days, kept) -> str:
+    ids = {index: str(position + 1) for position, index in enumerate(sorted(kept))}
+    lines = ["FOODS"]
+    for index in sorted(kept):
+        food = foods[index]
+        lines.append(f"{ids[index]}|{_number(food.kcal)}|{food.count}|{food.description}")
+
+    lines.append("DAYS")
+    for day, meals in zip(food_history, days):
+        totals = day.get("totals") or {}
+        parts = [str(day["date"]), *(_number(totals.get(macro)) for macro in MACROS)]
+        meal_parts = []
+        for meal_time, code in _MEAL_CODES.items():
+            if meal_time not in meals:
+                continue
+            listed = [ids[index] for index in meals[meal_time] if index in ids]
+            hidden = len(meals[meal_time]) - len(listed)
+            meal_parts.append(f"{code}:" + ",".join(listed + ([f"+{hidden}"] if hidden else [])))
+        parts.append(" ".join(meal_parts))
+        lines.append("|".join(parts))
+
+    lines.append("AVG|" + "|".join(_number(nutrient_totals.get(f"avg_{macro}")) for macro in MACROS))
+    return "\n".join(lines)
+
+
+def build_user_prompt(
+    food_history: List[Dict], nutrient_totals: Dict, model: str,
+    max_tokens: int = DIET_PLAN_MAX_PROMPT_TOKENS,
+) -> Tuple[str, int]:
+    """The data part of the prompt and its token count, within max_tokens where possible"""
+    foods, days = _collect_foods(food_history)
+    kept = set(range(len(foods)))
+    prompt = _render(food_history, nutrient_totals, foods, days, kept)
+    tokens = count_tokens(prompt, model)
+
+    if tokens > max_tokens and foods:
+        # Keep the largest prefix of the foods (most calories first) that fits
+        ranked = sorted(range(len(foods)), key=lambda index: -foods[index].weight)
+        low, high = 0, len(ranked) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            candidate = _render(food_history, nutrient_totals, foods, days, set(ranked[:middle]))
+            if count_tokens(candidate, model) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        kept = set(ranked[:low])
+        prompt = _render(food_history, nutrient_totals, foods, days, kept)
+        tokens = count_tokens(prompt, model)
+
+    logger.info(
+        "Diet plan prompt: %d days, %d logs, %d/%d foods listed, %d data tokens (budget %d)",
+        len(food_history), sum(food.count for food in foods), len(kept), len(foods), tokens, max_tokens,
+    )
+    return prompt, tokens
@@ -0,0 +1,247 @@
+"""
+Streaming CSV / NDJSON import and export of food logs.
+
+Uploads are decoded and split into records as the body arrives (CSV records
+may continue over several lines inside quoted fields), validated with
+FoodLogCreate and inserted IMPORT_BATCH_SIZE rows at a time with one
+executemany, so memory doesn't depend on the file size. Each batch is
+committed with one rollup upsert per date in it, so no transaction (or pooled
+connection) is held while waiting on the client to send the rest. Exports are
+written from a server-side cursor, one partition of rows at a time.
+"""
+import codecs
+import csv
+import io
+import json
+import os
+from collections import Counter
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from pydantic_core import to_json
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import schemas
+from database import session_router
+from services import nutrient_rollup
+from services.response_cache import response_cache
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "2000"))
+EXPORT_BATCH_SIZE = 1000
+# Invalid rows are skipped; this many of them are described in the response
+IMPORT_MAX_REPORTED_ERRORS = 100
+
+CSV = "csv"
+NDJSON = "ndjson"
+MEDIA_TYPES = {CSV: "text/csv", NDJSON: "application/x-ndjson"}
+_CONTENT_TYPES = {
+    "text/csv": CSV,
+    "application/csv": CSV,
+    "application/x-ndjson": NDJSON,
+    "application/ndjson": NDJSON,
+    "application/jsonl": NDJSON,
+    "application/x-jsonlines": NDJSON,
+}
+
+EXPORT_COLUMNS = (
+    "id", "date", "meal_time", "time", "food_description",
+    *nutrient_rollup.NUTRIENT_FIELDS,
+)
+
+# (line number, record, parse error)
+Record = Tuple[int, Optional[Dict], Optional[str]]
+
+
+def upload_format(content_type: Optional[str], format: Optional[str]) -> str:
+    """The upload's format from ?format= or else its Content-Type"""
+    if format:
+        if format not in MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+        return format
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type not in _CONTENT_TYPES:
+        raise HTTPException(
+            status_code=415,
+            detail="Send text/csv or application/x-ndjson, or set ?format=csv|ndjson"
+        )
+    return _CONTENT_TYPES[media_type]
+
+
+async def _line_batches(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[str]]:
+    """The complete lines of each chunk of the body (a UTF-8 BOM is dropped)"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split("\n")
+        pending = lines.pop()
+        if lines:
+            yield lines
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield [pending]
+
+
+def _parse_csv(records: List[Tuple[int, str]]):
+    """(line number, fields, error) for complete CSV records"""
+    try:
+        rows = list(csv.reader(text for _, text in records))
+    except csv.Error:
+        # Parse one by one to find the broken record(s)
+        for number, text in records:
+            try:
+                yield number, next(csv.reader([text]), []), None
+            except csv.Error as e:
+                yield number, None, f"Invalid CSV: {e}"
+        return
+    for (number, _), row in zip(records, rows):
+        yield number, row, None
+
+
+async def csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Record]:
+    """Rows of a CSV upload keyed by its (case-insensitive) header"""
+    header = None
+    pending: List[str] = []
+    quotes = 0
+    line_number = 0
+    record_line = 0
+    async for lines in _line_batches(chunks):
+        complete = []
+        for line in lines:
+            line_number += 1
+            if not pending:
+                record_line = line_number
+            pending.append(line)
+            # An odd number of quotes so far: a quoted field continues on the next line
+            quotes += line.count('"')
+            if quotes % 2:
+                continue
+            complete.append((record_line, "\n".join(pending)))
+            pending = []
+            quotes = 0
+
+        for number, row, error in _parse_csv(complete):
+            if error is not None:
+                yield number, None, error
+                continue
+            if not row or not any(value.strip() for value in row):
+                continue
+            if header is None:
+                header = [name.strip().lower() for name in row]
+                continue
+            # Empty cells are missing values, so optional fields take their defaults
+            yield number, {
+                name: value for name, value in zip(header, row) if value.strip()
+            }, None
+
+    if pending:
+        yield record_line, None, "Unterminated quoted field"
+
+
+async def ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Record]:
+    """One JSON object per line"""
+    line_number = 0
+    async for lines in _line_batches(chunks):
+        for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, "Expected a JSON object"
+                continue
+            yield line_number, record, None
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}"
+        for item in error.errors()
+    )
+
+
+async def import_food_logs(db: AsyncSession, user_id: int, records: AsyncIterator[Record]) -> Dict:
+    """
+    Validate and insert records in batches, each committed in a transaction of
+    its own together with its rollup deltas. If the upload breaks off, the
+    batches committed before that stay imported.
+    """
+    imported = 0
+    skipped = 0
+    errors = []
+    batch = []
+    # A Core insert on the table skips the ORM bulk-persistence layer (~20% faster)
+    insert_logs = insert(models.FoodLog.__table__)
+
+    async def flush():
+        nonlocal imported, batch
+        await db.execute(insert_logs, batch)
+        logs_per_day = Counter(row["date"] for row in batch)
+        await nutrient_rollup.apply_deltas(
+            db, user_id, {day: {"log_count": count} for day, count in logs_per_day.items()}
+        )
+        await db.commit()
+        await response_cache.invalidate(user_id)
+        imported += len(batch)
+        batch = []
+
+    def reject(line: int, message: str):
+        nonlocal skipped
+        skipped += 1
+        if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+            errors.append({"line": line, "error": message})
+
+    async for line, record, error in records:
+        if error is not None:
+            reject(line, error)
+            continue
+        try:
+            food_log = schemas.FoodLogCreate.model_validate(record)
+        except ValidationError as e:
+            reject(line, _describe(e))
+            continue
+        batch.append({"user_id": user_id, **food_log.model_dump()})
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await flush()
+
+    if batch:
+        await flush()
+    return {"imported": imported, "skipped": skipped, "errors": errors}
+
+
+def _export_values(row) -> Dict:
+    values = dict(zip(EXPORT_COLUMNS, row))
+    values["meal_time"] = values["meal_time"].value
+    values["time"] = schemas.format_time(values["time"])
+    return values
+
+
+def _csv_chunk(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        values = _export_values(row)
+        writer.writerow(["" if values[column] is None else values[column] for column in EXPORT_COLUMNS])
+    return buffer.getvalue().encode()
+
+
+def _ndjson_chunk(rows) -> bytes:
+    return b"".join(to_json(_export_values(row)) + b"\n" for row in rows)
+
+
+async def export_rows(query, format: str, user_id: int) -> AsyncIterator[bytes]:
+    """Serialize the query's rows (in EXPORT_COLUMNS order) as they arrive from a server-side cursor"""
+    encode = _csv_chunk if format == CSV else _ndjson_chunk
+    # A dedicated session: the request's session is closed once the response starts
+    async with session_router.read_session(user_id) as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        if format == CSV:
+            yield (",".join(EXPORT_COLUMNS) + "\n").encode()
+        async for rows in result.partitions():
+            yield encode(rows)
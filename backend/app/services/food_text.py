@@ -0,0 +1,52 @@
+"""
+Normalization of free-text food descriptions, shared by the analysis cache
+and the local nutrient engine
+"""
+import re
+import unicodedata
+
+_NUMBER_WORDS = {
+    "a": "1",
+    "an": "1",
+    "one": "1",
+    "two": "2",
+    "three": "3",
+    "four": "4",
+    "five": "5",
+    "six": "6",
+    "seven": "7",
+    "eight": "8",
+    "nine": "9",
+    "ten": "10",
+    "eleven": "11",
+    "twelve": "12",
+    "half": "0.5",
+    "dozen": "12",
+}
+_UNICODE_FRACTIONS = {"½": " 0.5", "¼": " 0.25", "¾": " 0.75", "⅓": " 0.33", "⅔": " 0.67"}
+
+_FRACTION_RE = re.compile(r"(\d+)\s*[/\u2044]\s*(\d+)")
+_MULTIPLIER_RE = re.compile(r"\b(\d+(?:\.\d+)?)\s*x\b")
+_NUMBER_UNIT_RE = re.compile(r"(\d)([a-z])")
+_PUNCTUATION_RE = re.compile(r"[^\w\s.]|(?<!\d)\.|\.(?!\d)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_description(food_description: str) -> str:
+    """
+    Canonical form of a food description so that trivially different spellings
+    ("2 Boiled eggs!", "two boiled  eggs") share a cache entry
+    """
+    text = food_description
+    for fraction, value in _UNICODE_FRACTIONS.items():
+        text = text.replace(fraction, value)
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _FRACTION_RE.sub(
+        lambda m: f"{int(m.group(1)) / int(m.group(2)):g}" if int(m.group(2)) else m.group(0),
+        text,
+    )
+    text = _MULTIPLIER_RE.sub(r"\1", text)  # "2x eggs" -> "2 eggs"
+    text = _NUMBER_UNIT_RE.sub(r"\1 \2", text)  # "200g" -> "200 g"
+    text = _PUNCTUATION_RE.sub(" ", text)
+    tokens = [_NUMBER_WORDS.get(token, token) for token in text.split()]
+    return _WHITESPACE_RE.sub(" ", " ".join(tokens)).strip()
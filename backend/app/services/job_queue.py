@@ -0,0 +1,212 @@
+"""
+Durable job queue for LLM-backed work (analysis, daily summaries, diet plans).
+
+Jobs live in the jobs table. Workers claim them with SELECT ... FOR UPDATE
+SKIP LOCKED, so any number of workers across processes can share the queue
+without handing out the same job twice. Jobs whose worker died are reclaimed
+once their lease expires, and failed once that happened on their last attempt
+(JOB_MAX_ATTEMPTS).
+
+The API process runs JOB_WORKERS workers in the background; a standalone
+worker process can be started with:
+
+    python -m services.job_queue
+"""
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from database import SessionLocal
+from services import nutrition, rate_limit
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))  # seconds
+JOB_LEASE = int(os.getenv("JOB_LEASE", "300"))  # seconds before a running job is reclaimed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = int(os.getenv("JOB_RETRY_DELAY", "30"))  # seconds, for 503s without Retry-After
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(
+    db: AsyncSession, user_id: int, kind: models.JobKind, run_after: Optional[datetime] = None, **payload
+) -> models.Job:
+    """Add a job to the queue; committed together with the caller's transaction"""
+    job = models.Job(
+        user_id=user_id, kind=kind, payload=payload, status=models.JobStatus.PENDING, run_after=run_after
+    )
+    db.add(job)
+    return job
+
+
+def retry_time(e: HTTPException) -> datetime:
+    """When to run work again that failed with a 503 (see nutrition.llm_unavailable) or 429"""
+    seconds = int((e.headers or {}).get("Retry-After", JOB_RETRY_DELAY))
+    return datetime.now(timezone.utc) + timedelta(seconds=seconds)
+
+
+async def claim_next(db: AsyncSession) -> Optional[models.Job]:
+    """Atomically take the oldest runnable job, or None if the queue is empty"""
+    now = datetime.now(timezone.utc)
+    lease_expired = and_(
+        models.Job.status == models.JobStatus.RUNNING,
+        models.Job.started_at < now - timedelta(seconds=JOB_LEASE)
+    )
+    # A job whose worker keeps dying (or hanging) on it isn't retried forever
+    exhausted = await db.execute(
+        update(models.Job).where(lease_expired, models.Job.attempts >= JOB_MAX_ATTEMPTS).values(
+            status=models.JobStatus.FAILED,
+            error=f"Lease expired on all {JOB_MAX_ATTEMPTS} attempts",
+            finished_at=now
+        ).execution_options(synchronize_session=False)
+    )
+    if exhausted.rowcount:
+        await db.commit()
+        logger.warning("Failed %s jobs whose lease expired on their last attempt", exhausted.rowcount)
+    runnable = and_(
+        or_(
+            models.Job.status == models.JobStatus.PENDING,
+            and_(lease_expired, models.Job.attempts < JOB_MAX_ATTEMPTS)
+        ),
+        or_(models.Job.run_after.is_(None), models.Job.run_after <= now)
+    )
+    result = await db.execute(
+        select(models.Job.id).where(runnable).order_by(models.Job.id).limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    job_id = result.scalar()
+    if job_id is None:
+        await db.rollback()
+        return None
+
+    # The conditional update keeps claims exclusive on backends without
+    # row locks (SQLite), where another worker may have seen the same row
+    claimed = await db.execute(
+        update(models.Job).where(models.Job.id == job_id, runnable).values(
+            status=models.JobStatus.RUNNING,
+            started_at=now,
+            attempts=models.Job.attempts + 1
+        )
+    )
+    await db.commit()
+    if claimed.rowcount != 1:
+        return None
+    return await db.get(models.Job, job_id)
+
+
+async def job_stats(db: AsyncSession, user_id: int) -> Dict[str, int]:
+    """Number of the user's jobs per status"""
+    result = await db.execute(
+        select(models.Job.status, func.count(models.Job.id))
+        .where(models.Job.user_id == user_id).group_by(models.Job.status)
+    )
+    counts = result.all()
+    return {status.value: count for status, count in counts}
+
+
+async def _run(db: AsyncSession, job: models.Job) -> Any:
+    # LLM usage is charged to the job's owner; once their daily budget is used up this waits for tomorrow
+    rate_limit.charge_to(job.user_id)
+    await rate_limit.rate_limiter.check_budget(job.user_id)
+    if job.kind == models.JobKind.ANALYZE:
+        analysis = await nutrition.analyze_food_log(job.user_id, job.payload["food_log_id"])
+        return analysis.model_dump(mode="json")
+    if job.kind == models.JobKind.SUMMARIZE:
+        summary = await nutrition.summarize_day(db, job.user_id, date.fromisoformat(job.payload["date"]))
+        return jsonable_encoder(summary)
+    if job.kind == models.JobKind.DIET_PLAN:
+        plan = await nutrition.generate_diet_plan(db, job.user_id)
+        return plan.model_dump(mode="json")
+    raise ValueError(f"Unknown job kind: {job.kind}")
+
+
+async def process_job(db: AsyncSession, job: models.Job):
+    job_id = job.id
+    try:
+        result = await _run(db, job)
+    except Exception as e:
+        await db.rollback()
+        job = await db.get(models.Job, job_id)
+        if isinstance(e, HTTPException) and e.status_code in (429, 503):
+            # The LLM is unavailable or the user's budget is used up: try again
+            # later without using up an attempt
+            job.status = models.JobStatus.PENDING
+            job.attempts -= 1
+            job.run_after = retry_time(e)
+            job.error = e.detail
+            await db.commit()
+            logger.info("Job %s deferred until %s: %s", job_id, job.run_after, e.detail)
+            return
+        # Client errors (missing log, not enough data) will not succeed on retry
+        retryable = not isinstance(e, HTTPException) and job.attempts < JOB_MAX_ATTEMPTS
+        job.status = models.JobStatus.PENDING if retryable else models.JobStatus.FAILED
+        job.error = e.detail if isinstance(e, HTTPException) else str(e)
+        job.finished_at = None if retryable else datetime.now(timezone.utc)
+        await db.commit()
+        if not retryable:
+            logger.warning("Job %s failed: %s", job_id, job.error)
+        return
+
+    job = await db.get(models.Job, job_id)
+    job.status = models.JobStatus.DONE
+    job.result = result
+    job.error = None
+    job.finished_at = datetime.now(timezone.utc)
+    await db.commit()
+
+
+class WorkerPool:
+    """A fixed number of asyncio workers draining the job queue"""
+
+    def __init__(self, size: int = JOB_WORKERS, poll_interval: float = JOB_POLL_INTERVAL):
+        self.size = size
+        self.poll_interval = poll_interval
+        self._tasks = []
+        self._stopping = None
+
+    async def _worker(self):
+        while not self._stopping.is_set():
+            try:
+                async with SessionLocal() as db:
+                    job = await claim_next(db)
+                    if job is not None:
+                        await process_job(db, job)
+                        continue
+            except Exception:
+                logger.exception("Job worker error")
+
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        # Created here so the event belongs to the running loop
+        self._stopping = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.size)]
+
+    async def stop(self):
+        self._stopping.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+worker_pool = WorkerPool()
+
+
+async def _run_forever():
+    worker_pool.start()
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_forever())
@@ -0,0 +1,70 @@
+"""
+Hand the data kept from before accounts existed to its owner.
+
+Migration 0005_users stores that data under a placeholder account (user 1)
+that can't sign in, rather than giving it to whoever registers first. Once
+it is known whose it is, give the placeholder their email and a password:
+
+    python -m services.legacy_owner owner@example.com
+
+The password is prompted for, or read from stdin when it isn't a terminal.
+The email must not be registered yet: an existing account isn't merged
+with the placeholder.
+"""
+import asyncio
+import getpass
+import sys
+from typing import List
+
+from pydantic import ValidationError
+from sqlalchemy import select
+
+import models
+import schemas
+from services import auth
+
+# Set by migration 0005_users
+LEGACY_OWNER_ID = 1
+LEGACY_OWNER_EMAIL = "legacy-owner@fitbuddy.invalid"
+
+
+def read_password() -> str:
+    if sys.stdin.isatty():
+        return getpass.getpass("Password: ")
+    return sys.stdin.readline().rstrip("\n")
+
+
+async def claim(email: str, password: str) -> int:
+    """Give the placeholder account email and password; returns the account's id"""
+    from database import SessionLocal
+
+    user = schemas.UserCreate(email=email, password=password)
+    async with SessionLocal() as db:
+        owner = await db.get(models.User, LEGACY_OWNER_ID)
+        if owner is None or owner.email != LEGACY_OWNER_EMAIL:
+            raise LookupError("There is no unclaimed legacy data")
+        taken = await db.execute(select(models.User.id).where(models.User.email == user.email))
+        if taken.first() is not None:
+            raise LookupError(f"{user.email} is already registered")
+        owner.email = user.email
+        owner.hashed_password = await auth.hash_password(user.password)
+        await db.commit()
+        return owner.id
+
+
+async def main(argv: List[str]) -> int:
+    if len(argv) != 1:
+        print("usage: python -m services.legacy_owner EMAIL")
+        return 2
+
+    try:
+        user_id = await claim(argv[0], read_password())
+    except (LookupError, ValidationError) as e:
+        print(e)
+        return 1
+    print(f"{argv[0]} now owns the legacy data (user {user_id})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -0,0 +1,433 @@
+"""
+Prometheus metrics and per-request performance accounting.
+
+MetricsMiddleware times every HTTP request by route template and keeps a
+RequestStats for it in a context variable; the SQLAlchemy cursor events
+installed by instrument_engine and the LLM helpers in ai_service add their
+queries and calls to it. /metrics (main.py) exposes everything in the
+Prometheus text format.
+
+With SLOW_REQUEST_MS set, requests slower than that are logged with a trace
+of their statements (and the app code that issued them) and LLM calls, plus
+the query plans of the slowest SELECTs. Tracing costs a stack walk per
+statement, so it is off by default.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+import traceback
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set
+
+import greenlet
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from services.circuit_breaker import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are logged with a query/LLM trace; 0 disables tracing
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+# Slowest SELECTs of a slow request whose plans are logged
+SLOW_REQUEST_PLANS = int(os.getenv("SLOW_REQUEST_PLANS", "3"))
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+APP_DIR = str(Path(__file__).resolve().parent.parent) + os.sep
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+http_request_duration = Histogram(
+    "fitbuddy_http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+db_queries_per_request = Histogram(
+    "fitbuddy_db_queries_per_request",
+    "SQL statements executed while handling a request",
+    ["route"],
+    buckets=COUNT_BUCKETS,
+)
+db_time_per_request = Histogram(
+    "fitbuddy_db_time_per_request_seconds",
+    "Time spent executing SQL statements while handling a request",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+db_query_duration = Histogram(
+    "fitbuddy_db_query_duration_seconds",
+    "Execution time of single SQL statements, by database pool and statement type",
+    ["pool", "statement"],
+    buckets=QUERY_BUCKETS,
+)
+db_pool_checkout_wait = Histogram(
+    "fitbuddy_db_pool_checkout_wait_seconds",
+    "Time spent waiting for (or opening) a pooled database connection, by database pool",
+    ["pool"],
+    buckets=QUERY_BUCKETS + (2.5, 5, 10, 30),
+)
+llm_request_duration = Histogram(
+    "fitbuddy_llm_request_duration_seconds",
+    "LLM call latency including concurrency-limit waits and retries, by ai_service operation",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+llm_requests = Counter(
+    "fitbuddy_llm_requests", "LLM calls by ai_service operation and outcome", ["operation", "outcome"]
+)
+llm_retries = Counter("fitbuddy_llm_retries", "Retried LLM attempts by ai_service operation", ["operation"])
+llm_tokens = Counter(
+    "fitbuddy_llm_tokens", "Tokens reported by the LLM API, by operation and kind", ["operation", "kind"]
+)
+
+
+class RequestStats:
+    """What one request spent on the database and the LLM"""
+
+    __slots__ = ("started", "queries", "query_seconds", "llm_calls", "llm_seconds", "trace")
+
+    def __init__(self, trace: bool = False):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        # Only kept for the slow-request log
+        self.trace: Optional[List[Dict]] = [] if trace else None
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def _caller() -> str:
+    """The innermost app frame (outside this module) that led here, e.g. 'routers/food_logs.py:88 in get_food_logs'"""
+    frame = sys._getframe(1)
+    # Statements of an AsyncSession run in a greenlet; the app code that issued
+    # them is on the stack of the suspended parent greenlet
+    parent = greenlet.getcurrent().parent
+    if parent is not None and parent.gr_frame is not None:
+        frame = parent.gr_frame
+    for frame, lineno in traceback.walk_stack(frame):
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and filename != __file__:
+            return f"{filename[len(APP_DIR):]}:{lineno} in {frame.f_code.co_name}"
+    return "?"
+
+
+def _statement_type(statement: str) -> str:
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return verb if verb in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH") else "OTHER"
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Async queue pool that records how long each checkout waited for a
+    connection, labelled with the engine's pool_logging_name
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout_wait.labels(self.logging_name or "primary").observe(time.perf_counter() - started)
+
+
+_engine: Optional[AsyncEngine] = None
+
+
+def instrument_engine(engine: AsyncEngine, pool: str = "primary"):
+    """
+    Time every statement the engine runs and attribute it to the current
+    request; pool names the engine's database in the metrics
+    """
+    global _engine
+    if pool == "primary":
+        _engine = engine
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        db_query_duration.labels(pool, _statement_type(statement)).observe(elapsed)
+        stats = _request_stats.get()
+        if stats is None:
+            return
+        stats.queries += 1
+        stats.query_seconds += elapsed
+        if stats.trace is not None:
+            stats.trace.append({
+                "kind": "query",
+                "at": time.perf_counter() - elapsed - stats.started,
+                "seconds": elapsed,
+                "statement": statement,
+                "parameters": None if executemany else parameters,
+                "caller": _caller(),
+            })
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+
+    # An engine recreated after dispose_engine takes over the gauges of its pool
+    _pool_collector.pools[pool] = sync_engine.pool
+
+
+# In-process collectors, also added to the per-scrape registry in multiprocess mode
+_collectors = []
+
+
+def _register(collector):
+    _collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+class _PoolCollector:
+    GAUGES = (
+        ("checked_out", "checkedout", "Connections currently checked out of the pool"),
+        ("size", "size", "Configured pool size"),
+        ("overflow", "overflow", "Connections opened beyond the pool size (negative while below it)"),
+    )
+
+    def __init__(self):
+        self.pools: Dict[str, object] = {}
+
+    def collect(self):
+        # Single-connection pools (in-memory SQLite) have no counters
+        pools = {name: pool for name, pool in self.pools.items() if hasattr(pool, "checkedout")}
+        for name, method, documentation in self.GAUGES:
+            family = GaugeMetricFamily(f"fitbuddy_db_pool_{name}", documentation, labels=["pool"])
+            for pool_name, pool in pools.items():
+                family.add_metric([pool_name], getattr(pool, method)())
+            yield family
+
+
+_pool_collector = _PoolCollector()
+_register(_pool_collector)
+
+
+class _StatsCollector:
+    def __init__(self, prefix: str, documentation: str, stats: Callable[[], Dict]):
+        self.prefix = prefix
+        self.documentation = documentation
+        self.stats = stats
+
+    def collect(self):
+        for key, value in self.stats().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield GaugeMetricFamily(f"{self.prefix}_{key}", f"{self.documentation} ({key})", value=value)
+
+
+def expose_stats(prefix: str, documentation: str, stats: Callable[[], Dict]):
+    """Publish the numeric values of an in-process stats dict (cache hits, ...) as gauges"""
+    _register(_StatsCollector(prefix, documentation, stats))
+
+
+class LLMCall:
+    """
+    Context manager timing one LLM call (with its retries) for an ai_service
+    operation; record_usage adds the token counts of the response
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def record_usage(self, usage):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        llm_tokens.labels(self.operation, "prompt").inc(usage.prompt_tokens or 0)
+        llm_tokens.labels(self.operation, "cached_prompt").inc(cached)
+        llm_tokens.labels(self.operation, "completion").inc(usage.completion_tokens or 0)
+        logger.info(
+            "LLM %s: %s prompt tokens (%s cached), %s completion tokens",
+            self.operation, usage.prompt_tokens, cached, usage.completion_tokens,
+        )
+
+    def retry(self):
+        llm_retries.labels(self.operation).inc()
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        if exc_type is None:
+            outcome = "ok"
+        elif issubclass(exc_type, CircuitOpenError):
+            outcome = "rejected"
+        elif issubclass(exc_type, Exception):
+            outcome = "error"
+        else:
+            # Cancelled, or a stream whose consumer went away
+            outcome = "cancelled"
+        llm_request_duration.labels(self.operation).observe(elapsed)
+        llm_requests.labels(self.operation, outcome).inc()
+
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.llm_calls += 1
+            stats.llm_seconds += elapsed
+            if stats.trace is not None:
+                stats.trace.append({
+                    "kind": "llm",
+                    "at": self.started - stats.started,
+                    "seconds": elapsed,
+                    "operation": self.operation,
+                    "outcome": outcome,
+                })
+        return False
+
+
+# By id(), since routes aren't hashable; they live as long as the app
+_route_labels: Dict[int, str] = {}
+
+
+def _route(scope) -> str:
+    route = scope.get("route")
+    if route is None:
+        # Unmatched paths share one label so scanners can't blow up the series count
+        return "unmatched"
+    label = _route_labels.get(id(route))
+    if label is None:
+        label = _route_labels[id(route)] = _route_template(scope, route)
+    return label
+
+
+def _route_template(scope, route) -> str:
+    """
+    The route's path template including the prefix of the router it was
+    included from (route.path alone lacks it on recent FastAPI versions)
+    """
+    path = scope["path"]
+    root_path = scope.get("root_path", "")
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    for index, char in enumerate(path):
+        if char == "/" and route.path_regex.match(path[index:]):
+            return path[:index] + route.path
+    return route.path
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and DB/LLM usage per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(trace=SLOW_REQUEST_MS > 0)
+        token = _request_stats.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            # Streaming responses are sent before this returns, so their whole body is timed
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_stats.reset(token)
+            elapsed = time.perf_counter() - stats.started
+            route = _route(scope)
+            http_request_duration.labels(scope["method"], route, str(status)).observe(elapsed)
+            db_queries_per_request.labels(route).observe(stats.queries)
+            db_time_per_request.labels(route).observe(stats.query_seconds)
+            if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+                _spawn(_log_slow_request(scope, route, status, elapsed, stats))
+
+
+_background: Set[asyncio.Task] = set()
+
+
+def _spawn(coro):
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def _explain(statement: str, parameters) -> str:
+    dialect = _engine.dialect.name
+    prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+    async with _engine.connect() as conn:
+        result = await conn.exec_driver_sql(prefix + statement, parameters or ())
+        rows = result.all()
+    if dialect == "sqlite":
+        # (id, parent, notused, detail)
+        return "\n".join(f"      {row[-1]}" for row in rows)
+    return "\n".join(f"      {row[0]}" for row in rows)
+
+
+async def _log_slow_request(scope, route: str, status: int, elapsed: float, stats: RequestStats):
+    lines = [
+        f"Slow request: {scope['method']} {scope['path']} ({route}) -> {status} in {elapsed * 1000:.0f}ms; "
+        f"{stats.queries} queries in {stats.query_seconds * 1000:.0f}ms, "
+        f"{stats.llm_calls} LLM calls in {stats.llm_seconds * 1000:.0f}ms"
+    ]
+    for item in stats.trace:
+        if item["kind"] == "query":
+            statement = " ".join(item["statement"].split())
+            lines.append(
+                f"  +{item['at'] * 1000:7.1f}ms  query {item['seconds'] * 1000:7.2f}ms  "
+                f"{item['caller']}: {statement[:300]}"
+            )
+        else:
+            lines.append(
+                f"  +{item['at'] * 1000:7.1f}ms  llm   {item['seconds'] * 1000:7.0f}ms  "
+                f"{item['operation']} ({item['outcome']})"
+            )
+
+    selects = sorted(
+        (item for item in stats.trace if item["kind"] == "query" and _statement_type(item["statement"]) in ("SELECT", "WITH")),
+        key=lambda item: -item["seconds"],
+    )[:SLOW_REQUEST_PLANS]
+    for item in selects:
+        try:
+            plan = await _explain(item["statement"], item["parameters"])
+        except Exception as e:
+            plan = f"      (no plan: {e})"
+        lines.append(f"  plan of {item['caller']} ({item['seconds'] * 1000:.2f}ms):\n{plan}")
+
+    logger.warning("\n".join(lines))
+
+
+def render() -> bytes:
+    """The registry in the Prometheus text format, aggregated across workers in multiprocess mode"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in _collectors:
+            registry.register(collector)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,64 @@
+"""
+Bring DATABASE_URL to the current schema; the API doesn't create tables itself.
+
+Runs alembic upgrade head. A database created before migrations existed
+(it has the tables but no alembic_version) is stamped 0001_baseline first,
+as the baseline migration describes, so its tables aren't created twice.
+
+The Docker Compose files run this as a one-shot migrate service that the
+backend waits for; elsewhere run it (or alembic upgrade head) from app/
+before starting uvicorn:
+
+    python -m services.migrate
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+from typing import List
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database import database_url
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+BASELINE_REVISION = "0001_baseline"
+
+logger = logging.getLogger(__name__)
+
+
+async def needs_baseline_stamp() -> bool:
+    """Whether the database has the pre-migration tables but was never stamped"""
+    engine = create_async_engine(database_url())
+    try:
+        async with engine.connect() as conn:
+            tables = set(await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names()))
+    finally:
+        await engine.dispose()
+    return "food_logs" in tables and "alembic_version" not in tables
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m services.migrate", description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.parse_args(argv)
+
+    config = Config(str(ALEMBIC_INI))
+    config.set_main_option("script_location", str(ALEMBIC_INI.parent / "migrations"))
+    # Checked before alembic runs: its env.py starts an event loop of its own
+    if asyncio.run(needs_baseline_stamp()):
+        logger.warning("Tables exist without a schema version, stamping %s", BASELINE_REVISION)
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, "head")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv[1:]))
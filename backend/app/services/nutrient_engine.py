@@ -0,0 +1,336 @@
+"""
+Local nutrient estimation engine, used as a fast path in front of the LLM.
+
+Reference values per 100 g live in data/foods.csv. They are compiled into a
+flat float32 table that is memory-mapped on first use, next to a JSON index of
+food names and aliases from which an exact-match dict and a trigram index are
+built. A description is split into items ("2 eggs, toast and butter"), each
+item is parsed into quantity, unit and food name, and the name is matched
+against the index. estimate() returns None unless every item matched with
+enough confidence, in which case the caller falls back to the LLM.
+
+    python -m services.nutrient_engine build
+    python -m services.nutrient_engine "2 boiled eggs and a slice of toast"
+"""
+import csv
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from services.food_text import normalize_description
+
+NUTRIENT_ENGINE_ENABLED = os.getenv("NUTRIENT_ENGINE_ENABLED", "true").lower() == "true"
+NUTRIENT_ENGINE_MIN_CONFIDENCE = float(os.getenv("NUTRIENT_ENGINE_MIN_CONFIDENCE", "0.85"))
+NUTRIENT_TABLE_DIR = Path(
+    os.getenv("NUTRIENT_TABLE_DIR", str(Path(__file__).resolve().parent.parent / "data"))
+)
+
+# Recorded on FoodAnalysis.engine
+ENGINE_LOCAL = "local"
+ENGINE_LLM = "llm"
+
+NUTRIENTS = ("calories", "protein", "carbs", "fats", "fiber")
+# Per 100 g, then the weight in grams of one piece, one serving and one cup
+# (0 when not applicable)
+COLUMNS = NUTRIENTS + ("piece_g", "serving_g", "cup_g")
+_PIECE, _SERVING, _CUP = (COLUMNS.index(c) for c in ("piece_g", "serving_g", "cup_g"))
+
+SOURCE_FILE = "foods.csv"
+TABLE_FILE = "foods.table"
+INDEX_FILE = "foods.index.json"
+_HEADER = struct.Struct("<4sII")  # magic, rows, columns
+_MAGIC = b"FBNT"
+
+_MASS_UNITS = {
+    "g": 1, "gm": 1, "gms": 1, "gram": 1, "grams": 1,
+    "kg": 1000, "kgs": 1000, "kilo": 1000, "kilos": 1000,
+    "oz": 28.35, "ounce": 28.35, "ounces": 28.35,
+    "lb": 453.6, "lbs": 453.6, "pound": 453.6, "pounds": 453.6,
+}
+# Millilitres; converted to grams through the food's cup weight
+_VOLUME_UNITS = {
+    "ml": 1, "milliliter": 1, "milliliters": 1, "millilitre": 1, "millilitres": 1,
+    "l": 1000, "liter": 1000, "liters": 1000, "litre": 1000, "litres": 1000,
+    "cup": 240, "cups": 240, "glass": 240, "glasses": 240, "mug": 300, "mugs": 300,
+    "bowl": 300, "bowls": 300, "can": 355, "cans": 355, "bottle": 500, "bottles": 500,
+    "tbsp": 15, "tablespoon": 15, "tablespoons": 15,
+    "tsp": 5, "teaspoon": 5, "teaspoons": 5,
+}
+_PIECE_UNITS = {
+    "piece", "pieces", "pc", "pcs", "slice", "slices", "scoop", "scoops",
+    "strip", "strips", "rasher", "rashers", "fillet", "fillets", "bar", "bars",
+    "link", "links",
+}
+_SERVING_UNITS = {"serving", "servings", "portion", "portions", "plate", "plates", "helping", "helpings"}
+_SIZE_FACTORS = {"small": 0.75, "medium": 1.0, "regular": 1.0, "large": 1.3, "big": 1.3, "jumbo": 1.5}
+# Words that don't change what the food is
+_FILLER_WORDS = {"of", "the", "some", "fresh", "plain", "homemade", "organic", "ripe", "my"}
+
+_SPLIT_RE = re.compile(r"([,;+&\n]|\band\b|\bwith\b|\bplus\b)", re.IGNORECASE)
+_NUMBER_RE = re.compile(r"^\d+(?:\.\d+)?$")
+
+# Confidence multipliers for guesses about the portion size
+_UNKNOWN_PORTION = 0.9
+# "coffee with milk": a full serving of milk would be a poor guess
+_UNQUANTIFIED_SIDE = 0.75
+
+
+def _is_unit(word: str) -> bool:
+    return (
+        word in _MASS_UNITS or word in _VOLUME_UNITS
+        or word in _PIECE_UNITS or word in _SERVING_UNITS
+    )
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _singular(word: str) -> str:
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def build_table(directory: Path = NUTRIENT_TABLE_DIR) -> int:
+    """Compile foods.csv into the memory-mapped table and its name index"""
+    with open(directory / SOURCE_FILE, newline="") as f:
+        rows = list(csv.DictReader(f))
+
+    values = array("f")
+    foods = []
+    for row in rows:
+        values.extend(float(row[column] or 0) for column in COLUMNS)
+        aliases = [alias for alias in row["aliases"].split("|") if alias]
+        foods.append([row["name"], aliases])
+
+    table_path = directory / TABLE_FILE
+    with open(table_path.with_suffix(".tmp"), "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(rows), len(COLUMNS)))
+        values.tofile(f)
+    index_path = directory / INDEX_FILE
+    with open(index_path.with_suffix(".tmp"), "w") as f:
+        json.dump({"columns": COLUMNS, "byteorder": sys.byteorder, "foods": foods}, f)
+    os.replace(table_path.with_suffix(".tmp"), table_path)
+    os.replace(index_path.with_suffix(".tmp"), index_path)
+    return len(rows)
+
+
+def _is_stale(directory: Path) -> bool:
+    table_path, index_path = directory / TABLE_FILE, directory / INDEX_FILE
+    if not table_path.exists() or not index_path.exists():
+        return True
+    source_mtime = (directory / SOURCE_FILE).stat().st_mtime
+    if min(table_path.stat().st_mtime, index_path.stat().st_mtime) < source_mtime:
+        return True
+    with open(index_path) as f:
+        index = json.load(f)
+    return index["byteorder"] != sys.byteorder or tuple(index["columns"]) != COLUMNS
+
+
+class NutrientEngine:
+    """Food composition table with quantity parsing and fuzzy name matching"""
+
+    def __init__(self, directory: Path = NUTRIENT_TABLE_DIR):
+        if _is_stale(directory):
+            build_table(directory)
+
+        with open(directory / INDEX_FILE) as f:
+            foods = json.load(f)["foods"]
+        with open(directory / TABLE_FILE, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, _, self._width = _HEADER.unpack_from(self._mmap)
+        self._values = memoryview(self._mmap)[_HEADER.size:].cast("f")
+
+        self.names: List[str] = [name for name, _ in foods]
+        # Every name and alias maps to its table row
+        self._exact: Dict[str, int] = {}
+        self._alias_rows: List[int] = []
+        self._alias_sizes: List[int] = []
+        self._trigram_index: Dict[str, List[int]] = {}
+        for row, (name, aliases) in enumerate(foods):
+            for alias in [name] + aliases:
+                alias = normalize_description(alias)
+                self._exact.setdefault(alias, row)
+                alias_id = len(self._alias_rows)
+                self._alias_rows.append(row)
+                grams = _trigrams(alias)
+                self._alias_sizes.append(len(grams))
+                for gram in grams:
+                    self._trigram_index.setdefault(gram, []).append(alias_id)
+
+        # Multi-word names containing a separator ("mac and cheese") must not be split
+        self._joined = sorted(
+            (alias for alias in self._exact if _SPLIT_RE.search(alias)), key=len, reverse=True
+        )
+
+    def value(self, row: int, column: int) -> float:
+        return self._values[row * self._width + column]
+
+    def match(self, phrase: str) -> Tuple[Optional[int], float]:
+        """Table row for a food name and how confident the match is (0-1)"""
+        if not phrase:
+            return None, 0.0
+        row = self._exact.get(phrase)
+        if row is None:
+            row = self._exact.get(" ".join(_singular(word) for word in phrase.split()))
+        if row is not None:
+            return row, 1.0
+
+        # Dice coefficient over character trigrams, scored only against
+        # aliases sharing at least one trigram
+        grams = _trigrams(phrase)
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for alias_id in self._trigram_index.get(gram, ()):
+                shared[alias_id] = shared.get(alias_id, 0) + 1
+        if not shared:
+            return None, 0.0
+        size = len(grams)
+        sizes = self._alias_sizes
+        alias_id = max(shared, key=lambda alias_id: shared[alias_id] / (size + sizes[alias_id]))
+        return self._alias_rows[alias_id], 2 * shared[alias_id] / (size + sizes[alias_id])
+
+    def _split(self, food_description: str) -> List[Tuple[str, bool]]:
+        """Normalized items, each flagged if it was introduced by "with\""""
+        text = food_description.lower()
+        for alias in self._joined:
+            text = text.replace(alias, alias.replace(" ", "_"))
+        parts = _SPLIT_RE.split(text)
+        items = []
+        # re.split with a group alternates item, separator, item, ...
+        for i in range(0, len(parts), 2):
+            item = normalize_description(parts[i]).replace("_", " ")
+            if item:
+                items.append((item, i > 0 and parts[i - 1].strip() == "with"))
+        return items
+
+    def parse_item(self, item: str, side: bool = False) -> Tuple[Optional[int], float, float]:
+        """(row, grams, confidence) for one normalized item such as "2 large eggs\""""
+        tokens = item.split()
+        quantity, explicit = 1.0, False
+        position = 0  # where a unit would follow the quantity
+        numbers = [i for i, token in enumerate(tokens) if _NUMBER_RE.match(token)]
+        if numbers:
+            start = end = position = numbers[0]
+            quantity = 0.0
+            while end < len(tokens) and _NUMBER_RE.match(tokens[end]):
+                # "1 0.5 cups" (from "1 1/2 cups") adds up
+                quantity += float(tokens[end])
+                end += 1
+            explicit = True
+            tokens = tokens[:start] + tokens[end:]
+
+        size = 1.0
+        words = []
+        for i, token in enumerate(tokens):
+            if token in _SIZE_FACTORS:
+                size = _SIZE_FACTORS[token]
+                if i < position:
+                    position -= 1
+            else:
+                words.append(token)
+
+        unit = None
+        # The rest may be a food name containing a unit word ("chocolate bar", "glass of milk")
+        row, confidence = self._exact.get(" ".join(words)), 1.0
+        if row is None:
+            if position < len(words) and _is_unit(words[position]):
+                unit = words.pop(position)
+            row, confidence = self.match(" ".join(w for w in words if w not in _FILLER_WORDS))
+            if row is None:
+                return None, 0.0, 0.0
+
+        if side and not explicit:
+            confidence *= _UNQUANTIFIED_SIDE
+
+        piece, serving, cup = (self.value(row, c) for c in (_PIECE, _SERVING, _CUP))
+        if unit in _MASS_UNITS:
+            grams = quantity * _MASS_UNITS[unit]
+        elif unit in _VOLUME_UNITS:
+            if not cup:
+                confidence *= _UNKNOWN_PORTION
+            grams = quantity * _VOLUME_UNITS[unit] * (cup / 240 if cup else 1.0) * size
+        elif unit in _SERVING_UNITS:
+            grams = quantity * serving * size
+        else:
+            # A count ("2 eggs", "1 slice"), or a single portion when no quantity is given
+            if explicit and not piece:
+                confidence *= _UNKNOWN_PORTION
+            grams = quantity * (piece or serving) * size
+        return row, grams, confidence
+
+    def analyze(self, food_description: str) -> Tuple[Dict, float]:
+        """Estimated nutrients for a description and the confidence of the weakest item"""
+        totals = dict.fromkeys(NUTRIENTS, 0.0)
+        parts = []
+        confidence = 0.0
+        for item, side in self._split(food_description):
+            row, grams, item_confidence = self.parse_item(item, side)
+            confidence = item_confidence if not parts else min(confidence, item_confidence)
+            if row is None:
+                parts.append(item)
+                continue
+            for column, nutrient in enumerate(NUTRIENTS):
+                totals[nutrient] += self.value(row, column) * grams / 100
+            parts.append(f"{self.names[row]} ({grams:.0f} g)")
+
+        result = {nutrient: round(value, 1) for nutrient, value in totals.items()}
+        result["summary"] = "Estimated from reference values: " + ", ".join(parts)
+        result["engine"] = ENGINE_LOCAL
+        return result, confidence
+
+
+_engine: Optional[NutrientEngine] = None
+# Descriptions answered locally vs handed to the LLM
+stats = {"local": 0, "fallback": 0}
+
+
+def get_engine() -> NutrientEngine:
+    global _engine
+    if _engine is None:
+        _engine = NutrientEngine()
+    return _engine
+
+
+def estimate(food_description: str) -> Optional[Dict]:
+    """
+    Nutrients computed from the local table, or None when the engine is
+    disabled or not confident enough and the LLM should be asked instead
+    """
+    if not NUTRIENT_ENGINE_ENABLED:
+        return None
+    result, confidence = get_engine().analyze(food_description)
+    if confidence < NUTRIENT_ENGINE_MIN_CONFIDENCE:
+        stats["fallback"] += 1
+        return None
+    stats["local"] += 1
+    return result
+
+
+def main(argv: List[str]) -> int:
+    if argv == ["build"]:
+        count = build_table()
+        print(f"Compiled {count} foods into {NUTRIENT_TABLE_DIR / TABLE_FILE}")
+        return 0
+    if not argv:
+        print("usage: python -m services.nutrient_engine build | <food description>")
+        return 2
+    result, confidence = get_engine().analyze(" ".join(argv))
+    print(json.dumps({**result, "confidence": round(confidence, 3)}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
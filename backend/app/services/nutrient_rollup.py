@@ -0,0 +1,181 @@
+"""
+Incrementally maintained per-(user, date) nutrient totals.
+
+Every write that changes a day's totals applies a delta to
+daily_nutrient_totals in the same transaction, so reads are a primary-key
+lookup. The rollup can be rebuilt from scratch and checked against a full
+recompute:
+
+    python -m services.nutrient_rollup rebuild
+    python -m services.nutrient_rollup check
+"""
+import asyncio
+import sys
+import datetime as dt
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from database import dialect_insert
+
+NUTRIENT_FIELDS = ("calories", "protein", "carbs", "fats", "fiber")
+COUNT_FIELDS = ("log_count", "analysis_count")
+
+# Floating point drift tolerated by the consistency checker
+TOLERANCE = 0.01
+
+
+async def apply_delta(db: AsyncSession, user_id: int, date: dt.date, **delta):
+    """Add delta to the (user_id, date) totals, creating the row if needed"""
+    values = {field: delta.get(field, 0) for field in NUTRIENT_FIELDS + COUNT_FIELDS}
+    table = models.DailyNutrientTotal
+    stmt = dialect_insert(db, table).values(user_id=user_id, date=date, **values)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "date"],
+        set_={field: getattr(table, field) + stmt.excluded[field] for field in values},
+    ))
+
+
+async def apply_deltas(db: AsyncSession, user_id: int, deltas: Dict[dt.date, Dict]):
+    """apply_delta for many dates of one user, as a single executemany"""
+    if not deltas:
+        return
+    fields = NUTRIENT_FIELDS + COUNT_FIELDS
+    table = models.DailyNutrientTotal
+    stmt = dialect_insert(db, table)
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["user_id", "date"],
+            set_={field: getattr(table, field) + stmt.excluded[field] for field in fields},
+        ),
+        [
+            {"user_id": user_id, "date": day, **{field: delta.get(field, 0) for field in fields}}
+            for day, delta in deltas.items()
+        ],
+    )
+
+
+def _analysis_delta(analysis: Optional[models.FoodAnalysis], sign: int) -> Dict:
+    if analysis is None:
+        return {}
+    delta = {field: sign * (getattr(analysis, field) or 0) for field in NUTRIENT_FIELDS}
+    delta["analysis_count"] = sign
+    return delta
+
+
+async def log_added(db: AsyncSession, food_log: models.FoodLog):
+    await apply_delta(db, food_log.user_id, food_log.date, log_count=1)
+
+
+async def analysis_added(db: AsyncSession, food_log: models.FoodLog, analysis: models.FoodAnalysis):
+    await apply_delta(db, food_log.user_id, food_log.date, **_analysis_delta(analysis, 1))
+
+
+async def log_removed(db: AsyncSession, food_log: models.FoodLog, analysis: Optional[models.FoodAnalysis]):
+    await apply_delta(db, food_log.user_id, food_log.date, log_count=-1, **_analysis_delta(analysis, -1))
+
+
+async def log_moved(
+    db: AsyncSession,
+    food_log: models.FoodLog,
+    old_date: dt.date,
+    analysis: Optional[models.FoodAnalysis]
+):
+    """Move a log's contribution from old_date to its current date"""
+    if old_date == food_log.date:
+        return
+    await apply_delta(db, food_log.user_id, old_date, log_count=-1, **_analysis_delta(analysis, -1))
+    await apply_delta(db, food_log.user_id, food_log.date, log_count=1, **_analysis_delta(analysis, 1))
+
+
+def _recompute_query(user_id: Optional[int] = None):
+    query = select(
+        models.FoodLog.user_id,
+        models.FoodLog.date,
+        *[
+            func.coalesce(func.sum(getattr(models.FoodAnalysis, field)), 0).label(field)
+            for field in NUTRIENT_FIELDS
+        ],
+        func.count(models.FoodLog.id).label("log_count"),
+        func.count(models.FoodAnalysis.id).label("analysis_count")
+    ).outerjoin(
+        models.FoodAnalysis, models.FoodAnalysis.food_log_id == models.FoodLog.id
+    )
+    if user_id is not None:
+        query = query.where(models.FoodLog.user_id == user_id)
+    return query.group_by(models.FoodLog.user_id, models.FoodLog.date)
+
+
+async def rebuild(db: AsyncSession, user_id: Optional[int] = None) -> int:
+    """Recompute the rollup from food_logs/food_analyses; returns rows written"""
+    stale = delete(models.DailyNutrientTotal)
+    if user_id is not None:
+        stale = stale.where(models.DailyNutrientTotal.user_id == user_id)
+    await db.execute(stale)
+
+    rows = [row._asdict() for row in await db.execute(_recompute_query(user_id))]
+    if rows:
+        await db.execute(insert(models.DailyNutrientTotal), rows)
+    await db.commit()
+    return len(rows)
+
+
+async def check(db: AsyncSession, user_id: Optional[int] = None) -> List[Dict]:
+    """Compare the rollup against a full recompute; returns the mismatching days"""
+    expected = {
+        (row.user_id, row.date): row._asdict()
+        for row in await db.execute(_recompute_query(user_id))
+    }
+
+    actual_query = select(models.DailyNutrientTotal)
+    if user_id is not None:
+        actual_query = actual_query.where(models.DailyNutrientTotal.user_id == user_id)
+    actual = {
+        (row.user_id, row.date): {
+            field: getattr(row, field) for field in NUTRIENT_FIELDS + COUNT_FIELDS
+        }
+        for row in (await db.execute(actual_query)).scalars()
+    }
+
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        want = expected.get(key, {})
+        have = actual.get(key, {})
+        fields = [
+            field for field in NUTRIENT_FIELDS + COUNT_FIELDS
+            if abs((want.get(field) or 0) - (have.get(field) or 0)) > TOLERANCE
+        ]
+        if fields:
+            mismatches.append({
+                "user_id": key[0],
+                "date": key[1],
+                "fields": fields,
+                "expected": {field: want.get(field, 0) for field in fields},
+                "actual": {field: have.get(field, 0) for field in fields},
+            })
+    return sorted(mismatches, key=lambda m: (m["user_id"], m["date"]))
+
+
+async def main(argv: List[str]) -> int:
+    from database import SessionLocal
+
+    if len(argv) != 1 or argv[0] not in ("rebuild", "check"):
+        print("usage: python -m services.nutrient_rollup rebuild|check")
+        return 2
+
+    async with SessionLocal() as db:
+        if argv[0] == "rebuild":
+            print(f"Rebuilt {await rebuild(db)} daily totals")
+            return 0
+
+        mismatches = await check(db)
+        for mismatch in mismatches:
+            print(mismatch)
+        print(f"{len(mismatches)} mismatching days")
+        return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -0,0 +1,499 @@
+"""
+Analysis, daily summary and diet plan generation shared by the API routers
+and the background job workers
+"""
+import hashlib
+import math
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import schemas
+from database import SessionLocal, dialect_insert
+from services import ai_service, diet_prompt, nutrient_engine, nutrient_rollup
+from services.analysis_cache import analysis_cache
+from services.food_text import normalize_description
+from services.response_cache import response_cache
+from services.single_flight import SingleFlight, analysis_flights, llm_flights
+
+# Diet plan generations, keyed by (user_id, input fingerprint)
+diet_plan_flights = SingleFlight()
+# Daily summary generations, keyed by (user_id, date, input fingerprint)
+summary_flights = SingleFlight()
+
+# Daily summaries served from daily_summaries, updated from the previous
+# summary with the new logs, or generated from all of the day's logs
+summary_stats = {"cached": 0, "incremental": 0, "generated": 0, "failed": 0}
+
+DIET_PLAN_MIN_LOGS = 3
+
+
+def llm_unavailable(detail: str) -> HTTPException:
+    """
+    503 for LLM-backed work that failed (provider down, slow or circuit open).
+    Nothing is stored, so the request can simply be retried after Retry-After.
+    """
+    breaker = ai_service.llm_breaker
+    retry_after = breaker.retry_after() or breaker.open_seconds
+    return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(math.ceil(retry_after))})
+
+
+def summary_unavailable() -> HTTPException:
+    """Count a failed daily summary generation; returns the 503 to raise or stream for it"""
+    summary_stats["failed"] += 1
+    return llm_unavailable("Daily summaries are temporarily unavailable, try again later")
+
+
+async def analyze_food_log(user_id: int, food_log_id: int) -> schemas.FoodAnalysisResponse:
+    """Analyze a food log entry and extract nutritional information"""
+    # Concurrent requests for the same log (double clicks, client retries, an
+    # auto-analysis job) share one analysis
+    return await analysis_flights.do(
+        (user_id, food_log_id), lambda: _analyze_food_log_shared(user_id, food_log_id)
+    )
+
+
+async def _analyze_food_log_shared(user_id: int, food_log_id: int) -> schemas.FoodAnalysisResponse:
+    # The flight can outlive the request that started it, so it has a session
+    # of its own and hands plain data rather than rows of that session to the callers
+    async with SessionLocal() as db:
+        return schemas.FoodAnalysisResponse.model_validate(await _analyze_food_log(db, user_id, food_log_id))
+
+
+async def _analyze_food_log(db: AsyncSession, user_id: int, food_log_id: int) -> models.FoodAnalysis:
+    result = await db.execute(
+        select(models.FoodLog).where(
+            models.FoodLog.user_id == user_id,
+            models.FoodLog.id == food_log_id
+        )
+    )
+    food_log = result.scalars().first()
+
+    if not food_log:
+        raise HTTPException(status_code=404, detail="Food log not found")
+
+    # Check if analysis already exists
+    result = await db.execute(
+        select(models.FoodAnalysis).where(models.FoodAnalysis.food_log_id == food_log_id)
+    )
+    existing_analysis = result.scalars().first()
+
+    if existing_analysis:
+        return existing_analysis
+
+    # Plain descriptions ("1 banana") are computed locally; otherwise reuse an
+    # earlier analysis of the same (normalized) description
+    food_description = food_log.food_description
+    analysis_data = nutrient_engine.estimate(food_description)
+    if analysis_data is None:
+        analysis_data = await analysis_cache.get(db, food_description)
+
+    if analysis_data is None:
+        # End the read transaction, releasing the pooled connection while waiting on the LLM
+        await db.commit()
+
+        # Get AI analysis; other logs with the same description share the call
+        analysis_data = await llm_flights.do(
+            (user_id, normalize_description(food_description)),
+            lambda: ai_service.analyze_food_nutrients(food_description)
+        )
+        if analysis_data.get("failed"):
+            # Zeros would be kept as the real analysis; defer instead
+            raise llm_unavailable("Nutrient analysis is temporarily unavailable, try again later")
+        await analysis_cache.put(db, food_description, analysis_data)
+
+    await insert_analyses(db, [food_log], [analysis_data])
+    await db.commit()
+    await response_cache.invalidate(user_id)
+
+    # The stored row, which another worker may have written first
+    result = await db.execute(
+        select(models.FoodAnalysis).where(models.FoodAnalysis.food_log_id == food_log_id)
+    )
+    return result.scalars().one()
+
+
+# Rows per INSERT statement, well below SQLite's bound parameter limit
+INSERT_CHUNK_SIZE = 500
+
+
+async def insert_analyses(db: AsyncSession, food_logs: List, analyses: List[Dict]) -> Set[int]:
+    """
+    Insert one analysis per food log with ON CONFLICT (food_log_id) DO NOTHING,
+    so concurrent writers across processes can't create duplicates; the rollup
+    is only updated for rows actually inserted. Returns their food_log_ids.
+    """
+    rows = [
+        {
+            "food_log_id": food_log.id,
+            "calories": analysis_data.get("calories", 0),
+            "protein": analysis_data.get("protein", 0),
+            "carbs": analysis_data.get("carbs", 0),
+            "fats": analysis_data.get("fats", 0),
+            "fiber": analysis_data.get("fiber", 0),
+            "summary": analysis_data.get("summary", ""),
+            "engine": analysis_data.get("engine", nutrient_engine.ENGINE_LLM),
+        }
+        for food_log, analysis_data in zip(food_logs, analyses)
+    ]
+    inserted = set()
+    for i in range(0, len(rows), INSERT_CHUNK_SIZE):
+        stmt = dialect_insert(db, models.FoodAnalysis).values(rows[i:i + INSERT_CHUNK_SIZE])
+        result = await db.execute(
+            stmt.on_conflict_do_nothing(index_elements=["food_log_id"])
+            .returning(models.FoodAnalysis.food_log_id)
+        )
+        inserted.update(result.scalars())
+
+    for food_log, row in zip(food_logs, rows):
+        if food_log.id in inserted:
+            await nutrient_rollup.analysis_added(db, food_log, models.FoodAnalysis(**row))
+    return inserted
+
+
+async def load_day_logs(db: AsyncSession, user_id: int, date: date) -> List[Dict]:
+    """A day's logs with their calories, as passed to the daily summary prompt"""
+    # One joined query instead of an analysis lookup per log
+    result = await db.execute(select(
+        models.FoodLog.id,
+        models.FoodLog.meal_time,
+        models.FoodLog.time,
+        models.FoodLog.food_description,
+        models.FoodAnalysis.calories
+    ).outerjoin(
+        models.FoodAnalysis, models.FoodAnalysis.food_log_id == models.FoodLog.id
+    ).where(
+        models.FoodLog.user_id == user_id,
+        models.FoodLog.date == date
+    ).order_by(models.FoodLog.id))
+    return [
+        {
+            "id": row.id,
+            "meal_time": row.meal_time.value,
+            "time": schemas.format_time(row.time),
+            "food_description": row.food_description,
+            "calories": row.calories
+        }
+        for row in result.all()
+    ]
+
+
+def _summary_log_digest(log: Dict) -> str:
+    # Only what the summary prompt uses, so an analysis arriving later doesn't make the summary stale
+    return hashlib.sha256(
+        f"{ai_service.SUMMARY_VERSION}\n{log['meal_time']}\n{log['food_description']}".encode()
+    ).hexdigest()[:16]
+
+
+def summary_fingerprint(digests: Dict[str, str]) -> str:
+    digest = hashlib.sha256(ai_service.SUMMARY_VERSION.encode())
+    for log_id, log_digest in digests.items():
+        digest.update(f"{log_id}:{log_digest}\n".encode())
+    return digest.hexdigest()
+
+
+async def load_day_summary_inputs(
+    db: AsyncSession, user_id: int, date: date
+) -> Tuple[List[Dict], Dict[str, str], Optional[models.DailySummary]]:
+    """
+    The day's logs, a digest of each one's part of the summary prompt (by log
+    id) and the stored summary of the day, if any
+    """
+    logs = await load_day_logs(db, user_id, date)
+    digests = {str(log["id"]): _summary_log_digest(log) for log in logs}
+    stored = await db.get(models.DailySummary, (user_id, date)) if logs else None
+    return logs, digests, stored
+
+
+def stored_day_summary(stored: Optional[models.DailySummary], digests: Dict[str, str]) -> Optional[str]:
+    """The stored summary if it covers exactly the current logs"""
+    if stored is None or stored.input_fingerprint != summary_fingerprint(digests):
+        return None
+    summary_stats["cached"] += 1
+    return stored.summary
+
+
+def new_day_logs(
+    stored: Optional[models.DailySummary], logs: List[Dict], digests: Dict[str, str]
+) -> Optional[List[Dict]]:
+    """
+    The logs added since the stored summary was generated, or None if it has
+    to be regenerated from all logs: there is none, or a log it covers was
+    changed, moved to another day or deleted (or the prompt changed)
+    """
+    if stored is None:
+        return None
+    if any(digests.get(log_id) != log_digest for log_id, log_digest in stored.log_digests.items()):
+        return None
+    return [log for log in logs if str(log["id"]) not in stored.log_digests] or None
+
+
+async def save_day_summary(
+    db: AsyncSession, user_id: int, date: date, summary: str, digests: Dict[str, str], incremental: bool
+):
+    """Store a newly generated summary of the day (failed ones are raised as summary_unavailable instead)"""
+    summary_stats["incremental" if incremental else "generated"] += 1
+    values = dict(summary=summary, input_fingerprint=summary_fingerprint(digests), log_digests=digests)
+    stmt = dialect_insert(db, models.DailySummary).values(user_id=user_id, date=date, **values)
+    # Concurrent generations over different logs: the last one wins, and its
+    # fingerprint says which logs it covers
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "date"], set_={**values, "updated_at": func.now()}
+    ))
+    await db.commit()
+
+
+async def summarize_day(db: AsyncSession, user_id: int, date: date, force: bool = False) -> dict:
+    """
+    Get AI summary of all food logged for a specific date. Summaries are
+    stored per day with a fingerprint of the logs they cover: unchanged logs
+    get the stored summary back (cached=true), and logs added since are
+    folded into the previous summary instead of summarizing the whole day
+    again. force regenerates it from all logs. Raises a 503 if the LLM
+    fails, keeping the stored summary.
+    """
+    logs, digests, stored = await load_day_summary_inputs(db, user_id, date)
+    if not logs:
+        return {"summary": "No food logged for this date."}
+    if force:
+        stored = None
+
+    summary = stored_day_summary(stored, digests)
+    if summary is not None:
+        await db.commit()
+        return {"summary": summary, "date": date, "cached": True}
+
+    # Only plain data goes into the flight, which can outlive this request and its session
+    new_logs = new_day_logs(stored, logs, digests)
+    previous_summary = stored.summary if new_logs is not None else None
+
+    # End the read transaction, releasing the pooled connection while waiting on the LLM
+    await db.commit()
+    # Concurrent requests over the same logs (the frontend summarizing after each meal) share one generation
+    summary = await summary_flights.do(
+        (user_id, date, summary_fingerprint(digests)),
+        lambda: _summarize_day(user_id, date, logs, digests, new_logs, previous_summary)
+    )
+    return {"summary": summary, "date": date, "cached": False}
+
+
+async def _summarize_day(
+    user_id: int, date: date, logs: List[Dict], digests: Dict[str, str],
+    new_logs: Optional[List[Dict]], previous_summary: Optional[str]
+) -> str:
+    if new_logs is not None:
+        summary = await ai_service.summarize_daily_food(new_logs, previous_summary)
+    else:
+        summary = await ai_service.summarize_daily_food(logs)
+    if summary is None:
+        # Keep the stored summary rather than replacing it with an error message
+        raise summary_unavailable()
+    async with SessionLocal() as db:
+        await save_day_summary(db, user_id, date, summary, digests, incremental=new_logs is not None)
+    return summary
+
+
+def diet_plan_window() -> Tuple[date, date]:
+    """The last 4 days, which the diet plan is built from"""
+    end_date = datetime.now().date()
+    return end_date - timedelta(days=4), end_date
+
+
+async def diet_plan_fingerprint(db: AsyncSession, user_id: int) -> Tuple[str, int]:
+    """
+    Fingerprint of everything the diet plan prompt is built from: each log in
+    the window with its last change and the fields the prompt uses (timestamps
+    alone have second resolution on SQLite), its analysis and which engine
+    produced it, and the prompt version. Returns (fingerprint, number of logs).
+    """
+    start_date, end_date = diet_plan_window()
+    result = await db.execute(select(
+        models.FoodLog.id,
+        models.FoodLog.updated_at,
+        models.FoodLog.date,
+        models.FoodLog.meal_time,
+        models.FoodLog.food_description,
+        models.FoodAnalysis.id,
+        models.FoodAnalysis.engine,
+        models.FoodAnalysis.calories
+    ).outerjoin(
+        models.FoodAnalysis, models.FoodAnalysis.food_log_id == models.FoodLog.id
+    ).where(
+        models.FoodLog.user_id == user_id,
+        models.FoodLog.date >= start_date,
+        models.FoodLog.date <= end_date
+    ).order_by(models.FoodLog.id))
+    rows = result.all()
+
+    digest = hashlib.sha256(ai_service.DIET_PLAN_VERSION.encode())
+    for row in rows:
+        digest.update(repr(tuple(row)).encode())
+    return digest.hexdigest(), len(rows)
+
+
+def _require_diet_plan_history(log_count: int):
+    if log_count < DIET_PLAN_MIN_LOGS:
+        raise HTTPException(
+            status_code=400,
+            detail="Need at least 3 days of food logs to generate a diet plan"
+        )
+
+
+async def latest_diet_plan(db: AsyncSession, user_id: int) -> Optional[models.DietPlan]:
+    result = await db.execute(
+        select(models.DietPlan).where(
+            models.DietPlan.user_id == user_id
+        ).order_by(models.DietPlan.created_at.desc())
+    )
+    return result.scalars().first()
+
+
+async def load_diet_plan_inputs(db: AsyncSession, user_id: int) -> Tuple[List[Dict], Dict]:
+    """Food history and average nutrient totals of the last 4 days, for the diet plan prompt"""
+    start_date, end_date = diet_plan_window()
+
+    date_range = (
+        models.FoodLog.user_id == user_id,
+        models.FoodLog.date >= start_date,
+        models.FoodLog.date <= end_date
+    )
+
+    # Logs and their calories in one joined query
+    result = await db.execute(select(
+        models.FoodLog.date,
+        models.FoodLog.meal_time,
+        models.FoodLog.time,
+        models.FoodLog.food_description,
+        models.FoodAnalysis.calories
+    ).outerjoin(
+        models.FoodAnalysis, models.FoodAnalysis.food_log_id == models.FoodLog.id
+    ).where(*date_range).order_by(models.FoodLog.date, models.FoodLog.id))
+    food_logs = result.all()
+    _require_diet_plan_history(len(food_logs))
+
+    # Group logs by date
+    logs_by_date = {}
+    for log in food_logs:
+        logs_by_date.setdefault(log.date, []).append({
+            "meal_time": log.meal_time.value,
+            "time": schemas.format_time(log.time),
+            "food_description": log.food_description,
+            "calories": log.calories
+        })
+
+    # Per-day totals come from the incrementally maintained rollup
+    result = await db.execute(
+        select(models.DailyNutrientTotal).where(
+            models.DailyNutrientTotal.user_id == user_id,
+            models.DailyNutrientTotal.date >= start_date,
+            models.DailyNutrientTotal.date <= end_date,
+            models.DailyNutrientTotal.log_count > 0
+        )
+    )
+    daily_totals = {day.date: day for day in result.scalars().all()}
+
+    # Averages per day with analyzed meals, so unanalyzed days don't drag them down
+    analyzed_days = [day for day in daily_totals.values() if day.analysis_count]
+    nutrient_totals = {
+        f"avg_{field}": sum(getattr(day, field) for day in analyzed_days) / len(analyzed_days)
+        for field in diet_prompt.MACROS
+    } if analyzed_days else {}
+
+    # Prepare history for AI, with each day's precomputed macros
+    food_history = [
+        {
+            "date": date,
+            "logs": logs,
+            "totals": {
+                field: getattr(daily_totals[date], field) for field in diet_prompt.MACROS
+            } if date in daily_totals and daily_totals[date].analysis_count else None
+        }
+        for date, logs in logs_by_date.items()
+    ]
+    return food_history, nutrient_totals
+
+
+async def save_diet_plan(
+    db: AsyncSession, user_id: int, recommendations: Dict, input_fingerprint: Optional[str] = None
+) -> models.DietPlan:
+    """Store recommendations as the user's diet plan, replacing the previous one"""
+    existing_plan = await latest_diet_plan(db, user_id)
+
+    if existing_plan:
+        existing_plan.recommendations = recommendations
+        existing_plan.input_fingerprint = input_fingerprint
+        await db.commit()
+        await response_cache.invalidate(user_id)
+        await db.refresh(existing_plan)
+        return existing_plan
+    else:
+        db_plan = models.DietPlan(
+            user_id=user_id,
+            recommendations=recommendations,
+            input_fingerprint=input_fingerprint
+        )
+        db.add(db_plan)
+        await db.commit()
+        await response_cache.invalidate(user_id)
+        await db.refresh(db_plan)
+        return db_plan
+
+
+async def cached_diet_plan(db: AsyncSession, user_id: int) -> Tuple[Optional[models.DietPlan], str]:
+    """
+    The latest plan if it was built from exactly the current inputs, and the
+    current input fingerprint. Raises 400 if there isn't enough history.
+    """
+    fingerprint, log_count = await diet_plan_fingerprint(db, user_id)
+    _require_diet_plan_history(log_count)
+    plan = await latest_diet_plan(db, user_id)
+    if plan and plan.input_fingerprint == fingerprint:
+        return plan, fingerprint
+    return None, fingerprint
+
+
+async def generate_diet_plan(
+    db: AsyncSession, user_id: int, force: bool = False
+) -> schemas.DietPlanResponse:
+    """
+    Generate a personalized diet plan based on 3-4 days of food logs. Unless
+    forced, the stored plan is returned as is (cached=true) when none of its
+    inputs changed since it was generated.
+    """
+    plan, fingerprint = await cached_diet_plan(db, user_id)
+    if plan and not force:
+        return schemas.DietPlanResponse.model_validate(plan).model_copy(update={"cached": True})
+
+    # End the read transaction, releasing the pooled connection while waiting on the LLM
+    await db.commit()
+    # Concurrent requests over the same inputs share one generation
+    return await diet_plan_flights.do(
+        (user_id, fingerprint), lambda: _generate_diet_plan_shared(user_id, fingerprint)
+    )
+
+
+async def _generate_diet_plan_shared(user_id: int, fingerprint: str) -> schemas.DietPlanResponse:
+    # Like _analyze_food_log_shared: a session of its own, and plain data for the callers
+    async with SessionLocal() as db:
+        return schemas.DietPlanResponse.model_validate(await _generate_diet_plan(db, user_id, fingerprint))
+
+
+async def _generate_diet_plan(db: AsyncSession, user_id: int, fingerprint: str) -> models.DietPlan:
+    food_history, nutrient_totals = await load_diet_plan_inputs(db, user_id)
+
+    # End the read transaction, releasing the pooled connection while waiting on the LLM
+    await db.commit()
+
+    # Generate recommendations using AI
+    recommendations = await ai_service.generate_diet_recommendations(
+        food_history, nutrient_totals
+    )
+    if recommendations.get("failed"):
+        # Keep the previous plan rather than replacing it with an error message
+        raise llm_unavailable("Diet plan generation is temporarily unavailable, try again later")
+
+    return await save_diet_plan(db, user_id, recommendations, fingerprint)
@@ -0,0 +1,128 @@
+"""
+Optional hash partitioning of the per-user tables by user_id (PostgreSQL).
+
+food_logs and daily_nutrient_totals are rebuilt as PARTITION BY HASH
+(user_id) tables with --partitions partitions. Every hot query filters on
+user_id, so the planner prunes to a single partition and each partition's
+ix_food_logs_user_date stays small enough to be cached; vacuum and index
+maintenance also work partition by partition.
+
+On a partitioned table the primary key has to include user_id, so
+food_logs' becomes (user_id, id) (ids still come from the same sequence)
+and the foreign key from food_analyses.food_log_id is dropped: the API
+already deletes analyses explicitly along with their log. food_analyses,
+diet_plans and jobs are left as they are.
+
+The rebuild copies the tables inside one transaction, holding an exclusive
+lock on them; run it in a maintenance window. Alembic migrations written
+against the unpartitioned tables may need adjusting afterwards.
+
+    python -m services.partitioning --partitions 16          # print the SQL
+    python -m services.partitioning --partitions 16 --apply  # run it
+"""
+import argparse
+import asyncio
+import sys
+from typing import List
+
+from sqlalchemy import text
+
+# Every index food_logs may have had (see migrations 0001, 0002 and 0005)
+FOOD_LOG_INDEXES = (
+    "ix_food_logs_id", "ix_food_logs_user_id", "ix_food_logs_date",
+    "ix_food_logs_meal_time", "ix_food_logs_user_date",
+)
+
+
+def _partitions(table: str, partitions: int) -> List[str]:
+    return [
+        f"CREATE TABLE {table}_p{remainder} PARTITION OF {table} "
+        f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        for remainder in range(partitions)
+    ]
+
+
+def food_logs_sql(partitions: int) -> List[str]:
+    return [
+        "ALTER TABLE food_analyses DROP CONSTRAINT IF EXISTS food_analyses_food_log_id_fkey",
+        "ALTER TABLE food_logs RENAME TO food_logs_unpartitioned",
+        "ALTER TABLE food_logs_unpartitioned RENAME CONSTRAINT food_logs_pkey TO food_logs_unpartitioned_pkey",
+        "ALTER SEQUENCE food_logs_id_seq OWNED BY NONE",
+        *(f"DROP INDEX IF EXISTS {name}" for name in FOOD_LOG_INDEXES),
+        # INCLUDING DEFAULTS keeps id's nextval('food_logs_id_seq') and created_at's now()
+        "CREATE TABLE food_logs (LIKE food_logs_unpartitioned INCLUDING DEFAULTS) PARTITION BY HASH (user_id)",
+        "ALTER TABLE food_logs ADD PRIMARY KEY (user_id, id)",
+        *_partitions("food_logs", partitions),
+        "INSERT INTO food_logs SELECT * FROM food_logs_unpartitioned",
+        "CREATE INDEX ix_food_logs_user_date ON food_logs (user_id, date, meal_time) INCLUDE (id)",
+        "ALTER SEQUENCE food_logs_id_seq OWNED BY food_logs.id",
+        "DROP TABLE food_logs_unpartitioned",
+        "ANALYZE food_logs",
+    ]
+
+
+def daily_totals_sql(partitions: int) -> List[str]:
+    return [
+        "ALTER TABLE daily_nutrient_totals RENAME TO daily_nutrient_totals_unpartitioned",
+        "ALTER TABLE daily_nutrient_totals_unpartitioned "
+        "RENAME CONSTRAINT daily_nutrient_totals_pkey TO daily_nutrient_totals_unpartitioned_pkey",
+        "CREATE TABLE daily_nutrient_totals (LIKE daily_nutrient_totals_unpartitioned INCLUDING DEFAULTS) "
+        "PARTITION BY HASH (user_id)",
+        "ALTER TABLE daily_nutrient_totals ADD PRIMARY KEY (user_id, date)",
+        *_partitions("daily_nutrient_totals", partitions),
+        "INSERT INTO daily_nutrient_totals SELECT * FROM daily_nutrient_totals_unpartitioned",
+        "DROP TABLE daily_nutrient_totals_unpartitioned",
+        "ANALYZE daily_nutrient_totals",
+    ]
+
+
+async def is_partitioned(conn, table: str) -> bool:
+    result = await conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+        {"table": table},
+    )
+    return result.first() is not None
+
+
+async def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m services.partitioning", description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--apply", action="store_true", help="run the statements instead of printing them")
+    args = parser.parse_args(argv)
+    if args.partitions < 2:
+        parser.error("--partitions must be at least 2")
+
+    statements = {
+        "food_logs": food_logs_sql(args.partitions),
+        "daily_nutrient_totals": daily_totals_sql(args.partitions),
+    }
+    if not args.apply:
+        for table, sql in statements.items():
+            print(f"-- {table}")
+            for statement in sql:
+                print(statement + ";")
+        return 0
+
+    from database import dispose_engine, get_engine
+
+    engine = get_engine()
+    if engine.dialect.name != "postgresql":
+        print("Hash partitioning needs PostgreSQL")
+        return 2
+    async with engine.begin() as conn:
+        for table, sql in statements.items():
+            if await is_partitioned(conn, table):
+                print(f"{table} is already partitioned")
+                continue
+            for statement in sql:
+                await conn.execute(text(statement))
+            print(f"Partitioned {table} into {args.partitions} partitions")
+    await dispose_engine()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -0,0 +1,284 @@
+"""
+Per-user rate limits and daily LLM budgets.
+
+Every LLM-backed endpoint belongs to an endpoint class with a token bucket
+per user: RATE_LIMIT_<CLASS>_BURST requests can be made at once, refilled at
+RATE_LIMIT_<CLASS>_PER_MINUTE. A request finding the bucket empty gets a 429
+with Retry-After set to when the next token arrives.
+
+    generate   daily summaries and diet plans (uncached LLM calls that take seconds)
+    analyze    food log analyses, single and batched
+               (a batch costs one request per LLM call it needs)
+
+A request that costs more than one may take the bucket below zero, as long
+as it wasn't empty; later requests then wait until it has refilled.
+
+On top of that, the token usage reported with each LLM response is charged
+to the user the work is for (the request's user, or the job's owner in the
+workers) and priced at LLM_PRICE_* USD per million tokens. Once a user's
+usage for the current UTC day reaches LLM_DAILY_TOKEN_BUDGET tokens or
+LLM_DAILY_COST_BUDGET USD, their LLM-backed requests get a 429 until
+midnight UTC and their queued jobs wait until then. 0 disables a limit.
+Usage is charged after each call, so concurrent calls can overshoot a
+budget by what they use.
+
+By default buckets and usage live in process, so each API worker enforces
+the limits on its own. Set RATE_LIMIT_URL (or RESPONSE_CACHE_URL) to a Redis
+server to share them across workers. If the store fails, requests are let
+through rather than rejected.
+"""
+import logging
+import math
+import os
+import time
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException
+
+from services.auth import get_current_user_id
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL") or os.getenv("RESPONSE_CACHE_URL")
+
+GENERATE = "generate"
+ANALYZE = "analyze"
+# (requests per minute, burst) per endpoint class
+RATE_LIMITS = {
+    GENERATE: (
+        float(os.getenv("RATE_LIMIT_GENERATE_PER_MINUTE", "10")),
+        int(os.getenv("RATE_LIMIT_GENERATE_BURST", "5")),
+    ),
+    ANALYZE: (
+        float(os.getenv("RATE_LIMIT_ANALYZE_PER_MINUTE", "60")),
+        int(os.getenv("RATE_LIMIT_ANALYZE_BURST", "30")),
+    ),
+}
+
+LLM_DAILY_TOKEN_BUDGET = int(os.getenv("LLM_DAILY_TOKEN_BUDGET", "0"))
+LLM_DAILY_COST_BUDGET = float(os.getenv("LLM_DAILY_COST_BUDGET", "0.50"))  # USD
+# USD per million tokens; the defaults are gpt-4o-mini's, the model every ai_service call uses
+LLM_PRICE_PROMPT = float(os.getenv("LLM_PRICE_PROMPT", "0.15"))
+LLM_PRICE_CACHED_PROMPT = float(os.getenv("LLM_PRICE_CACHED_PROMPT", "0.075"))
+LLM_PRICE_COMPLETION = float(os.getenv("LLM_PRICE_COMPLETION", "0.60"))
+
+# Costs are counted in millionths of a cent so the shared counters stay integers
+COST_UNITS_PER_USD = 100_000_000
+# Idle buckets refill to full; past this many, the full ones are dropped
+MEMORY_BUCKETS_PRUNE = 100_000
+
+# The user LLM usage in this context is charged to
+_llm_user: ContextVar[Optional[int]] = ContextVar("llm_user", default=None)
+
+Usage = Tuple[int, int]  # tokens, cost units
+
+
+class MemoryStore:
+    """Buckets and today's usage in this process"""
+
+    def __init__(self):
+        # key: (tokens, updated, when the bucket will be full again)
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._usage: Dict[str, Usage] = {}
+        self._day = None
+
+    async def take(self, key: str, per_second: float, burst: int, cost: int = 1) -> float:
+        now = time.monotonic()
+        tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+        tokens = min(burst, tokens + (now - updated) * per_second)
+        taken = tokens >= 1
+        if taken:
+            tokens -= cost
+        self._buckets[key] = (tokens, now, now + (burst - tokens) / per_second)
+        if len(self._buckets) > MEMORY_BUCKETS_PRUNE:
+            self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        return 0.0 if taken else (1 - tokens) / per_second
+
+    def _today(self, day: str):
+        if day != self._day:
+            self._usage.clear()
+            self._day = day
+
+    async def usage(self, day: str, user_id: int) -> Usage:
+        self._today(day)
+        return self._usage.get(str(user_id), (0, 0))
+
+    async def add_usage(self, day: str, user_id: int, tokens: int, cost: int):
+        self._today(day)
+        used_tokens, used_cost = self._usage.get(str(user_id), (0, 0))
+        self._usage[str(user_id)] = (used_tokens + tokens, used_cost + cost)
+
+
+# Refills and takes from a bucket atomically, on the Redis clock so workers agree
+TAKE_SCRIPT = """
+local per_second = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * per_second)
+local taken = 0
+if tokens >= 1 then
+    tokens = tokens - cost
+    taken = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((burst - tokens) / per_second) + 1)
+return {taken, tostring(tokens)}
+"""
+
+
+class RedisStore:
+    """Buckets and usage in Redis, shared by all workers"""
+
+    PREFIX = "fitbuddy:limits"
+
+    def __init__(self, url: str):
+        # Only needed with RATE_LIMIT_URL
+        import redis.asyncio as redis
+
+        self._redis = redis.Redis.from_url(url)
+        self._take = self._redis.register_script(TAKE_SCRIPT)
+
+    async def take(self, key: str, per_second: float, burst: int, cost: int = 1) -> float:
+        taken, tokens = await self._take(keys=[f"{self.PREFIX}:bucket:{key}"], args=[per_second, burst, cost])
+        if taken:
+            return 0.0
+        return (1 - float(tokens)) / per_second
+
+    def _usage_key(self, day: str, user_id: int) -> str:
+        return f"{self.PREFIX}:usage:{day}:{user_id}"
+
+    async def usage(self, day: str, user_id: int) -> Usage:
+        tokens, cost = await self._redis.hmget(self._usage_key(day, user_id), "tokens", "cost")
+        return int(tokens or 0), int(cost or 0)
+
+    async def add_usage(self, day: str, user_id: int, tokens: int, cost: int):
+        key = self._usage_key(day, user_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hincrby(key, "tokens", tokens)
+            pipe.hincrby(key, "cost", cost)
+            pipe.expire(key, 2 * 24 * 3600)
+            await pipe.execute()
+
+
+def _too_many_requests(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429, detail=detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+def _utc_day() -> Tuple[str, float]:
+    """Today's UTC date and the seconds until it ends"""
+    now = datetime.now(timezone.utc)
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), timezone.utc)
+    return now.date().isoformat(), (midnight - now).total_seconds()
+
+
+def usage_cost(usage) -> int:
+    """Price of an LLM response's usage in cost units"""
+    prompt = usage.prompt_tokens or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = min(getattr(details, "cached_tokens", None) or 0, prompt)
+    usd = (
+        (prompt - cached) * LLM_PRICE_PROMPT
+        + cached * LLM_PRICE_CACHED_PROMPT
+        + (usage.completion_tokens or 0) * LLM_PRICE_COMPLETION
+    ) / 1_000_000
+    return math.ceil(usd * COST_UNITS_PER_USD)
+
+
+class RateLimiter:
+    def __init__(self, store):
+        self.store = store
+        self.stats = {
+            "allowed": 0, "limited": 0, "over_budget": 0, "store_errors": 0,
+            "charged_tokens": 0, "charged_cost_usd": 0.0,
+        }
+
+    async def enforce(self, user_id: int, endpoint_class: str):
+        """
+        Take a request of endpoint_class from the user's bucket and check their
+        LLM budget, raising a 429 if either is exhausted. LLM usage in the
+        rest of the request is charged to the user.
+        """
+        charge_to(user_id)
+        if not RATE_LIMIT_ENABLED:
+            return
+        await self.take(user_id, endpoint_class)
+        await self.check_budget(user_id)
+        self.stats["allowed"] += 1
+
+    async def take(self, user_id: int, endpoint_class: str, cost: int = 1):
+        """Take cost requests of endpoint_class from the user's bucket, raising a 429 if it is empty"""
+        per_minute, burst = RATE_LIMITS[endpoint_class]
+        if not RATE_LIMIT_ENABLED or per_minute <= 0 or burst <= 0 or cost <= 0:
+            return
+        try:
+            retry_after = await self.store.take(f"{endpoint_class}:{user_id}", per_minute / 60, burst, cost)
+        except Exception:
+            logger.exception("Rate limit store unavailable, not limiting")
+            self.stats["store_errors"] += 1
+            retry_after = 0.0
+        if retry_after:
+            self.stats["limited"] += 1
+            raise _too_many_requests(
+                f"Too many {endpoint_class} requests, retry in {math.ceil(retry_after)}s", retry_after
+            )
+
+    async def check_budget(self, user_id: int):
+        """Raise a 429 (Retry-After at midnight UTC) once the user's LLM budget for today is used up"""
+        if not RATE_LIMIT_ENABLED or (LLM_DAILY_TOKEN_BUDGET <= 0 and LLM_DAILY_COST_BUDGET <= 0):
+            return
+        day, until_midnight = _utc_day()
+        try:
+            tokens, cost = await self.store.usage(day, user_id)
+        except Exception:
+            logger.exception("Rate limit store unavailable, not checking the LLM budget")
+            self.stats["store_errors"] += 1
+            return
+        if (0 < LLM_DAILY_TOKEN_BUDGET <= tokens) or (0 < LLM_DAILY_COST_BUDGET * COST_UNITS_PER_USD <= cost):
+            self.stats["over_budget"] += 1
+            raise _too_many_requests("Daily AI usage limit reached, try again tomorrow", until_midnight)
+
+    async def charge(self, usage):
+        """Add an LLM response's token usage to the budget of the user it is for"""
+        user_id = _llm_user.get()
+        if usage is None or user_id is None:
+            return
+        tokens = (usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+        cost = usage_cost(usage)
+        self.stats["charged_tokens"] += tokens
+        self.stats["charged_cost_usd"] += cost / COST_UNITS_PER_USD
+        try:
+            await self.store.add_usage(_utc_day()[0], user_id, tokens, cost)
+        except Exception:
+            logger.exception("Could not charge LLM usage to user %s", user_id)
+            self.stats["store_errors"] += 1
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "charged_cost_usd": round(self.stats["charged_cost_usd"], 6)}
+
+
+def charge_to(user_id: int):
+    """Charge LLM usage in the current context (request or job) to user_id"""
+    _llm_user.set(user_id)
+
+
+def rate_limited(endpoint_class: str) -> Callable:
+    """FastAPI dependency: the current user's id, after enforcing the endpoint class's limits"""
+
+    async def dependency(user_id: int = Depends(get_current_user_id)) -> int:
+        await rate_limiter.enforce(user_id, endpoint_class)
+        return user_id
+
+    return dependency
+
+
+rate_limiter = RateLimiter(RedisStore(RATE_LIMIT_URL) if RATE_LIMIT_URL else MemoryStore())
@@ -0,0 +1,125 @@
+"""
+Readiness checks behind /ready.
+
+/health is the liveness check: it touches nothing, so a slow database never
+gets a working process restarted. /ready tells a load balancer whether this
+instance should get traffic:
+
+- database: a SELECT 1 answers within READY_TIMEOUT
+- schema: the database is migrated to this code's Alembic head (the API
+  doesn't create or change tables itself)
+- replica: with DATABASE_REPLICA_URL, a SELECT 1 on the read replica. Only
+  reported: reads fall back to the primary while it is unreachable
+- llm: the provider answers GET /models within READY_TIMEOUT. It is probed
+  at most every READY_LLM_INTERVAL seconds, and not at all while the circuit
+  breaker is open. A failure only makes the instance unready with
+  READY_REQUIRE_LLM=true: without the LLM the API still serves food logs,
+  cached and local analyses and defers the rest (see the README's LLM outages).
+  Otherwise the probe runs in the background and /ready reports its last result
+"""
+import asyncio
+import os
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, FrozenSet, Optional, Tuple
+
+from sqlalchemy import text
+
+from database import get_engine, get_replica_engine
+from services import ai_service
+from services.circuit_breaker import CLOSED
+
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "2"))
+READY_LLM_INTERVAL = float(os.getenv("READY_LLM_INTERVAL", "60"))
+READY_REQUIRE_LLM = os.getenv("READY_REQUIRE_LLM", "false").lower() == "true"
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+
+_llm_result: Optional[Dict] = None
+_llm_checked_at = 0.0
+_llm_probe: Optional[asyncio.Task] = None
+
+
+@lru_cache(maxsize=None)
+def schema_heads() -> FrozenSet[str]:
+    """Head revisions of the migrations shipped with this code"""
+    from alembic.script import ScriptDirectory
+
+    return frozenset(ScriptDirectory(str(MIGRATIONS_DIR)).get_heads())
+
+
+async def check_database(engine=None) -> Optional[str]:
+    async with (engine or get_engine()).connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    return None
+
+
+async def check_schema() -> Optional[str]:
+    async with get_engine().connect() as conn:
+        try:
+            current = set((await conn.execute(text("SELECT version_num FROM alembic_version"))).scalars())
+        except Exception:
+            raise RuntimeError("not migrated, run alembic upgrade head")
+    # Loading the migrations (and openai below) the first time takes a while; keep it off the event loop
+    heads = await asyncio.to_thread(schema_heads)
+    if current != heads:
+        found = ", ".join(sorted(current)) or "none"
+        raise RuntimeError(f"at {found}, expected {', '.join(sorted(heads))}; run alembic upgrade head")
+    return ", ".join(sorted(current))
+
+
+async def check_llm() -> Optional[str]:
+    if ai_service.llm_breaker.state != CLOSED:
+        raise RuntimeError(f"circuit {ai_service.llm_breaker.state}")
+    client = await asyncio.to_thread(ai_service.get_client)
+    await client.models.list()
+    return None
+
+
+async def _run(check: Callable[[], Awaitable[Optional[str]]]) -> Dict:
+    started = time.perf_counter()
+    try:
+        detail = await asyncio.wait_for(check(), READY_TIMEOUT)
+        result = {"ok": True}
+    except Exception as e:
+        detail = str(e) or type(e).__name__
+        result = {"ok": False}
+    if detail:
+        result["detail"] = detail
+    result["ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+async def _probe_llm():
+    global _llm_result, _llm_checked_at
+    _llm_result = await _run(check_llm)
+    _llm_checked_at = time.monotonic()
+
+
+async def _llm() -> Dict:
+    """The latest LLM result; only waits for a new probe when the LLM is required"""
+    global _llm_probe
+    fresh = _llm_result is not None and ai_service.llm_breaker.state == CLOSED \
+        and time.monotonic() - _llm_checked_at < READY_LLM_INTERVAL
+    if not fresh:
+        # Concurrent readiness checks share one probe
+        if _llm_probe is None or _llm_probe.done():
+            _llm_probe = asyncio.create_task(_probe_llm())
+        if READY_REQUIRE_LLM:
+            await asyncio.shield(_llm_probe)
+    return _llm_result or {"ok": False, "detail": "not checked yet"}
+
+
+async def readiness() -> Tuple[bool, Dict[str, Dict]]:
+    """Whether the instance is ready, and the result of every check"""
+    replica_engine = get_replica_engine()
+    database, schema, llm, *replica = await asyncio.gather(
+        _run(check_database), _run(check_schema), _llm(),
+        *([_run(lambda: check_database(replica_engine))] if replica_engine is not None else []),
+    )
+    checks = {"database": database, "schema": schema, "llm": {**llm, "required": READY_REQUIRE_LLM}}
+    if replica:
+        checks["replica"] = {**replica[0], "required": False}
+    ready = database["ok"] and schema["ok"] and (llm["ok"] or not READY_REQUIRE_LLM)
+    return ready, checks
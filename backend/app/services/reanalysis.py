@@ -0,0 +1,139 @@
+"""
+Re-analysis sweep for analyses stored while the LLM was failing.
+
+Failed analyses are now deferred (see nutrition.llm_unavailable), but before
+that a failed LLM call was stored as the food log's analysis: all zeros and
+a summary starting with ai_service.ANALYSIS_FAILED_PREFIX. The sweep finds
+those rows, analyzes their food logs again (local engine, analysis cache,
+then the LLM) and replaces the values, moving the daily rollup by the
+difference. Rows are updated only while they still hold the failure, so
+concurrent sweeps don't apply a correction twice.
+
+The sweep stops at the first analysis that fails again (the LLM is down or
+the circuit breaker is open) and can be re-run until nothing is left:
+
+    python -m services.reanalysis              # fix everything
+    python -m services.reanalysis --limit 500  # at most 500 rows
+    python -m services.reanalysis --dry-run    # only count them
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from services import ai_service, nutrient_engine, nutrient_rollup
+from services.analysis_cache import analysis_cache
+from services.food_text import normalize_description
+from services.response_cache import response_cache
+from services.single_flight import llm_flights
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH_SIZE = 100
+
+
+def _failed_condition():
+    # Only the LLM path produced failure fallbacks
+    return and_(
+        models.FoodAnalysis.engine == nutrient_engine.ENGINE_LLM,
+        models.FoodAnalysis.summary.like(f"{ai_service.ANALYSIS_FAILED_PREFIX}%")
+    )
+
+
+async def count_failed(db: AsyncSession) -> int:
+    return await db.scalar(select(func.count(models.FoodAnalysis.id)).where(_failed_condition()))
+
+
+async def _analyze(db: AsyncSession, user_id: int, food_description: str) -> Dict:
+    analysis_data = nutrient_engine.estimate(food_description)
+    if analysis_data is None:
+        analysis_data = await analysis_cache.get(db, food_description)
+    if analysis_data is None:
+        # Release the connection while waiting on the LLM
+        await db.commit()
+        analysis_data = await llm_flights.do(
+            (user_id, normalize_description(food_description)),
+            lambda: ai_service.analyze_food_nutrients(food_description)
+        )
+        await analysis_cache.put(db, food_description, analysis_data)
+    return analysis_data
+
+
+async def sweep(db: AsyncSession, limit: Optional[int] = None) -> Dict[str, int]:
+    """Re-analyze failed analyses, oldest first; returns how many were fixed and how many remain"""
+    fixed = 0
+    last_id = 0
+    stopped = False
+    while not stopped and (limit is None or fixed < limit):
+        batch_size = SWEEP_BATCH_SIZE if limit is None else min(SWEEP_BATCH_SIZE, limit - fixed)
+        rows = (await db.execute(
+            select(models.FoodAnalysis, models.FoodLog).join(
+                models.FoodLog, models.FoodLog.id == models.FoodAnalysis.food_log_id
+            ).where(
+                _failed_condition(), models.FoodAnalysis.id > last_id
+            ).order_by(models.FoodAnalysis.id).limit(batch_size)
+        )).all()
+        if not rows:
+            break
+
+        for analysis, food_log in rows:
+            last_id = analysis.id
+            analysis_data = await _analyze(db, food_log.user_id, food_log.food_description)
+            if analysis_data.get("failed"):
+                logger.warning("LLM unavailable, stopping the sweep: %s", analysis_data.get("summary"))
+                stopped = True
+                break
+
+            values = {field: analysis_data.get(field, 0) for field in nutrient_rollup.NUTRIENT_FIELDS}
+            # Taken before the UPDATE, which also refreshes the loaded object
+            delta = {field: value - (getattr(analysis, field) or 0) for field, value in values.items()}
+            updated = await db.execute(
+                update(models.FoodAnalysis).where(
+                    models.FoodAnalysis.id == analysis.id, _failed_condition()
+                ).values(
+                    **values,
+                    summary=analysis_data.get("summary", ""),
+                    engine=analysis_data.get("engine", nutrient_engine.ENGINE_LLM),
+                )
+            )
+            if updated.rowcount == 1:
+                await nutrient_rollup.apply_delta(db, food_log.user_id, food_log.date, **delta)
+                fixed += 1
+            await db.commit()
+            if updated.rowcount == 1:
+                await response_cache.invalidate(food_log.user_id)
+
+    remaining = await count_failed(db)
+    await db.commit()
+    return {"fixed": fixed, "remaining": remaining}
+
+
+async def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m services.reanalysis", description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--limit", type=int, help="re-analyze at most this many rows")
+    parser.add_argument("--dry-run", action="store_true", help="only count the failed analyses")
+    args = parser.parse_args(argv)
+
+    from database import SessionLocal, dispose_engine
+
+    async with SessionLocal() as db:
+        if args.dry_run:
+            print(f"{await count_failed(db)} failed analyses")
+            return 0
+        result = await sweep(db, args.limit)
+    await dispose_engine()
+    print(f"Re-analyzed {result['fixed']} failed analyses, {result['remaining']} remaining")
+    return 1 if result["remaining"] else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -0,0 +1,247 @@
+"""
+Per-user response cache with ETag revalidation.
+
+Every user has a version counter that is bumped after each committed write
+to their data (food logs, analyses, diet plans). Cached GET responses are
+keyed by (user, version, URL) and carry an ETag derived from the same three,
+so a write makes all of the user's earlier entries and ETags unreachable at
+once and nothing has to be deleted. A request whose If-None-Match still
+matches gets a 304 and one with a cached body gets it back, in both cases
+without touching the database.
+
+The version is read before the data: a write that lands in between stores
+newer data under the older version, never older data under the newer one.
+Counters start at a random value, so a restart (or a flushed Redis) can't
+bring back a version a client has already seen.
+
+By default the counters and bodies live in process, which is only correct
+with a single API process that also runs the job workers. With several
+workers set RESPONSE_CACHE_URL to a Redis (or Redis-compatible) server so
+that they share them.
+"""
+import hashlib
+import json
+import logging
+import os
+import secrets
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+from database import session_router
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# Larger responses (long unpaginated lists) are revalidated but not stored
+RESPONSE_CACHE_MAX_BODY = int(os.getenv("RESPONSE_CACHE_MAX_BODY", str(256 * 1024)))
+
+# Response headers kept with a cached body
+STORED_HEADERS = ("content-type", "x-next-cursor")
+
+Entry = Tuple[Dict[str, str], bytes]
+
+
+def _random_version() -> int:
+    return secrets.randbits(48)
+
+
+class MemoryStore:
+    """Versions and an LRU of response bodies in this process"""
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._base = _random_version()
+        self._versions: Dict[int, int] = {}
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()
+
+    async def version(self, user_id: int) -> int:
+        return self._versions.get(user_id, self._base)
+
+    async def bump(self, user_id: int):
+        self._versions[user_id] = self._versions.get(user_id, self._base) + 1
+
+    async def get(self, key: str) -> Optional[Entry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, entry: Entry, ttl: int):
+        # Entries of old versions are never hit again and age out of the LRU
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = entry
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisStore:
+    """Versions and response bodies in Redis, shared by all workers"""
+
+    PREFIX = "fitbuddy:responses"
+
+    def __init__(self, url: str):
+        # Only needed with RESPONSE_CACHE_URL
+        import redis.asyncio as redis
+
+        self._redis = redis.Redis.from_url(url)
+
+    def _version_key(self, user_id: int) -> str:
+        return f"{self.PREFIX}:version:{user_id}"
+
+    async def version(self, user_id: int) -> int:
+        key = self._version_key(user_id)
+        value = await self._redis.get(key)
+        if value is None:
+            # Only the first of concurrent initializers wins
+            await self._redis.set(key, _random_version(), nx=True)
+            value = await self._redis.get(key)
+        return int(value)
+
+    async def bump(self, user_id: int):
+        await self._redis.incr(self._version_key(user_id))
+
+    async def get(self, key: str) -> Optional[Entry]:
+        value = await self._redis.get(f"{self.PREFIX}:body:{key}")
+        if value is None:
+            return None
+        headers, body = value.split(b"\n", 1)
+        return json.loads(headers), body
+
+    async def set(self, key: str, entry: Entry, ttl: int):
+        headers, body = entry
+        await self._redis.set(f"{self.PREFIX}:body:{key}", json.dumps(headers).encode() + b"\n" + body, ex=ttl)
+
+    def size(self) -> int:
+        return 0
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses the weak comparison: W/ prefixes are ignored"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    def __init__(self, store):
+        self.store = store
+        self.stats = {"hits": 0, "not_modified": 0, "misses": 0, "bypassed": 0, "invalidations": 0}
+
+    async def invalidate(self, user_id: int):
+        """Call after committing a change to the user's data"""
+        self.stats["invalidations"] += 1
+        # The user's next reads go to the primary: from a lagging replica they
+        # would cache the old data under the new version
+        session_router.record_write(user_id)
+        try:
+            await self.store.bump(user_id)
+        except Exception:
+            logger.exception("Could not bump the response cache version of user %s", user_id)
+
+    async def cached(
+        self, request: Request, user_id: int, load: Callable[[], Awaitable], vary: str = ""
+    ) -> Response:
+        """
+        Serve a GET endpoint's response from the cache, or build it with load():
+        a Response (bodies of StreamingResponses are captured as they are sent)
+        or a JSON-serializable result such as a pydantic model. vary is added
+        to the key of responses that depend on more than the URL and the
+        user's data, such as the current date.
+        """
+        try:
+            version = await self.store.version(user_id)
+        except Exception:
+            logger.exception("Response cache unavailable, serving uncached")
+            self.stats["bypassed"] += 1
+            return _as_response(await load())
+
+        url = request.url.path + ("?" + request.url.query if request.url.query else "")
+        digest = hashlib.sha256(f"{url}\n{vary}".encode()).hexdigest()
+        etag = f'"{version:x}-{digest[:16]}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            self.stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+
+        key = f"{user_id}:{version:x}:{digest}"
+        entry = await self._get(key)
+        if entry is not None:
+            self.stats["hits"] += 1
+            stored_headers, body = entry
+            return Response(body, headers={**stored_headers, **headers})
+
+        self.stats["misses"] += 1
+        response = _as_response(await load())
+        response.headers.update(headers)
+        if response.status_code != 200:
+            return response
+        if isinstance(response, StreamingResponse):
+            response.body_iterator = self._capture(key, response, response.body_iterator)
+        elif len(response.body) <= RESPONSE_CACHE_MAX_BODY:
+            await self._set(key, (_stored_headers(response), bytes(response.body)))
+        return response
+
+    async def _capture(self, key: str, response: StreamingResponse, body):
+        chunks, size = [], 0
+        async for chunk in body:
+            if chunks is not None:
+                size += len(chunk)
+                if size <= RESPONSE_CACHE_MAX_BODY:
+                    chunks.append(chunk)
+                else:
+                    chunks = None
+            yield chunk
+        if chunks is not None:
+            await self._set(key, (_stored_headers(response), b"".join(chunks)))
+
+    async def _get(self, key: str) -> Optional[Entry]:
+        try:
+            return await self.store.get(key)
+        except Exception:
+            logger.exception("Response cache read failed")
+            return None
+
+    async def _set(self, key: str, entry: Entry):
+        try:
+            await self.store.set(key, entry, RESPONSE_CACHE_TTL)
+        except Exception:
+            logger.exception("Response cache write failed")
+
+    def snapshot(self) -> Dict:
+        served = self.stats["hits"] + self.stats["not_modified"]
+        lookups = served + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": self.store.size(),
+            "hit_ratio": round(served / lookups, 4) if lookups else 0.0,
+        }
+
+
+def _as_response(result) -> Response:
+    if isinstance(result, Response):
+        return result
+    body = result.model_dump_json().encode() if isinstance(result, BaseModel) else to_json(result)
+    return Response(body, media_type="application/json")
+
+
+def _stored_headers(response: Response) -> Dict[str, str]:
+    return {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+
+
+response_cache = ResponseCache(RedisStore(RESPONSE_CACHE_URL) if RESPONSE_CACHE_URL else MemoryStore())
@@ -0,0 +1,51 @@
+"""
+In-process request coalescing ("single-flight").
+
+Concurrent calls with the same key share one execution: the first caller
+starts it as a task and everyone, the first caller included, awaits that
+task. The task is shielded, so a caller that goes away doesn't cancel the
+work the others are waiting for. This only deduplicates within one process;
+across workers, writes stay correct through ON CONFLICT upserts.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"started": 0, "shared": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn() unless a call for key is already in flight, and return its result"""
+        task = self._calls.get(key)
+        if task is None:
+            self.stats["started"] += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            self.stats["shared"] += 1
+        return await asyncio.shield(task)
+
+    def in_flight(self, key: Hashable) -> Optional[asyncio.Task]:
+        return self._calls.get(key)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Nobody may be left to retrieve an exception; mark it retrieved
+        if not task.cancelled():
+            task.exception()
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "in_flight": len(self._calls)}
+
+
+# Analyses of one food log, keyed by (user_id, food_log_id)
+analysis_flights = SingleFlight()
+# LLM nutrient analyses, keyed by (user_id, normalized description): a call's
+# usage is charged to the user who made it, so users don't share calls
+llm_flights = SingleFlight()
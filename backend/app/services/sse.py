@@ -0,0 +1,30 @@
+"""
+Server-Sent Events helpers for endpoints that stream LLM output.
+
+Each text delta is sent as a `data: {"delta": "..."}` event as soon as the
+model produces it; the stream ends with a single `event: done` carrying the
+final result, or `event: error` if generation could not complete.
+"""
+from typing import Any, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic_core import to_json
+
+# Proxies (nginx in particular) buffer responses by default, which would hold
+# back every event until the stream ends
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def format_event(data: Any, event: Optional[str] = None) -> bytes:
+    """Encode one SSE event; data is JSON so deltas containing newlines stay on one line"""
+    prefix = f"event: {event}\n" if event else ""
+    return prefix.encode() + b"data: " + to_json(jsonable_encoder(data)) + b"\n\n"
+
+
+def delta_event(text: str) -> bytes:
+    return format_event({"delta": text})
+
+
+def event_stream(events) -> StreamingResponse:
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
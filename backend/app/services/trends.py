@@ -0,0 +1,193 @@
+"""
+Multi-week nutrient trends computed from the daily_nutrient_totals rollup.
+
+The per-day totals for the range (plus a 30-day lookback so the first rolling
+windows are full) are loaded in one query into dense NumPy columns indexed by
+day. Rolling averages are differences of cumulative sums, streaks are run
+lengths of the logged-day mask, and the meal-time distribution is a single
+GROUP BY over the covering (user_id, date, meal_time) index.
+
+Days whose logs haven't been analyzed yet count towards streaks but are left
+out of the averages, daily series and macro ratios (as for the diet plan
+prompt), rather than counting as days with nothing eaten.
+"""
+import os
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+TRENDS_DEFAULT_DAYS = int(os.getenv("TRENDS_DEFAULT_DAYS", "90"))
+TRENDS_MAX_DAYS = int(os.getenv("TRENDS_MAX_DAYS", str(5 * 366)))
+
+NUTRIENTS = ("calories", "protein", "carbs", "fats", "fiber")
+WINDOWS = (7, 30)
+# kcal per gram
+MACRO_CALORIES = {"protein": 4, "carbs": 4, "fats": 9}
+
+
+def _nullable(values: np.ndarray) -> List[Optional[float]]:
+    """Round to 0.1 and turn NaN (no analyzed days) into null"""
+    return [None if value != value else value for value in np.round(values, 1).tolist()]
+
+
+def _rolling_mean(values: np.ndarray, analyzed: np.ndarray, window: int) -> np.ndarray:
+    """Mean over the analyzed days among the last `window` calendar days"""
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    counts = np.concatenate(([0], np.cumsum(analyzed)))
+    window_sums = sums[window:] - sums[:-window]
+    window_counts = counts[window:] - counts[:-window]
+    return np.divide(
+        window_sums, window_counts,
+        out=np.full(window_sums.shape, np.nan), where=window_counts > 0,
+    )
+
+
+def _streaks(logged: np.ndarray, start_date: date) -> Dict:
+    """Longest and current (ending on the last day) runs of consecutive logged days"""
+    edges = np.diff(np.concatenate(([0], logged.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)  # exclusive
+    if not len(starts):
+        return {"current": 0, "longest": 0, "longest_start": None, "longest_end": None}
+    lengths = ends - starts
+    best = int(np.argmax(lengths))
+    return {
+        "current": int(lengths[-1]) if ends[-1] == len(logged) else 0,
+        "longest": int(lengths[best]),
+        "longest_start": start_date + timedelta(days=int(starts[best])),
+        "longest_end": start_date + timedelta(days=int(ends[best]) - 1),
+    }
+
+
+async def _load_days(db: AsyncSession, user_id: int, first: date, end_date: date):
+    """
+    Dense per-day columns from `first` to `end_date`: the logged and analyzed
+    day masks, and the nutrient totals (zero on days without analyses)
+    """
+    result = await db.execute(
+        select(
+            models.DailyNutrientTotal.date,
+            models.DailyNutrientTotal.analysis_count,
+            *(getattr(models.DailyNutrientTotal, nutrient) for nutrient in NUTRIENTS)
+        ).where(
+            models.DailyNutrientTotal.user_id == user_id,
+            models.DailyNutrientTotal.date >= first,
+            models.DailyNutrientTotal.date <= end_date,
+            models.DailyNutrientTotal.log_count > 0
+        )
+    )
+    rows = result.all()
+
+    size = (end_date - first).days + 1
+    logged = np.zeros(size, dtype=bool)
+    analyzed = np.zeros(size, dtype=bool)
+    columns = {nutrient: np.zeros(size) for nutrient in NUTRIENTS}
+    if rows:
+        index = np.fromiter(((row.date - first).days for row in rows), dtype=np.int64, count=len(rows))
+        logged[index] = True
+        analyzed[index] = np.fromiter((row.analysis_count > 0 for row in rows), dtype=bool, count=len(rows))
+        for position, nutrient in enumerate(NUTRIENTS, start=2):
+            columns[nutrient][index] = np.fromiter(
+                (row[position] for row in rows), dtype=np.float64, count=len(rows)
+            )
+    return logged, analyzed, columns
+
+
+async def _meal_time_distribution(
+    db: AsyncSession, user_id: int, start_date: date, end_date: date
+) -> List[Dict]:
+    result = await db.execute(
+        select(
+            models.FoodLog.meal_time,
+            func.count(models.FoodLog.id).label("logs"),
+            func.coalesce(func.sum(models.FoodAnalysis.calories), 0).label("calories")
+        ).outerjoin(
+            models.FoodAnalysis, models.FoodAnalysis.food_log_id == models.FoodLog.id
+        ).where(
+            models.FoodLog.user_id == user_id,
+            models.FoodLog.date >= start_date,
+            models.FoodLog.date <= end_date
+        ).group_by(models.FoodLog.meal_time)
+    )
+    counts = {row.meal_time: (row.logs, float(row.calories)) for row in result.all()}
+    total_logs = sum(logs for logs, _ in counts.values())
+    total_calories = sum(calories for _, calories in counts.values())
+    distribution = []
+    for meal_time in models.MealTime:
+        logs, calories = counts.get(meal_time, (0, 0.0))
+        distribution.append({
+            "meal_time": meal_time.value,
+            "logs": logs,
+            "calories": round(calories, 1),
+            "log_share": round(logs / total_logs, 4) if total_logs else 0.0,
+            "calorie_share": round(calories / total_calories, 4) if total_calories else 0.0,
+            "avg_calories_per_log": round(calories / logs, 1) if logs else 0.0,
+        })
+    return distribution
+
+
+async def nutrient_trends(
+    db: AsyncSession,
+    user_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> Dict:
+    """Rolling averages, meal-time distribution, macro ratios and streaks over a date range"""
+    end_date = end_date or date.today()
+    start_date = start_date or end_date - timedelta(days=TRENDS_DEFAULT_DAYS - 1)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    days = (end_date - start_date).days + 1
+    if days > TRENDS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {TRENDS_MAX_DAYS} days")
+
+    lookback = max(WINDOWS) - 1
+    logged, analyzed, columns = await _load_days(db, user_id, start_date - timedelta(days=lookback), end_date)
+    meal_times = await _meal_time_distribution(db, user_id, start_date, end_date)
+
+    in_range = slice(lookback, None)
+    range_logged = logged[in_range]
+    range_analyzed = analyzed[in_range]
+    days_logged = int(range_logged.sum())
+    days_analyzed = int(range_analyzed.sum())
+
+    daily = {}
+    rolling = {f"rolling_{window}d": {} for window in WINDOWS}
+    averages = {}
+    for nutrient, values in columns.items():
+        daily[nutrient] = _nullable(np.where(range_analyzed, values[in_range], np.nan))
+        for window in WINDOWS:
+            # Windows ending on each day of the range
+            means = _rolling_mean(values, analyzed, window)[lookback - window + 1:]
+            rolling[f"rolling_{window}d"][nutrient] = _nullable(means)
+        total = float(values[in_range].sum())
+        averages[nutrient] = round(total / days_analyzed, 1) if days_analyzed else 0.0
+
+    macro_calories = {
+        macro: float(columns[macro][in_range][range_analyzed].sum()) * kcal for macro, kcal in MACRO_CALORIES.items()
+    }
+    macro_total = sum(macro_calories.values())
+
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "days": days,
+        "days_logged": days_logged,
+        "days_analyzed": days_analyzed,
+        "averages": averages,
+        "dates": [start_date + timedelta(days=offset) for offset in range(days)],
+        "daily": daily,
+        **rolling,
+        "macro_ratios": {
+            macro: round(value / macro_total, 4) if macro_total else 0.0
+            for macro, value in macro_calories.items()
+        },
+        "meal_times": meal_times,
+        "streaks": _streaks(range_logged, start_date),
+    }
@@ -0,0 +1,93 @@
+"""
+Shared fixtures: the API against a throwaway SQLite database migrated to
+head, with the job workers and rate limits off. The LLM endpoint points at
+a closed port, so a test that reaches it without patching ai_service fails.
+
+Run from backend/:
+    python -m pytest
+"""
+import os
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+APP_DIR = Path(__file__).resolve().parent.parent
+DB_DIR = tempfile.mkdtemp(prefix="fitbuddy-tests-")
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite+aiosqlite:///{DB_DIR}/fitbuddy.db",
+    "OPENAI_API_KEY": "test",
+    "OPENAI_BASE_URL": "http://127.0.0.1:9/v1",
+    "OPENAI_MAX_RETRIES": "0",
+    "AUTH_REQUIRED": "true",
+    "SECRET_KEY": "test-secret",
+    "JOB_WORKERS": "0",
+    "RATE_LIMIT_ENABLED": "false",
+})
+sys.path.insert(0, str(APP_DIR))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    from services import migrate
+
+    migrate.main([])
+    from main import app
+
+    return app
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    with TestClient(app) as client:
+        yield client
+
+
+def sign_up(client) -> dict:
+    """Register a new user; returns their bearer headers"""
+    credentials = {"email": f"{uuid.uuid4().hex}@example.com", "password": "correct horse battery"}
+    client.post("/api/auth/register", json=credentials).raise_for_status()
+    response = client.post(
+        "/api/auth/token", data={"username": credentials["email"], "password": credentials["password"]}
+    )
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def auth_headers(client):
+    """Bearer headers of a newly registered user, so each test starts with no data"""
+    return sign_up(client)
+
+
+@pytest.fixture
+def count_statements(client):
+    """
+    Context manager collecting the SQL statements sent to the database
+    while it is open; the app must have started so the engine exists
+    """
+    from database import get_engine
+
+    engine = get_engine().sync_engine
+
+    @contextmanager
+    def counting():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    return counting
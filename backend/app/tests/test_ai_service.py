@@ -0,0 +1,75 @@
+"""
+LLM calls are bounded by OPENAI_MAX_CONCURRENCY per worker and retried with
+backoff on transient errors; once the retries are used up the analysis is
+flagged as failed instead of raising.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from services import ai_service
+from services.circuit_breaker import CircuitBreaker
+
+ANALYSIS = {"calories": 95.0, "protein": 0.5, "carbs": 25.0, "fats": 0.3, "fiber": 4.4, "summary": "An apple"}
+
+
+class FakeCompletions:
+    """Stands in for client.chat.completions, failing the first `failures` calls"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+        self.in_flight = 0
+        self.most_in_flight = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise asyncio.TimeoutError()
+        self.in_flight += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        await asyncio.sleep(0.02)
+        self.in_flight -= 1
+        message = SimpleNamespace(content=json.dumps(ANALYSIS))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    def install(failures=0, concurrency=2):
+        fake = FakeCompletions(failures)
+        monkeypatch.setattr(ai_service, "_client", SimpleNamespace(chat=SimpleNamespace(completions=fake)))
+        monkeypatch.setattr(ai_service, "_llm_semaphore", asyncio.Semaphore(concurrency))
+        monkeypatch.setattr(ai_service, "llm_breaker", CircuitBreaker("LLM"))
+        monkeypatch.setattr(ai_service, "OPENAI_MAX_RETRIES", 2)
+        monkeypatch.setattr(ai_service, "OPENAI_BACKOFF_BASE", 0)
+        return fake
+
+    return install
+
+
+def test_calls_are_bounded_per_worker(completions):
+    fake = completions(concurrency=2)
+
+    async def analyze_many():
+        return await asyncio.gather(*(ai_service.analyze_food_nutrients("an apple") for _ in range(6)))
+
+    results = asyncio.run(analyze_many())
+    assert results == [ANALYSIS] * 6
+    assert fake.most_in_flight == 2
+
+
+def test_transient_errors_are_retried(completions):
+    fake = completions(failures=2)
+    assert asyncio.run(ai_service.analyze_food_nutrients("an apple")) == ANALYSIS
+    assert fake.calls == 3
+
+
+def test_failed_analysis_is_flagged(completions):
+    fake = completions(failures=3)
+    result = asyncio.run(ai_service.analyze_food_nutrients("an apple"))
+    assert fake.calls == 3
+    assert result["failed"] is True
+    assert result["summary"].startswith(ai_service.ANALYSIS_FAILED_PREFIX)
@@ -0,0 +1,156 @@
+"""
+Concurrent analyses of one food log share a single run, which uses its own
+session and hands every caller plain data. A user's logs with the same
+description share one LLM call, but users don't share calls. Batch analyses
+count each LLM call against the rate limit and send each description once.
+"""
+import asyncio
+import uuid
+from datetime import date
+
+import schemas
+from conftest import sign_up
+from routers import ai_analysis
+from services import ai_service, nutrition, rate_limit
+from services.single_flight import analysis_flights
+
+ANALYSIS = {"calories": 320.0, "protein": 12.0, "carbs": 40.0, "fats": 11.0, "fiber": 5.0, "summary": "Lunch"}
+
+
+def test_concurrent_analyses_share_one_run(client, auth_headers, monkeypatch):
+    calls = []
+
+    async def analyze_food_nutrients(food_description):
+        calls.append(food_description)
+        await asyncio.sleep(0.2)
+        return dict(ANALYSIS)
+
+    monkeypatch.setattr(ai_service, "analyze_food_nutrients", analyze_food_nutrients)
+    response = client.post("/api/food-logs/", headers=auth_headers, json={
+        "date": date.today().isoformat(), "meal_time": "afternoon",
+        "food_description": f"test dish {uuid.uuid4().hex}",
+    })
+    food_log = response.json()
+    shared = analysis_flights.stats["shared"]
+
+    async def analyze_twice():
+        return await asyncio.gather(*(
+            nutrition.analyze_food_log(food_log["user_id"], food_log["id"]) for _ in range(2)
+        ))
+
+    leader, follower = client.portal.call(analyze_twice)
+    assert len(calls) == 1
+    assert analysis_flights.stats["shared"] == shared + 1
+    assert isinstance(leader, schemas.FoodAnalysisResponse)
+    assert follower == leader
+    assert (leader.food_log_id, leader.calories) == (food_log["id"], 320.0)
+
+    # Served from the stored analysis afterwards
+    response = client.post("/api/ai/analyze", headers=auth_headers, json={"food_log_id": food_log["id"]})
+    assert response.status_code == 200
+    assert response.json()["id"] == leader.id
+    assert len(calls) == 1
+
+
+def test_llm_calls_are_shared_per_user(client, auth_headers, monkeypatch):
+    calls = []
+
+    async def analyze_food_nutrients(food_description):
+        calls.append(food_description)
+        await asyncio.sleep(0.2)
+        return dict(ANALYSIS)
+
+    monkeypatch.setattr(ai_service, "analyze_food_nutrients", analyze_food_nutrients)
+    description = f"test dish {uuid.uuid4().hex}"
+    food_logs = [
+        client.post("/api/food-logs/", headers=headers, json={
+            "date": date.today().isoformat(), "meal_time": "morning", "food_description": description,
+        }).json()
+        for headers in (auth_headers, auth_headers, sign_up(client))
+    ]
+
+    async def analyze_all():
+        return await asyncio.gather(*(
+            nutrition.analyze_food_log(food_log["user_id"], food_log["id"]) for food_log in food_logs
+        ))
+
+    client.portal.call(analyze_all)
+    # One call for the first user's two logs, one for the other user's
+    assert len(calls) == 2
+
+
+def test_cache_stats_need_a_user(client, auth_headers):
+    assert client.get("/api/ai/cache/stats").status_code == 401
+    response = client.get("/api/ai/cache/stats", headers=auth_headers)
+    assert response.status_code == 200
+    assert "daily_summaries" in response.json()
+
+
+def test_batch_is_charged_per_llm_call(client, auth_headers, monkeypatch):
+    in_flight = []
+    most_in_flight = 0
+
+    async def analyze_food_nutrients_batch(food_descriptions):
+        # Mangled by the model, so every item is analyzed on its own
+        return [None] * len(food_descriptions)
+
+    async def analyze_food_nutrients(food_description):
+        nonlocal most_in_flight
+        in_flight.append(food_description)
+        most_in_flight = max(most_in_flight, len(in_flight))
+        await asyncio.sleep(0.05)
+        in_flight.remove(food_description)
+        return dict(ANALYSIS)
+
+    monkeypatch.setattr(ai_service, "analyze_food_nutrients_batch", analyze_food_nutrients_batch)
+    monkeypatch.setattr(ai_service, "analyze_food_nutrients", analyze_food_nutrients)
+    monkeypatch.setattr(ai_analysis, "ANALYSIS_BATCH_SIZE", 2)
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setitem(rate_limit.RATE_LIMITS, rate_limit.ANALYZE, (1.0, 3))
+
+    today = date.today().isoformat()
+    food_log_ids = [
+        client.post("/api/food-logs/", headers=auth_headers, json={
+            "date": today, "meal_time": "evening", "food_description": f"test dish {uuid.uuid4().hex}",
+        }).json()["id"]
+        for _ in range(6)
+    ]
+
+    # 3 LLM calls use up the burst of 3
+    response = client.post("/api/ai/analyze/batch", headers=auth_headers, json={"food_log_ids": food_log_ids})
+    assert response.status_code == 200, response.text
+    assert response.json()["created"] == 6
+    assert most_in_flight > 1
+
+    response = client.post("/api/ai/analyze/batch", headers=auth_headers, json={"food_log_ids": food_log_ids})
+    assert response.status_code == 429
+
+
+def test_batch_sends_each_description_once(client, auth_headers, monkeypatch):
+    batches = []
+
+    async def analyze_food_nutrients_batch(food_descriptions):
+        batches.append(food_descriptions)
+        return [dict(ANALYSIS) for _ in food_descriptions]
+
+    monkeypatch.setattr(ai_service, "analyze_food_nutrients_batch", analyze_food_nutrients_batch)
+    token = uuid.uuid4().hex
+    today = date.today().isoformat()
+    descriptions = [f"2 Test dishes {token}!", f"two test dishes {token}", f"other dish {token}"]
+    for description in descriptions:
+        client.post("/api/food-logs/", headers=auth_headers, json={
+            "date": today, "meal_time": "evening", "food_description": description,
+        }).raise_for_status()
+
+    # A date range covers every log of the day
+    request = {"start_date": today, "end_date": today}
+    response = client.post("/api/ai/analyze/batch", headers=auth_headers, json=request)
+    assert response.status_code == 200, response.text
+    assert (response.json()["created"], response.json()["existing"]) == (3, 0)
+    # Spellings of the same meal are analyzed once, in a single LLM call
+    assert batches == [[descriptions[0], descriptions[2]]]
+
+    response = client.post("/api/ai/analyze/batch", headers=auth_headers, json=request)
+    assert (response.json()["created"], response.json()["existing"]) == (0, 3)
+    assert len(response.json()["analyses"]) == 3
+    assert len(batches) == 1
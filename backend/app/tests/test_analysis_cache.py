@@ -0,0 +1,54 @@
+"""
+Analyses are cached by normalized description, so trivially different
+spellings of a meal share one LLM call; failed analyses are never cached.
+"""
+import uuid
+from datetime import date
+
+from conftest import sign_up
+from services import ai_service
+from services.food_text import normalize_description
+
+ANALYSIS = {"calories": 155.0, "protein": 13.0, "carbs": 1.1, "fats": 11.0, "fiber": 0.0, "summary": "Eggs"}
+
+
+def test_normalize_description():
+    assert normalize_description("2 Boiled eggs!") == normalize_description("two boiled  eggs")
+    assert normalize_description("½ cup rice") == "0.5 cup rice"
+    assert normalize_description("2x 200g Chicken") == "2 200 g chicken"
+
+
+def log_and_analyze(client, headers, food_description):
+    food_log = client.post("/api/food-logs/", headers=headers, json={
+        "date": date.today().isoformat(), "meal_time": "morning", "food_description": food_description,
+    }).json()
+    return client.post("/api/ai/analyze", headers=headers, json={"food_log_id": food_log["id"]})
+
+
+def test_same_meal_is_analyzed_once(client, auth_headers, monkeypatch):
+    calls = []
+
+    async def analyze_food_nutrients(food_description):
+        calls.append(food_description)
+        return dict(ANALYSIS)
+
+    monkeypatch.setattr(ai_service, "analyze_food_nutrients", analyze_food_nutrients)
+    token = uuid.uuid4().hex
+    first = log_and_analyze(client, auth_headers, f"2 Boiled test dishes {token}!")
+    second = log_and_analyze(client, sign_up(client), f"two boiled  test dishes {token}")
+    assert first.status_code == second.status_code == 200
+    assert len(calls) == 1
+    assert second.json()["calories"] == first.json()["calories"] == 155.0
+
+
+def test_failed_analysis_is_not_cached(client, auth_headers, monkeypatch):
+    results = [{**ANALYSIS, "failed": True}, dict(ANALYSIS)]
+
+    async def analyze_food_nutrients(food_description):
+        return results.pop(0)
+
+    monkeypatch.setattr(ai_service, "analyze_food_nutrients", analyze_food_nutrients)
+    food_description = f"test dish {uuid.uuid4().hex}"
+    assert log_and_analyze(client, auth_headers, food_description).status_code == 503
+    assert log_and_analyze(client, auth_headers, food_description).status_code == 200
+    assert results == []
@@ -0,0 +1,48 @@
+"""
+Every endpoint acts for the signed-in user: other users' food logs are
+invisible (404), and requests without a valid token get a 401.
+"""
+import uuid
+from datetime import date
+
+from conftest import sign_up
+
+
+def test_food_logs_are_scoped_to_their_user(client, auth_headers):
+    body = {"date": date.today().isoformat(), "meal_time": "morning", "food_description": "toast"}
+    food_log = client.post("/api/food-logs/", headers=auth_headers, json=body).json()
+    path = f"/api/food-logs/{food_log['id']}"
+
+    other = sign_up(client)
+    assert client.get("/api/food-logs/", headers=other).json() == []
+    assert client.get(path, headers=other).status_code == 404
+    assert client.put(path, headers=other, json={**body, "food_description": "cake"}).status_code == 404
+    assert client.delete(path, headers=other).status_code == 404
+    assert client.post("/api/ai/analyze", headers=other, json={"food_log_id": food_log["id"]}).status_code == 404
+
+    response = client.get(path, headers=auth_headers)
+    assert response.json()["food_description"] == "toast"
+
+
+def test_requests_need_a_valid_token(client):
+    assert client.get("/api/food-logs/").status_code == 401
+    response = client.get("/api/food-logs/", headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 401
+
+
+def test_registration_and_sign_in(client):
+    credentials = {"email": f"{uuid.uuid4().hex}@Example.com", "password": "correct horse battery"}
+    response = client.post("/api/auth/register", json=credentials)
+    assert response.status_code == 201
+    assert response.json()["email"] == credentials["email"].lower()
+    assert client.post("/api/auth/register", json=credentials).status_code == 409
+
+    response = client.post(
+        "/api/auth/token", data={"username": credentials["email"], "password": "wrong password"}
+    )
+    assert response.status_code == 401
+    response = client.post(
+        "/api/auth/token", data={"username": credentials["email"], "password": credentials["password"]}
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/api/auth/me", headers=headers).json()["email"] == credentials["email"].lower()
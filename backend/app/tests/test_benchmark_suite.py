@@ -0,0 +1,49 @@
+"""
+The benchmark suite reads the per-route query counts from the server's own
+/metrics and compares a run with an earlier result file.
+
+Run from backend/, where the benchmarks package is importable.
+"""
+from datetime import date
+
+from benchmarks import suite
+
+
+def result(requests_per_sec, p50_ms, queries_per_request):
+    latencies = {"p50_ms": p50_ms, "p95_ms": p50_ms * 2, "p99_ms": p50_ms * 3}
+    return {
+        "meta": {"commit": "abc1234", "started_at": "2026-10-01T12:00:00+00:00"},
+        "requests_per_sec": requests_per_sec,
+        "overall": latencies,
+        "operations": {"list_food_logs": latencies},
+        "queries": {"/api/food-logs/": {"queries_per_request": queries_per_request}},
+        "memory": {"peak_rss_mb": 100.0},
+    }
+
+
+def test_metrics_delta_counts_the_requests_in_between(client, auth_headers):
+    client.post("/api/food-logs/", headers=auth_headers, json={
+        "date": date.today().isoformat(), "meal_time": "morning", "food_description": "toast",
+    }).raise_for_status()
+    before = suite.scrape(client.get("/metrics").text)
+    for _ in range(2):
+        client.get("/api/food-logs/", headers=auth_headers).raise_for_status()
+    after = suite.scrape(client.get("/metrics").text)
+
+    queries, llm = suite.metrics_delta(before, after)
+    stats = queries["/api/food-logs/"]
+    assert stats["requests"] == 2
+    assert stats["queries_per_request"] > 0
+    assert stats["db_ms_per_request"] >= 0
+    assert llm == {"calls": {}, "tokens": {}}
+
+
+def test_compare_reports_the_changes(capsys):
+    suite.compare(result(150.0, 10.0, 2.0), result(100.0, 20.0, 3.0))
+    output = capsys.readouterr().out
+    assert "abc1234" in output
+    assert "150.0 (+50%)" in output
+    assert "10.0 (-50%)" in output
+    assert "queries/request 3.0 -> 2.0" in output
+    # Peak memory is reported even when it didn't change
+    assert "100.0 (+0%)" in output
@@ -0,0 +1,98 @@
+"""
+The LLM circuit breaker opens once enough calls in its window failed or were
+slow, rejects calls while open, and closes again after a successful probe.
+While it is open analyses are deferred to a job instead of stored as zeros.
+"""
+import time
+import uuid
+from datetime import date
+
+import pytest
+
+from services import ai_service
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class ProviderError(Exception):
+    pass
+
+
+def call(breaker, fail=False, duration=0.0):
+    with breaker.call((ProviderError,)):
+        time.sleep(duration)
+        if fail:
+            raise ProviderError()
+
+
+def failing_call(breaker):
+    with pytest.raises(ProviderError):
+        call(breaker, fail=True)
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker("test", window=10, min_calls=4, failure_rate=0.5, slow_call_seconds=0.05, open_seconds=0.1)
+
+
+def test_opens_once_enough_calls_failed(breaker):
+    call(breaker)
+    call(breaker)
+    failing_call(breaker)
+    assert breaker.state == CLOSED
+    # Slow calls count as failures too
+    call(breaker, duration=0.06)
+    assert breaker.state == OPEN
+    assert breaker.retry_after() >= 1
+
+    with pytest.raises(CircuitOpenError):
+        call(breaker)
+    assert breaker.stats["rejected"] == 1
+
+
+def test_probe_closes_or_reopens(breaker):
+    for _ in range(4):
+        failing_call(breaker)
+    assert breaker.state == OPEN
+
+    time.sleep(0.1)
+    failing_call(breaker)
+    assert breaker.state == OPEN
+
+    time.sleep(0.1)
+    call(breaker)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["opened"] == 2
+
+
+def test_one_probe_at_a_time(breaker):
+    for _ in range(4):
+        failing_call(breaker)
+    time.sleep(0.1)
+    with breaker.call((ProviderError,)):
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            call(breaker)
+    assert breaker.state == CLOSED
+
+
+def test_other_errors_dont_count(breaker):
+    for _ in range(4):
+        with pytest.raises(ValueError):
+            with breaker.call((ProviderError,)):
+                raise ValueError("bad request")
+    assert breaker.state == CLOSED
+
+
+def test_open_breaker_defers_analyses(client, auth_headers, monkeypatch):
+    open_breaker = CircuitBreaker("LLM", open_seconds=30)
+    open_breaker._open("test")
+    monkeypatch.setattr(ai_service, "llm_breaker", open_breaker)
+    food_log = client.post("/api/food-logs/", headers=auth_headers, json={
+        "date": date.today().isoformat(), "meal_time": "morning", "food_description": f"test dish {uuid.uuid4().hex}",
+    }).json()
+
+    response = client.post("/api/ai/analyze", headers=auth_headers, json={"food_log_id": food_log["id"]})
+    assert response.status_code == 503
+    assert 0 < int(response.headers["Retry-After"]) <= 30
+    job = client.get(response.headers["Location"], headers=auth_headers).json()
+    assert (job["kind"], job["status"]) == ("analyze", "pending")
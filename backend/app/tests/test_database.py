@@ -0,0 +1,32 @@
+"""
+DATABASE_URL is mapped onto the asyncio drivers, and server databases get
+the tuned connection pool.
+"""
+from database import SessionLocal, TimedQueuePool, async_database_url, engine_options
+
+
+def test_urls_map_onto_async_drivers():
+    assert async_database_url("postgresql://u:p@db/fitbuddy") == "postgresql+asyncpg://u:p@db/fitbuddy"
+    assert async_database_url("postgres://u:p@db/fitbuddy") == "postgresql+asyncpg://u:p@db/fitbuddy"
+    assert async_database_url("postgresql+psycopg2://db/fitbuddy") == "postgresql+asyncpg://db/fitbuddy"
+    assert async_database_url("sqlite:///./fitbuddy.db") == "sqlite+aiosqlite:///./fitbuddy.db"
+    assert async_database_url("sqlite+aiosqlite:///x.db") == "sqlite+aiosqlite:///x.db"
+
+
+def test_pool_options():
+    options = engine_options("postgresql+asyncpg://db/fitbuddy")
+    assert options == {
+        "poolclass": TimedQueuePool,
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_timeout": 30,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+    }
+    assert engine_options("sqlite+aiosqlite:///x.db") == {"poolclass": TimedQueuePool}
+    # In-memory SQLite keeps its single connection
+    assert engine_options("sqlite+aiosqlite:///:memory:") == {}
+
+
+def test_sessions_keep_objects_usable_after_commit():
+    assert SessionLocal.kw["expire_on_commit"] is False
@@ -0,0 +1,122 @@
+"""
+The cached GET /api/diet-plan/ response is recomputed when the window of
+days the plan is built from moves, not only when the user's data changes.
+Concurrent generations over the same inputs share one run, which uses its
+own session and hands every caller plain data. Streamed plans are sent as
+delta events of the JSON text followed by the stored plan.
+"""
+import asyncio
+import json
+from datetime import date, timedelta
+
+import schemas
+from database import SessionLocal
+from services import ai_service, nutrition
+
+
+def log_three_days(client, auth_headers):
+    today = date.today()
+    for offset in range(3):
+        client.post("/api/food-logs/", headers=auth_headers, json={
+            "date": (today - timedelta(days=offset)).isoformat(),
+            "meal_time": "evening", "food_description": "rice and beans",
+        }).raise_for_status()
+    return today
+
+
+def test_stale_flag_follows_the_window(client, auth_headers, monkeypatch):
+    async def generate_diet_recommendations(food_history, nutrient_totals):
+        return {"general_recommendations": ["Eat more vegetables"]}
+
+    monkeypatch.setattr(ai_service, "generate_diet_recommendations", generate_diet_recommendations)
+    today = log_three_days(client, auth_headers)
+    client.post("/api/diet-plan/generate", headers=auth_headers).raise_for_status()
+
+    response = client.get("/api/diet-plan/", headers=auth_headers)
+    assert response.json()["stale"] is False
+
+    # A few days later the oldest logs have left the window, with nothing written since
+    later = today + timedelta(days=3)
+    monkeypatch.setattr(nutrition, "diet_plan_window", lambda: (later - timedelta(days=4), later))
+    response = client.get("/api/diet-plan/", headers=auth_headers)
+    assert response.json()["stale"] is True
+
+
+def test_concurrent_generations_share_one_run(client, auth_headers, monkeypatch):
+    calls = []
+
+    async def generate_diet_recommendations(food_history, nutrient_totals):
+        calls.append(food_history)
+        await asyncio.sleep(0.2)
+        return {"general_recommendations": ["Eat more vegetables"]}
+
+    monkeypatch.setattr(ai_service, "generate_diet_recommendations", generate_diet_recommendations)
+    log_three_days(client, auth_headers)
+    user_id = client.get("/api/food-logs/", headers=auth_headers).json()[0]["user_id"]
+
+    async def generate():
+        async with SessionLocal() as db:
+            return await nutrition.generate_diet_plan(db, user_id)
+
+    async def generate_twice():
+        return await asyncio.gather(generate(), generate())
+
+    leader, follower = client.portal.call(generate_twice)
+    assert len(calls) == 1
+    assert isinstance(leader, schemas.DietPlanResponse)
+    assert follower == leader
+    assert leader.cached is False
+
+    response = client.post("/api/diet-plan/generate", headers=auth_headers)
+    assert response.json()["id"] == leader.id
+    assert response.json()["cached"] is True
+
+
+def test_diet_plan_stream(client, auth_headers, monkeypatch):
+    plan = {"high_calorie_foods": [], "general_recommendations": ["Eat more vegetables"], "meal_timing_suggestions": ""}
+    text = json.dumps(plan)
+
+    async def stream(operation, **kwargs):
+        for i in range(0, len(text), 20):
+            yield text[i:i + 20]
+
+    monkeypatch.setattr(ai_service, "_chat_completion_stream", stream)
+    log_three_days(client, auth_headers)
+
+    response = client.post("/api/diet-plan/generate/stream", headers=auth_headers)
+    blocks = [dict(line.split(": ", 1) for line in block.splitlines()) for block in response.text.strip().split("\n\n")]
+    assert "".join(json.loads(block["data"])["delta"] for block in blocks[:-1]) == text
+    assert blocks[-1]["event"] == "done"
+    done = json.loads(blocks[-1]["data"])
+    assert done["recommendations"] == plan
+    assert client.get("/api/diet-plan/", headers=auth_headers).json()["id"] == done["id"]
+
+
+def test_plan_is_regenerated_when_its_inputs_change(client, auth_headers, monkeypatch):
+    calls = []
+
+    async def generate_diet_recommendations(food_history, nutrient_totals):
+        calls.append(food_history)
+        return {"general_recommendations": [f"Plan {len(calls)}"]}
+
+    monkeypatch.setattr(ai_service, "generate_diet_recommendations", generate_diet_recommendations)
+    today = log_three_days(client, auth_headers)
+
+    def generate(**params):
+        response = client.post("/api/diet-plan/generate", headers=auth_headers, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    assert generate()["cached"] is False
+    assert generate()["cached"] is True
+    assert len(calls) == 1
+
+    client.post("/api/food-logs/", headers=auth_headers, json={
+        "date": today.isoformat(), "meal_time": "morning", "food_description": "oatmeal",
+    }).raise_for_status()
+    assert client.get("/api/diet-plan/", headers=auth_headers).json()["stale"] is True
+    plan = generate()
+    assert (plan["cached"], plan["recommendations"]) == (False, {"general_recommendations": ["Plan 2"]})
+
+    assert generate(force="true")["cached"] is False
+    assert len(calls) == 3
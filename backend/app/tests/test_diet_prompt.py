@@ -0,0 +1,50 @@
+"""
+Diet plan prompts list each distinct food once and stay within the token
+budget by leaving out the foods with the fewest calories.
+"""
+from datetime import date, timedelta
+
+from services import diet_prompt
+
+MODEL = "gpt-4o-mini"
+
+
+def history(days=4, foods_per_day=30):
+    start = date(2026, 10, 1)
+    return [
+        {
+            "date": start + timedelta(days=offset),
+            "logs": [
+                {"meal_time": "morning", "time": None, "food_description": "2 boiled eggs", "calories": 155.0},
+                *(
+                    {
+                        "meal_time": "evening", "time": None,
+                        "food_description": f"side dish number {offset}-{i} with extra words", "calories": float(i),
+                    }
+                    for i in range(foods_per_day)
+                ),
+            ],
+            "totals": {"calories": 2000.0, "protein": 80.0, "carbs": 250.0, "fats": 60.0, "fiber": 25.0},
+        }
+        for offset in range(days)
+    ]
+
+
+def test_repeated_foods_are_listed_once():
+    prompt, _ = diet_prompt.build_user_prompt(history(foods_per_day=1), {"avg_calories": 2000.0}, MODEL)
+    foods = prompt.split("DAYS")[0]
+    assert foods.count("2 boiled eggs") == 1
+    assert "1|155|4|2 boiled eggs" in foods
+    assert prompt.endswith("AVG|2000|?|?|?|?")
+
+
+def test_prompt_fits_the_budget():
+    food_history = history()
+    full, full_tokens = diet_prompt.build_user_prompt(food_history, {}, MODEL, max_tokens=100000)
+    prompt, tokens = diet_prompt.build_user_prompt(food_history, {}, MODEL, max_tokens=full_tokens // 2)
+    assert tokens <= full_tokens // 2
+    assert tokens == diet_prompt.count_tokens(prompt, MODEL)
+    # The most significant food is kept, and every day is still there
+    assert "2 boiled eggs" in prompt
+    assert prompt.count("\n2026-10-0") == 4
+    assert "+" in prompt.split("DAYS")[1]
@@ -0,0 +1,94 @@
+"""
+Uploads are split into records as they arrive, even where a quoted CSV field
+spans lines or chunks. Imports skip and report invalid rows and commit each
+batch with its rollup deltas, so an upload that breaks off keeps the batches
+before it. Exports can be imported again.
+"""
+import asyncio
+
+import pytest
+
+from database import SessionLocal
+from services import food_log_io, nutrient_rollup
+
+CSV_UPLOAD = (
+    "date,meal_time,time,food_description\n"
+    "2026-09-01,morning,08:00,oatmeal\n"
+    "2026-09-01,evening,,\"rice, beans\"\n"
+    "not a date,morning,,toast\n"
+    "2026-09-02,afternoon,12:30,salad\n"
+)
+
+
+def user_id_of(client, headers) -> int:
+    return client.get("/api/auth/me", headers=headers).json()["id"]
+
+
+def rollup_mismatches(client, user_id):
+    async def check():
+        async with SessionLocal() as db:
+            return await nutrient_rollup.check(db, user_id)
+
+    return client.portal.call(check)
+
+
+def test_import_and_export_round_trip(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(food_log_io, "IMPORT_BATCH_SIZE", 2)
+    response = client.post(
+        "/api/food-logs/import", headers={**auth_headers, "Content-Type": "text/csv"}, content=CSV_UPLOAD
+    )
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert (result["imported"], result["skipped"]) == (3, 1)
+    assert [error["line"] for error in result["errors"]] == [4]
+    assert rollup_mismatches(client, user_id_of(client, auth_headers)) == []
+
+    exported = client.get("/api/food-logs/export", headers=auth_headers, params={"format": "ndjson"})
+    assert len(exported.text.splitlines()) == 3
+
+    response = client.post(
+        "/api/food-logs/import?format=ndjson", headers=auth_headers, content=exported.content
+    )
+    assert response.json()["imported"] == 3
+
+
+def test_broken_off_upload_keeps_committed_batches(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(food_log_io, "IMPORT_BATCH_SIZE", 2)
+    user_id = user_id_of(client, auth_headers)
+
+    async def records():
+        for line in range(1, 4):
+            yield line, {"date": "2026-09-03", "meal_time": "morning", "food_description": f"dish {line}"}, None
+        raise ConnectionResetError("client went away")
+
+    async def upload():
+        async with SessionLocal() as db:
+            await food_log_io.import_food_logs(db, user_id, records())
+
+    with pytest.raises(ConnectionResetError):
+        client.portal.call(upload)
+
+    logs = client.get("/api/food-logs/", headers=auth_headers).json()
+    assert sorted(log["food_description"] for log in logs) == ["dish 1", "dish 2"]
+    assert rollup_mismatches(client, user_id) == []
+
+
+def test_csv_records_span_chunks_and_lines():
+    body = (
+        "\ufeffDate,Meal_Time,Food_Description,Notes\n"
+        '2026-09-04,morning,"eggs,\nand ""toast""",x\n'
+        "\n"
+        '2026-09-04,evening,"soup'
+    ).encode()
+
+    async def chunks():
+        # Split mid-character and mid-record
+        for i in range(0, len(body), 7):
+            yield body[i:i + 7]
+
+    async def parse():
+        return [record async for record in food_log_io.csv_records(chunks())]
+
+    records = asyncio.run(parse())
+    record = {"date": "2026-09-04", "meal_time": "morning", "food_description": 'eggs,\nand "toast"', "notes": "x"}
+    assert records == [(2, record, None), (5, None, "Unterminated quoted field")]
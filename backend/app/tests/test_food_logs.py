@@ -0,0 +1,92 @@
+"""
+GET /api/food-logs/ pages with keyset cursors (newest date first, then meal
+time and id) and returns only the requested fields. Dates and times are
+typed columns, and a food log has at most one analysis.
+"""
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import select
+
+import models
+from database import SessionLocal
+from services import nutrition
+
+
+@pytest.fixture
+def five_logs(client, auth_headers):
+    today = date.today()
+    for offset, meal_time in [(0, "evening"), (0, "morning"), (1, "afternoon"), (1, "afternoon"), (2, "morning")]:
+        client.post("/api/food-logs/", headers=auth_headers, json={
+            "date": (today - timedelta(days=offset)).isoformat(),
+            "meal_time": meal_time, "food_description": f"meal {offset} {meal_time}",
+        }).raise_for_status()
+
+
+def test_pages_follow_the_cursor(client, auth_headers, five_logs):
+    everything = client.get("/api/food-logs/", headers=auth_headers).json()
+    assert len(everything) == 5
+    assert [log["date"] for log in everything] == sorted((log["date"] for log in everything), reverse=True)
+
+    pages = []
+    params = {"limit": 2}
+    while True:
+        response = client.get("/api/food-logs/", headers=auth_headers, params=params)
+        pages.append(response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [log for page in pages for log in page] == everything
+
+
+def test_fields_projection(client, auth_headers, five_logs):
+    response = client.get("/api/food-logs/", headers=auth_headers, params={"fields": "id,date", "limit": 1})
+    assert list(response.json()[0]) == ["id", "date"]
+
+    response = client.get("/api/food-logs/", headers=auth_headers, params={"fields": "id,calories"})
+    assert response.status_code == 400
+
+
+def test_invalid_cursor(client, auth_headers):
+    response = client.get("/api/food-logs/", headers=auth_headers, params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_dates_and_times_are_typed(client, auth_headers):
+    body = {"date": "2026-02-28", "meal_time": "morning", "time": "08:30", "food_description": "toast"}
+    response = client.post("/api/food-logs/", headers=auth_headers, json=body)
+    assert response.status_code == 200
+    assert (response.json()["date"], response.json()["time"]) == ("2026-02-28", "08:30")
+
+    for invalid in ({"date": "2026-02-30"}, {"date": "28/02/2026"}, {"time": "25:00"}):
+        response = client.post("/api/food-logs/", headers=auth_headers, json={**body, **invalid})
+        assert response.status_code == 422
+
+    # Date ranges compare dates, not strings
+    response = client.get(
+        "/api/food-logs/", headers=auth_headers, params={"start_date": "2026-02-01", "end_date": "2026-03-01"}
+    )
+    assert [log["time"] for log in response.json()] == ["08:30"]
+    response = client.get("/api/food-logs/", headers=auth_headers, params={"date": "2026-02-28", "fields": "time"})
+    assert response.json() == [{"time": "08:30"}]
+
+
+def test_one_analysis_per_food_log(client, auth_headers):
+    food_log = client.post("/api/food-logs/", headers=auth_headers, json={
+        "date": date.today().isoformat(), "meal_time": "morning", "food_description": "toast",
+    }).json()
+
+    async def insert_twice():
+        async with SessionLocal() as db:
+            log = await db.get(models.FoodLog, food_log["id"])
+            inserted = [await nutrition.insert_analyses(db, [log], [{"calories": calories}]) for calories in (1, 2)]
+            await db.commit()
+            rows = (await db.execute(
+                select(models.FoodAnalysis.calories).where(models.FoodAnalysis.food_log_id == log.id)
+            )).scalars().all()
+            return inserted, rows
+
+    inserted, rows = client.portal.call(insert_twice)
+    assert inserted == [{food_log["id"]}, set()]
+    assert rows == [1.0]
@@ -0,0 +1,58 @@
+"""
+Jobs whose lease expired are reclaimed until they have used up their
+attempts, and failed after that.
+"""
+from datetime import date, datetime, timedelta, timezone
+
+import models
+from database import SessionLocal
+from services import job_queue
+
+
+def queue_job(client, headers):
+    response = client.post("/api/jobs/", headers=headers, json={
+        "kind": "summarize", "date": date.today().isoformat()
+    })
+    assert response.status_code == 202
+    return response.json()["id"]
+
+
+def test_expired_leases(client, auth_headers):
+    retryable = queue_job(client, auth_headers)
+    exhausted = queue_job(client, auth_headers)
+    lease_start = datetime.now(timezone.utc) - timedelta(seconds=job_queue.JOB_LEASE + 60)
+
+    async def expire_and_claim():
+        async with SessionLocal() as db:
+            for job_id, attempts in ((retryable, 1), (exhausted, job_queue.JOB_MAX_ATTEMPTS)):
+                job = await db.get(models.Job, job_id)
+                job.status = models.JobStatus.RUNNING
+                job.started_at = lease_start
+                job.attempts = attempts
+            await db.commit()
+
+        claimed = []
+        while True:
+            # A fresh session per claim, as the workers do
+            async with SessionLocal() as db:
+                job = await job_queue.claim_next(db)
+            if job is None:
+                return claimed
+            claimed.append(job.id)
+
+    claimed = client.portal.call(expire_and_claim)
+    assert retryable in claimed
+    assert exhausted not in claimed
+
+    jobs = {job_id: client.get(f"/api/jobs/{job_id}", headers=auth_headers).json() for job_id in (retryable, exhausted)}
+    assert (jobs[retryable]["status"], jobs[retryable]["attempts"]) == ("running", 2)
+    assert jobs[exhausted]["status"] == "failed"
+    assert "Lease expired" in jobs[exhausted]["error"]
+    assert jobs[exhausted]["finished_at"] is not None
+
+
+def test_job_stats_are_per_user(client, auth_headers):
+    assert client.get("/api/jobs/stats").status_code == 401
+    assert client.get("/api/jobs/stats", headers=auth_headers).json() == {}
+    queue_job(client, auth_headers)
+    assert client.get("/api/jobs/stats", headers=auth_headers).json() == {"pending": 1}
@@ -0,0 +1,72 @@
+"""
+Data from before accounts existed goes to a placeholder account that can't
+sign in, until services.legacy_owner hands it to its owner.
+"""
+import asyncio
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from conftest import APP_DIR
+from services import auth
+
+PRE_USERS_REVISION = "0004_diet_plan_fingerprint"
+
+
+def run(args, env, **kwargs):
+    return subprocess.run(
+        [sys.executable, "-m", *args], cwd=APP_DIR, env=env, capture_output=True, text=True, **kwargs
+    )
+
+
+def users(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT id, email, hashed_password FROM users ORDER BY id").fetchall()
+
+
+@pytest.fixture
+def migrate_env(tmp_path):
+    db_path = tmp_path / "legacy.db"
+    return db_path, {**os.environ, "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}"}
+
+
+def test_legacy_data_is_kept_from_the_first_registrant(migrate_env):
+    db_path, env = migrate_env
+    run(["alembic", "upgrade", PRE_USERS_REVISION], env).check_returncode()
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "INSERT INTO food_logs (user_id, date, meal_time, food_description) "
+            "VALUES (1, '2026-10-01', 'MORNING', 'oatmeal')"
+        )
+    run(["alembic", "upgrade", "head"], env).check_returncode()
+
+    [(user_id, email, hashed_password)] = users(db_path)
+    assert (user_id, email) == (1, "legacy-owner@fitbuddy.invalid")
+    assert not asyncio.run(auth.verify_password("", hashed_password))
+    # The next account is a different user
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO users (email, hashed_password) VALUES ('first@example.com', 'x')")
+    assert [row[0] for row in users(db_path)] == [1, 2]
+
+    result = run(["services.legacy_owner", "first@example.com"], env, input="correct horse battery\n")
+    assert result.returncode == 1
+    assert "already registered" in result.stdout
+
+    result = run(["services.legacy_owner", "Owner@Example.com"], env, input="correct horse battery\n")
+    assert result.returncode == 0, result.stdout + result.stderr
+    user_id, email, hashed_password = users(db_path)[0]
+    assert (user_id, email) == (1, "owner@example.com")
+    assert asyncio.run(auth.verify_password("correct horse battery", hashed_password))
+
+    result = run(["services.legacy_owner", "other@example.com"], env, input="correct horse battery\n")
+    assert result.returncode == 1
+    assert "no unclaimed legacy data" in result.stdout
+
+
+def test_no_placeholder_without_legacy_data(migrate_env):
+    db_path, env = migrate_env
+    run(["alembic", "upgrade", "head"], env).check_returncode()
+    assert users(db_path) == []
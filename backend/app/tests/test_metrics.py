@@ -0,0 +1,37 @@
+"""
+/metrics exposes request latency by route template, the queries each
+request made and the in-process stats in the Prometheus text format.
+"""
+from datetime import date
+
+from prometheus_client.parser import text_string_to_metric_families
+
+
+def samples(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(response.text)
+        for sample in family.samples
+    }
+
+
+def test_requests_are_measured_by_route(client, auth_headers):
+    food_log = client.post("/api/food-logs/", headers=auth_headers, json={
+        "date": date.today().isoformat(), "meal_time": "morning", "food_description": "toast",
+    }).json()
+    route = (("method", "GET"), ("route", "/api/food-logs/{food_log_id}"), ("status", "200"))
+    count = samples(client).get(("fitbuddy_http_request_duration_seconds_count", route), 0)
+
+    client.get(f"/api/food-logs/{food_log['id']}", headers=auth_headers).raise_for_status()
+
+    after = samples(client)
+    assert after[("fitbuddy_http_request_duration_seconds_count", route)] == count + 1
+    # Labelled by template, not by the id in the path
+    assert not any(
+        dict(labels).get("route", "").endswith(str(food_log["id"])) for _, labels in after
+    )
+    assert any(name == "fitbuddy_db_queries_per_request_count" for name, _ in after)
+    assert any(name.startswith("fitbuddy_analysis_cache_") for name, _ in after)
+    assert any(name.startswith("fitbuddy_llm_breaker_") for name, _ in after)
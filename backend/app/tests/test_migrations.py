@@ -0,0 +1,137 @@
+"""
+Migrations that rewrite data on SQLite undo it on downgrade, and a database
+created by the pre-migration Base.metadata.create_all upgrades to head.
+"""
+import enum
+import os
+import sqlite3
+import subprocess
+import sys
+
+import sqlalchemy as sa
+from sqlalchemy.sql import func
+
+from conftest import APP_DIR
+
+
+def alembic(env, *args):
+    subprocess.run(
+        [sys.executable, "-m", "alembic", *args], cwd=APP_DIR, env=env, check=True, capture_output=True
+    )
+
+
+def test_typed_time_round_trip(tmp_path):
+    db_path = tmp_path / "times.db"
+    env = {**os.environ, "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}"}
+    alembic(env, "upgrade", "0001_baseline")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "INSERT INTO food_logs (user_id, date, meal_time, time, food_description) "
+            "VALUES (1, '2026-10-01', 'MORNING', '08:30', 'oatmeal')"
+        )
+
+    alembic(env, "upgrade", "0002_typed_dates_and_indexes")
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT time FROM food_logs").fetchall() == [("08:30:00",)]
+        # As SQLAlchemy writes TIME on SQLite
+        conn.execute(
+            "INSERT INTO food_logs (user_id, date, meal_time, time, food_description) "
+            "VALUES (1, '2026-10-01', 'EVENING', '19:15:00.000000', 'soup')"
+        )
+
+    alembic(env, "downgrade", "0001_baseline")
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT time FROM food_logs ORDER BY id").fetchall() == [("08:30",), ("19:15",)]
+
+
+class MealTime(str, enum.Enum):
+    MORNING = "morning"
+    AFTERNOON = "afternoon"
+    EVENING = "evening"
+
+
+def create_legacy_schema(db_path):
+    """The tables as the original models.py had Base.metadata.create_all make them"""
+    metadata = sa.MetaData()
+    sa.Table(
+        "food_logs", metadata,
+        sa.Column("id", sa.Integer, primary_key=True, index=True),
+        sa.Column("user_id", sa.Integer, index=True),
+        sa.Column("date", sa.String, index=True),
+        sa.Column("meal_time", sa.Enum(MealTime), index=True),
+        sa.Column("time", sa.String, nullable=True),
+        sa.Column("food_description", sa.Text, nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), onupdate=func.now()),
+    )
+    sa.Table(
+        "food_analyses", metadata,
+        sa.Column("id", sa.Integer, primary_key=True, index=True),
+        sa.Column("food_log_id", sa.Integer, sa.ForeignKey("food_logs.id", ondelete="CASCADE"), index=True),
+        *[sa.Column(field, sa.Float) for field in ("calories", "protein", "carbs", "fats", "fiber")],
+        sa.Column("summary", sa.Text),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=func.now()),
+    )
+    sa.Table(
+        "diet_plans", metadata,
+        sa.Column("id", sa.Integer, primary_key=True, index=True),
+        sa.Column("user_id", sa.Integer, index=True),
+        sa.Column("recommendations", sa.Text),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), onupdate=func.now()),
+    )
+    engine = sa.create_engine(f"sqlite:///{db_path}")
+    metadata.create_all(engine)
+    engine.dispose()
+
+
+def test_legacy_database_is_stamped_and_upgraded(tmp_path):
+    db_path = tmp_path / "legacy.db"
+    create_legacy_schema(db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO food_logs (id, user_id, date, meal_time, time, food_description) "
+            "VALUES (?, 1, ?, ?, ?, ?)",
+            [
+                (1, "2026-10-01", "MORNING", "08:30", "oatmeal"),
+                (2, "2026-10-01", "EVENING", "", "soup"),
+                (3, "2026-10-02", "AFTERNOON", None, "salad"),
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO food_analyses (food_log_id, calories, protein, carbs, fats, fiber) VALUES (?, ?, 10, 20, 5, 2)",
+            # Log 1 was analyzed twice; the oldest analysis is kept
+            [(1, 300.0), (1, 999.0), (2, 150.0)],
+        )
+
+    env = {**os.environ, "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}"}
+    result = subprocess.run(
+        [sys.executable, "-m", "services.migrate"], cwd=APP_DIR, env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    assert "stamping 0001_baseline" in result.stderr
+
+    with sqlite3.connect(db_path) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        indexes = {
+            row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'food_logs'"
+            )
+        }
+        assert conn.execute("SELECT version_num FROM alembic_version").fetchall() == [("0007_daily_summaries",)]
+        assert conn.execute("SELECT id, time FROM food_logs ORDER BY id").fetchall() == [
+            (1, "08:30:00"), (2, None), (3, None),
+        ]
+        totals = conn.execute(
+            "SELECT user_id, date, calories, protein, log_count, analysis_count "
+            "FROM daily_nutrient_totals ORDER BY date"
+        ).fetchall()
+        [(email,)] = conn.execute("SELECT email FROM users").fetchall()
+
+    assert tables == {
+        "alembic_version", "food_logs", "food_analyses", "diet_plans", "nutrient_cache",
+        "daily_nutrient_totals", "jobs", "users", "daily_summaries",
+    }
+    assert indexes == {"ix_food_logs_id", "ix_food_logs_user_date"}
+    assert totals == [(1, "2026-10-01", 450.0, 20.0, 2, 2), (1, "2026-10-02", 0.0, 0.0, 1, 0)]
+    assert email == "legacy-owner@fitbuddy.invalid"
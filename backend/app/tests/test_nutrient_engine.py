@@ -0,0 +1,40 @@
+"""
+Plain descriptions are estimated locally from the reference table, scaled by
+quantity and unit; anything the engine isn't sure about goes to the LLM.
+"""
+from datetime import date
+
+import pytest
+
+from services import ai_service, nutrient_engine
+
+
+def test_quantities_and_units_scale_the_estimate():
+    one = nutrient_engine.estimate("1 banana")
+    two = nutrient_engine.estimate("two bananas")
+    assert one["engine"] == nutrient_engine.ENGINE_LOCAL
+    assert two["calories"] == pytest.approx(2 * one["calories"])
+
+    per_100g = nutrient_engine.estimate("100g chicken breast")
+    assert nutrient_engine.estimate("200 g chicken breast")["protein"] == pytest.approx(2 * per_100g["protein"])
+
+
+def test_every_item_must_match():
+    items = nutrient_engine.estimate("2 boiled eggs and a slice of toast")
+    assert items["calories"] > nutrient_engine.estimate("2 boiled eggs")["calories"]
+    assert nutrient_engine.estimate("grandma's stew") is None
+    assert nutrient_engine.estimate("1 banana and grandma's stew") is None
+
+
+def test_local_estimates_skip_the_llm(client, auth_headers, monkeypatch):
+    async def analyze_food_nutrients(food_description):
+        raise AssertionError("the LLM was called")
+
+    monkeypatch.setattr(ai_service, "analyze_food_nutrients", analyze_food_nutrients)
+    food_log = client.post("/api/food-logs/", headers=auth_headers, json={
+        "date": date.today().isoformat(), "meal_time": "morning", "food_description": "1 banana",
+    }).json()
+    response = client.post("/api/ai/analyze", headers=auth_headers, json={"food_log_id": food_log["id"]})
+    assert response.status_code == 200
+    assert response.json()["engine"] == nutrient_engine.ENGINE_LOCAL
+    assert response.json()["calories"] == nutrient_engine.estimate("1 banana")["calories"]
@@ -0,0 +1,70 @@
+"""
+daily_nutrient_totals follows every food log create, analysis, date change
+and delete, and matches a full recompute after each of them.
+"""
+import uuid
+from datetime import date, timedelta
+
+from database import SessionLocal
+from services import ai_service, nutrient_rollup
+
+ANALYSIS = {"calories": 400.0, "protein": 20.0, "carbs": 50.0, "fats": 12.0, "fiber": 6.0, "summary": "Lunch"}
+
+
+def test_rollup_follows_food_log_writes(client, auth_headers, monkeypatch):
+    async def analyze_food_nutrients(food_description):
+        return dict(ANALYSIS)
+
+    monkeypatch.setattr(ai_service, "analyze_food_nutrients", analyze_food_nutrients)
+    user_id = client.get("/api/auth/me", headers=auth_headers).json()["id"]
+    today = date.today()
+    yesterday = today - timedelta(days=1)
+
+    def calories(day):
+        return client.get(f"/api/ai/nutrients/{day.isoformat()}", headers=auth_headers).json()["calories"]
+
+    def consistent():
+        async def check():
+            async with SessionLocal() as db:
+                return await nutrient_rollup.check(db, user_id)
+
+        return client.portal.call(check) == []
+
+    body = {"date": today.isoformat(), "meal_time": "afternoon", "food_description": f"test dish {uuid.uuid4().hex}"}
+    food_log_id = client.post("/api/food-logs/", headers=auth_headers, json=body).json()["id"]
+    assert consistent()
+
+    client.post("/api/ai/analyze", headers=auth_headers, json={"food_log_id": food_log_id}).raise_for_status()
+    assert calories(today) == 400.0
+    assert consistent()
+
+    # Moving the log moves its analyzed nutrients with it
+    response = client.put(
+        f"/api/food-logs/{food_log_id}", headers=auth_headers, json={**body, "date": yesterday.isoformat()}
+    )
+    response.raise_for_status()
+    assert (calories(today), calories(yesterday)) == (0.0, 400.0)
+    assert consistent()
+
+    client.delete(f"/api/food-logs/{food_log_id}", headers=auth_headers).raise_for_status()
+    assert calories(yesterday) == 0.0
+    assert consistent()
+
+
+def test_rebuild_repairs_drift(client, auth_headers):
+    user_id = client.get("/api/auth/me", headers=auth_headers).json()["id"]
+    client.post("/api/food-logs/", headers=auth_headers, json={
+        "date": date.today().isoformat(), "meal_time": "morning", "food_description": "porridge",
+    }).raise_for_status()
+
+    async def drift_and_rebuild():
+        async with SessionLocal() as db:
+            await nutrient_rollup.apply_delta(db, user_id, date.today(), log_count=5)
+            await db.commit()
+            drifted = await nutrient_rollup.check(db, user_id)
+            await nutrient_rollup.rebuild(db, user_id)
+            return drifted, await nutrient_rollup.check(db, user_id)
+
+    drifted, repaired = client.portal.call(drift_and_rebuild)
+    assert [mismatch["fields"] for mismatch in drifted] == [["log_count"]]
+    assert repaired == []
@@ -0,0 +1,114 @@
+"""
+Statements per request must not grow with the number of logs in a day.
+
+Each endpoint is called for a user with 1 and with 25 logs on each of the
+last 3 days, all analyzed, with the LLM calls patched out; the statements
+the request sends are counted and pinned. A change that loads logs or
+analyses one at a time again shows up as a count that depends on the
+number of logs.
+"""
+import uuid
+from datetime import date, timedelta
+
+import pytest
+
+from services import ai_service
+
+ANALYSIS = {"calories": 250.0, "protein": 10.0, "carbs": 30.0, "fats": 8.0, "fiber": 3.0, "summary": "A meal"}
+RECOMMENDATIONS = {"summary": "Eat more vegetables", "recommendations": []}
+
+# Statements per request, whatever the number of logs
+EXPECTED_STATEMENTS = {
+    "list": 1,
+    "analyze": 7,
+    "nutrients": 1,
+    "summarize": 3,
+    "diet_plan": 7,
+}
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    async def analyze_food_nutrients(food_description):
+        return dict(ANALYSIS)
+
+    async def analyze_food_nutrients_batch(food_descriptions):
+        return [dict(ANALYSIS) for _ in food_descriptions]
+
+    async def summarize_daily_food(food_logs, previous_summary=None):
+        return f"{len(food_logs)} meals"
+
+    async def generate_diet_recommendations(food_history, nutrient_totals):
+        return dict(RECOMMENDATIONS)
+
+    monkeypatch.setattr(ai_service, "analyze_food_nutrients", analyze_food_nutrients)
+    monkeypatch.setattr(ai_service, "analyze_food_nutrients_batch", analyze_food_nutrients_batch)
+    monkeypatch.setattr(ai_service, "summarize_daily_food", summarize_daily_food)
+    monkeypatch.setattr(ai_service, "generate_diet_recommendations", generate_diet_recommendations)
+
+
+def add_log(client, headers, day):
+    # Made-up foods, so the local nutrient engine and the analysis cache never answer
+    response = client.post("/api/food-logs/", headers=headers, json={
+        "date": day.isoformat(),
+        "meal_time": "afternoon",
+        "food_description": f"test dish {uuid.uuid4().hex}",
+    })
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+@pytest.fixture(params=[1, 25], ids=lambda n: f"{n}_logs_per_day")
+def logged_days(request, client, auth_headers, stub_llm):
+    """The last 3 days, each with the parametrized number of analyzed logs"""
+    today = date.today()
+    for offset in range(3):
+        for _ in range(request.param):
+            add_log(client, auth_headers, today - timedelta(days=offset))
+    response = client.post("/api/ai/analyze/batch", headers=auth_headers, json={
+        "start_date": (today - timedelta(days=2)).isoformat(), "end_date": today.isoformat()
+    })
+    response.raise_for_status()
+    assert response.json()["created"] == 3 * request.param
+    return today
+
+
+def count(client, count_statements, method, url, headers, **kwargs):
+    with count_statements() as statements:
+        response = client.request(method, url, headers=headers, **kwargs)
+    assert response.status_code == 200, response.text
+    return len(statements)
+
+
+def test_list_food_logs(client, auth_headers, logged_days, count_statements):
+    statements = count(
+        client, count_statements, "GET", f"/api/food-logs/?date={logged_days.isoformat()}", auth_headers
+    )
+    assert statements == EXPECTED_STATEMENTS["list"]
+
+
+def test_analyze(client, auth_headers, logged_days, count_statements):
+    food_log_id = add_log(client, auth_headers, logged_days)
+    statements = count(
+        client, count_statements, "POST", "/api/ai/analyze", auth_headers, json={"food_log_id": food_log_id}
+    )
+    assert statements == EXPECTED_STATEMENTS["analyze"]
+
+
+def test_daily_nutrients(client, auth_headers, logged_days, count_statements):
+    statements = count(
+        client, count_statements, "GET", f"/api/ai/nutrients/{logged_days.isoformat()}", auth_headers
+    )
+    assert statements == EXPECTED_STATEMENTS["nutrients"]
+
+
+def test_summarize(client, auth_headers, logged_days, count_statements):
+    statements = count(
+        client, count_statements, "POST", "/api/ai/summarize", auth_headers, json={"date": logged_days.isoformat()}
+    )
+    assert statements == EXPECTED_STATEMENTS["summarize"]
+
+
+def test_generate_diet_plan(client, auth_headers, logged_days, count_statements):
+    statements = count(client, count_statements, "POST", "/api/diet-plan/generate", auth_headers)
+    assert statements == EXPECTED_STATEMENTS["diet_plan"]
@@ -0,0 +1,71 @@
+"""
+LLM-backed endpoints take from a per-user token bucket and check the user's
+daily LLM budget; either running out gets a 429 with Retry-After.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import sign_up
+from services import rate_limit
+from services.rate_limit import ANALYZE, COST_UNITS_PER_USD, MemoryStore, rate_limiter
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setitem(rate_limit.RATE_LIMITS, ANALYZE, (1, 1))
+    monkeypatch.setattr(rate_limit, "LLM_DAILY_TOKEN_BUDGET", 1000)
+
+
+def analyze(client, headers):
+    # The limits are enforced before the (missing) food log is looked up
+    return client.post("/api/ai/analyze", headers=headers, json={"food_log_id": 0})
+
+
+def test_bucket_refills_and_allows_bursts():
+    store = MemoryStore()
+
+    async def take(cost=1):
+        return await store.take("analyze:1", per_second=10, burst=2, cost=cost)
+
+    assert asyncio.run(take()) == 0.0
+    # A costly request may take a bucket that isn't empty below zero
+    assert asyncio.run(take(cost=3)) == 0.0
+    retry_after = asyncio.run(take())
+    assert 0.2 < retry_after <= 0.3
+
+
+def test_empty_bucket_gets_429(client, limits):
+    headers = sign_up(client)
+    assert analyze(client, headers).status_code == 404
+    response = analyze(client, headers)
+    assert response.status_code == 429
+    assert 0 < int(response.headers["Retry-After"]) <= 60
+    # Buckets are per user
+    assert analyze(client, sign_up(client)).status_code == 404
+
+
+def test_used_up_budget_gets_429_until_midnight(client, limits):
+    headers = sign_up(client)
+    user_id = client.get("/api/auth/me", headers=headers).json()["id"]
+
+    async def charge():
+        rate_limit.charge_to(user_id)
+        await rate_limiter.charge(SimpleNamespace(prompt_tokens=800, completion_tokens=200))
+
+    client.portal.call(charge)
+    response = analyze(client, headers)
+    assert response.status_code == 429
+    assert "Daily AI usage limit" in response.json()["detail"]
+    assert 0 < int(response.headers["Retry-After"]) <= 24 * 3600
+
+
+def test_usage_cost():
+    usage = SimpleNamespace(
+        prompt_tokens=1_000_000, completion_tokens=1_000_000,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=500_000),
+    )
+    usd = 0.5 * rate_limit.LLM_PRICE_PROMPT + 0.5 * rate_limit.LLM_PRICE_CACHED_PROMPT + rate_limit.LLM_PRICE_COMPLETION
+    assert rate_limit.usage_cost(usage) == pytest.approx(usd * COST_UNITS_PER_USD, abs=1)
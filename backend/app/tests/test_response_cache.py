@@ -0,0 +1,45 @@
+"""
+Per-user GET responses carry an ETag: If-None-Match gets a 304 until the
+user writes something, and one user's writes don't change another's ETags.
+"""
+from datetime import date
+
+from conftest import sign_up
+from services.response_cache import etag_matches, response_cache
+
+
+def test_etag_revalidation(client, auth_headers):
+    body = {"date": date.today().isoformat(), "meal_time": "morning", "food_description": "toast"}
+    client.post("/api/food-logs/", headers=auth_headers, json=body).raise_for_status()
+
+    first = client.get("/api/food-logs/", headers=auth_headers)
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    hits = response_cache.stats["hits"]
+    again = client.get("/api/food-logs/", headers=auth_headers)
+    assert again.content == first.content
+    assert response_cache.stats["hits"] == hits + 1
+
+    response = client.get("/api/food-logs/", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    # Another user's write leaves this user's ETag alone
+    client.post("/api/food-logs/", headers=sign_up(client), json=body).raise_for_status()
+    response = client.get("/api/food-logs/", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    client.post("/api/food-logs/", headers=auth_headers, json=body).raise_for_status()
+    response = client.get("/api/food-logs/", headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert len(response.json()) == 2
+
+
+def test_if_none_match_comparison():
+    assert etag_matches('W/"1-abc"', '"1-abc"')
+    assert etag_matches('"0-x", "1-abc"', '"1-abc"')
+    assert etag_matches("*", '"1-abc"')
+    assert not etag_matches('"2-abc"', '"1-abc"')
+    assert not etag_matches(None, '"1-abc"')
@@ -0,0 +1,81 @@
+"""
+With a read replica configured, read-only endpoints read from it, except
+right after the user's own write and for a while after the replica failed.
+
+The replica here is the test database itself, or a SQLite file in a
+directory that doesn't exist for one that is down.
+"""
+import os
+import time
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from conftest import sign_up
+import database
+from database import SessionRouter, session_router
+
+
+def configure_replica(monkeypatch, url, **settings):
+    configured = database.get_settings().model_copy(update={"database_replica_url": url, **settings})
+    monkeypatch.setattr(database, "get_settings", lambda: configured)
+    # The next replica session creates an engine for the new URL
+    database._engines.pop(database.REPLICA, None)
+
+
+@pytest.fixture
+def replica(client, monkeypatch):
+    def configure(url=os.environ["DATABASE_URL"], **settings):
+        configure_replica(monkeypatch, url, **settings)
+
+    yield configure
+    engine = database._engines.pop(database.REPLICA, None)
+    if engine is not None:
+        client.portal.call(engine.dispose)
+
+
+def test_reads_stay_on_the_primary_after_a_write(client, auth_headers, replica):
+    replica()
+    food_log = client.post("/api/food-logs/", headers=auth_headers, json={
+        "date": date.today().isoformat(), "meal_time": "morning", "food_description": "toast",
+    }).json()
+    stats = dict(session_router.stats)
+    response = client.get(f"/api/food-logs/{food_log['id']}", headers=auth_headers)
+    assert response.json()["food_description"] == "toast"
+    assert session_router.stats["primary"] == stats["primary"] + 1
+    assert session_router.stats["sticky"] == stats["sticky"] + 1
+    assert session_router.snapshot()["sticky_users"] >= 1
+
+    # Another user, who hasn't written anything, reads from the replica
+    client.get("/api/food-logs/", headers=sign_up(client)).raise_for_status()
+    assert session_router.stats["replica"] > stats["replica"]
+    assert session_router.stats["sticky"] == stats["sticky"] + 1
+
+
+def test_failed_replica_is_skipped_until_it_answers(client, replica, tmp_path):
+    replica(f"sqlite+aiosqlite:///{tmp_path}/missing/replica.db", db_replica_retry_seconds=0.1)
+    router = SessionRouter()
+
+    async def read(user_id=1):
+        async with router.read_session(user_id) as db:
+            return (await db.execute(text("SELECT 1"))).scalar()
+
+    # The request that finds the replica down fails...
+    with pytest.raises(database.OperationalError):
+        client.portal.call(read)
+    assert router.snapshot()["replica_down"] == 1
+    # ...and the next ones read from the primary
+    assert client.portal.call(read) == 1
+    assert (router.stats["replica"], router.stats["primary"]) == (1, 1)
+
+    # Once the retry period is over the replica is checked before it is used
+    time.sleep(0.1)
+    assert client.portal.call(read) == 1
+    assert (router.stats["replica_errors"], router.stats["primary"]) == (2, 2)
+
+    replica()
+    time.sleep(0.1)
+    assert client.portal.call(read) == 1
+    assert (router.stats["replica"], router.stats["replica_errors"]) == (2, 2)
+    assert router.snapshot()["replica_down"] == 0
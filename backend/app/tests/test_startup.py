@@ -0,0 +1,103 @@
+"""
+The API process answers /health without touching the database or the LLM,
+and /ready keeps it out of rotation until the database is migrated.
+
+Runs uvicorn in a subprocess against a SQLite file that doesn't exist yet
+(the engine creates it on its first connection) and an LLM endpoint that
+counts the connections made to it.
+"""
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+from conftest import APP_DIR
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ConnectionCounter:
+    """A TCP listener that accepts and closes connections, counting them"""
+
+    def __init__(self):
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def unmigrated_server(tmp_path):
+    llm = ConnectionCounter()
+    db_path = tmp_path / "unmigrated.db"
+    port = free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{llm.port}/v1",
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        yield f"http://127.0.0.1:{port}", db_path, llm
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        llm.close()
+
+
+def wait_for_health(base_url: str, timeout: float = 30) -> httpx.Response:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return httpx.get(f"{base_url}/health")
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def test_health_answers_before_database_and_llm(unmigrated_server):
+    base_url, db_path, llm = unmigrated_server
+    response = wait_for_health(base_url)
+    assert response.status_code == 200
+    assert response.json() == {"status": "healthy"}
+    # Neither the engine nor the LLM client has connected yet
+    assert not Path(db_path).exists()
+    assert llm.connections == 0
+
+
+def test_ready_reports_unmigrated_schema(unmigrated_server):
+    base_url, _, _ = unmigrated_server
+    wait_for_health(base_url)
+    response = httpx.get(f"{base_url}/ready")
+    assert response.status_code == 503
+    body = response.json()
+    assert body["status"] == "unavailable"
+    assert body["checks"]["database"]["ok"] is True
+    assert body["checks"]["schema"]["ok"] is False
+    assert "not migrated" in body["checks"]["schema"]["detail"]
@@ -0,0 +1,193 @@
+"""
+A failed daily summary is a 503 (an error event when streaming) and is
+never stored or returned as the summary. Concurrent summaries of the same
+logs share one generation, which doesn't depend on the request that started it.
+Streamed summaries are sent as delta events followed by a done event. Logs
+added since the stored summary are folded into it; changing a log it covers
+regenerates it from all logs.
+"""
+import asyncio
+import json
+from datetime import date
+
+import pytest
+
+import models
+from database import SessionLocal
+from services import ai_service, job_queue, nutrition
+from services.circuit_breaker import CircuitOpenError
+
+
+@pytest.fixture
+def logged_day(client, auth_headers):
+    today = date.today().isoformat()
+    response = client.post("/api/food-logs/", headers=auth_headers, json={
+        "date": today, "meal_time": "morning", "food_description": "porridge with berries",
+    })
+    response.raise_for_status()
+    return today
+
+
+def events(response):
+    """(event, data) of each Server-Sent Event in the response"""
+    parsed = []
+    for block in response.text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        parsed.append((fields.get("event"), json.loads(fields["data"])))
+    return parsed
+
+
+def test_failed_summary_is_503(client, auth_headers, logged_day, monkeypatch):
+    async def summarize_daily_food(food_logs, previous_summary=None):
+        return None
+
+    async def summarize_daily_food_recovered(food_logs, previous_summary=None):
+        return "A good start"
+
+    monkeypatch.setattr(ai_service, "summarize_daily_food", summarize_daily_food)
+    failed = nutrition.summary_stats["failed"]
+
+    response = client.post("/api/ai/summarize", headers=auth_headers, json={"date": logged_day})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) > 0
+    assert nutrition.summary_stats["failed"] == failed + 1
+
+    # Nothing was stored: the next request generates it
+    monkeypatch.setattr(ai_service, "summarize_daily_food", summarize_daily_food_recovered)
+    response = client.post("/api/ai/summarize", headers=auth_headers, json={"date": logged_day})
+    assert response.status_code == 200
+    assert response.json()["summary"] == "A good start"
+    assert response.json()["cached"] is False
+
+
+def test_failed_summary_stream_ends_with_error(client, auth_headers, logged_day, monkeypatch):
+    async def stream(operation, **kwargs):
+        yield "Half a summ"
+        raise CircuitOpenError("LLM circuit is open")
+
+    monkeypatch.setattr(ai_service, "_chat_completion_stream", stream)
+
+    response = client.post("/api/ai/summarize/stream", headers=auth_headers, json={"date": logged_day})
+    assert response.status_code == 200
+    sent = events(response)
+    assert sent[0] == (None, {"delta": "Half a summ"})
+    assert sent[-1][0] == "error"
+    assert "temporarily unavailable" in sent[-1][1]["detail"]
+    assert "done" not in [event for event, _ in sent]
+
+
+def run_job(client, job_id):
+    """Process a queued job the way a worker does"""
+    async def run():
+        async with SessionLocal() as db:
+            job = await db.get(models.Job, job_id)
+            job.status = models.JobStatus.RUNNING
+            job.attempts += 1
+            await db.commit()
+            await job_queue.process_job(db, job)
+
+    client.portal.call(run)
+
+
+def test_failed_summary_job_is_deferred(client, auth_headers, logged_day, monkeypatch):
+    async def summarize_daily_food(food_logs, previous_summary=None):
+        return None
+
+    monkeypatch.setattr(ai_service, "summarize_daily_food", summarize_daily_food)
+    response = client.post("/api/jobs/", headers=auth_headers, json={"kind": "summarize", "date": logged_day})
+    job_id = response.json()["id"]
+
+    run_job(client, job_id)
+    job = client.get(f"/api/jobs/{job_id}", headers=auth_headers).json()
+    assert job["status"] == "pending"
+    assert job["attempts"] == 0
+    assert job["result"] is None
+    assert "temporarily unavailable" in job["error"]
+
+
+def test_concurrent_summaries_share_one_run(client, auth_headers, logged_day, monkeypatch):
+    calls = []
+
+    async def summarize_daily_food(food_logs, previous_summary=None):
+        calls.append(food_logs)
+        await asyncio.sleep(0.2)
+        return "A good start"
+
+    monkeypatch.setattr(ai_service, "summarize_daily_food", summarize_daily_food)
+    user_id = client.get("/api/food-logs/", headers=auth_headers).json()[0]["user_id"]
+    day = date.fromisoformat(logged_day)
+
+    async def summarize(close_early):
+        async with SessionLocal() as db:
+            task = asyncio.ensure_future(nutrition.summarize_day(db, user_id, day))
+            if close_early:
+                # The request that started the generation going away doesn't affect it
+                await asyncio.sleep(0.05)
+                task.cancel()
+                return None
+            return await task
+
+    async def summarize_twice():
+        return await asyncio.gather(summarize(True), summarize(False))
+
+    _, follower = client.portal.call(summarize_twice)
+    assert len(calls) == 1
+    assert follower == {"summary": "A good start", "date": day, "cached": False}
+
+    response = client.post("/api/ai/summarize", headers=auth_headers, json={"date": logged_day})
+    assert response.json()["cached"] is True
+
+
+def test_summary_stream(client, auth_headers, logged_day, monkeypatch):
+    async def stream(operation, **kwargs):
+        for delta in ("A good", " start"):
+            yield delta
+
+    monkeypatch.setattr(ai_service, "_chat_completion_stream", stream)
+
+    response = client.post("/api/ai/summarize/stream", headers=auth_headers, json={"date": logged_day})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert events(response) == [
+        (None, {"delta": "A good"}),
+        (None, {"delta": " start"}),
+        ("done", {"summary": "A good start", "date": logged_day, "cached": False}),
+    ]
+
+    # Stored, so the next request gets it as the done event right away
+    response = client.post("/api/ai/summarize/stream", headers=auth_headers, json={"date": logged_day})
+    assert events(response) == [("done", {"summary": "A good start", "date": logged_day, "cached": True})]
+
+
+def test_new_logs_are_folded_into_the_stored_summary(client, auth_headers, logged_day, monkeypatch):
+    calls = []
+
+    async def summarize_daily_food(food_logs, previous_summary=None):
+        calls.append(([log["food_description"] for log in food_logs], previous_summary))
+        return f"Summary {len(calls)}"
+
+    monkeypatch.setattr(ai_service, "summarize_daily_food", summarize_daily_food)
+
+    def summarize():
+        response = client.post("/api/ai/summarize", headers=auth_headers, json={"date": logged_day})
+        response.raise_for_status()
+        return response.json()
+
+    assert summarize()["summary"] == "Summary 1"
+    stats = dict(nutrition.summary_stats)
+    lunch = client.post("/api/food-logs/", headers=auth_headers, json={
+        "date": logged_day, "meal_time": "afternoon", "food_description": "lentil soup",
+    }).json()
+
+    assert summarize() == {"summary": "Summary 2", "date": logged_day, "cached": False}
+    assert calls[-1] == (["lentil soup"], "Summary 1")
+    assert nutrition.summary_stats["incremental"] == stats["incremental"] + 1
+    assert summarize()["cached"] is True
+
+    # A covered log changed: the whole day is summarized again
+    client.put(f"/api/food-logs/{lunch['id']}", headers=auth_headers, json={
+        "date": logged_day, "meal_time": "afternoon", "food_description": "tomato soup",
+    }).raise_for_status()
+    assert summarize()["summary"] == "Summary 3"
+    assert sorted(calls[-1][0]) == ["porridge with berries", "tomato soup"]
+    assert calls[-1][1] is None
+    assert nutrition.summary_stats["generated"] == stats["generated"] + 1
@@ -0,0 +1,59 @@
+"""
+Rolling averages cover the analyzed days of each window and streaks are runs
+of logged days. Days whose logs haven't been analyzed count towards streaks
+but not towards the averages, daily series or macro ratios.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+
+from services import ai_service, trends
+
+ANALYSIS = {"calories": 600.0, "protein": 30.0, "carbs": 60.0, "fats": 20.0, "fiber": 8.0, "summary": "Dinner"}
+
+
+def test_rolling_mean_skips_days_without_data():
+    values = np.array([100.0, 0.0, 300.0, 500.0])
+    analyzed = np.array([True, False, True, True])
+    means = trends._rolling_mean(values, analyzed, 2)
+    # Windows ending on the 2nd, 3rd and 4th day
+    assert means.tolist() == [100.0, 300.0, 400.0]
+    assert np.isnan(trends._rolling_mean(np.zeros(3), np.zeros(3, dtype=bool), 2)).all()
+
+
+def test_streaks():
+    start = date(2026, 10, 1)
+    logged = np.array([True, True, True, False, True, True])
+    assert trends._streaks(logged, start) == {
+        "current": 2, "longest": 3, "longest_start": start, "longest_end": date(2026, 10, 3),
+    }
+    assert trends._streaks(np.zeros(3, dtype=bool), start)["longest"] == 0
+
+
+def test_unanalyzed_days_are_left_out_of_averages(client, auth_headers, monkeypatch):
+    async def analyze_food_nutrients(food_description):
+        return dict(ANALYSIS)
+
+    monkeypatch.setattr(ai_service, "analyze_food_nutrients", analyze_food_nutrients)
+    today = date.today()
+    yesterday = today - timedelta(days=1)
+    for day in (yesterday, today):
+        response = client.post("/api/food-logs/", headers=auth_headers, json={
+            "date": day.isoformat(), "meal_time": "evening", "food_description": "grandma's stew",
+        })
+        food_log_id = response.json()["id"]
+    # Only today's log is analyzed
+    client.post("/api/ai/analyze", headers=auth_headers, json={"food_log_id": food_log_id}).raise_for_status()
+
+    response = client.get(
+        "/api/ai/trends", headers=auth_headers,
+        params={"start_date": yesterday.isoformat(), "end_date": today.isoformat()},
+    )
+    assert response.status_code == 200
+    trends = response.json()
+    assert (trends["days_logged"], trends["days_analyzed"]) == (2, 1)
+    assert trends["streaks"]["current"] == 2
+    assert trends["averages"]["calories"] == 600.0
+    assert trends["daily"]["calories"] == [None, 600.0]
+    assert trends["rolling_7d"]["calories"] == [None, 600.0]
+    assert trends["macro_ratios"]["protein"] == round(120 / (120 + 240 + 180), 4)
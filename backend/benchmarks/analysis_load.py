@@ -0,0 +1,95 @@
+"""
+Load benchmark: latency of GET /api/food-logs/ while analyses are in flight.
+
+Starts the stub LLM and the API as subprocesses, measures read latency on an
+idle server, then again while N analyses run concurrently, and prints both.
+
+Run from backend/ with DATABASE_URL set:
+    python -m benchmarks.analysis_load --analyses 50
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks.common import APP_DIR, BACKEND_DIR, migrate, start_server, summarize, wait_until_up
+
+
+async def sample_reads(client, base_url, duration):
+    latencies = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        response = await client.get(f"{base_url}/api/food-logs/")
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def report(label, latencies):
+    stats = summarize(latencies)
+    print(f"{label:>10}: n={stats['count']} p50={stats['p50_ms']}ms p99={stats['p99_ms']}ms")
+
+
+async def run(args):
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    env = dict(os.environ)
+    env["STUB_LLM_LATENCY"] = str(args.llm_latency)
+    env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}/v1"
+    env.setdefault("OPENAI_API_KEY", "stub")
+    env.setdefault("AUTH_REQUIRED", "false")
+    # Every request comes from the one default user
+    env.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    migrate(env)
+    stub = start_server("benchmarks.stub_llm:app", args.llm_port, BACKEND_DIR, env)
+    api = start_server("main:app", args.api_port, APP_DIR, env)
+    try:
+        async with httpx.AsyncClient(timeout=120) as client:
+            await wait_until_up(client, f"http://127.0.0.1:{args.llm_port}/docs")
+            await wait_until_up(client, f"{api_url}/health")
+
+            log_ids = []
+            for i in range(args.analyses):
+                response = await client.post(
+                    f"{api_url}/api/food-logs/",
+                    json={
+                        "date": "2000-01-01",
+                        "meal_time": "morning",
+                        "food_description": f"benchmark meal {i} {time.time()}",
+                    },
+                )
+                response.raise_for_status()
+                log_ids.append(response.json()["id"])
+
+            report("idle", await sample_reads(client, api_url, args.duration))
+
+            analyses = [
+                client.post(f"{api_url}/api/ai/analyze", json={"food_log_id": log_id})
+                for log_id in log_ids
+            ]
+            analyses_task = asyncio.gather(*analyses)
+            report("loaded", await sample_reads(client, api_url, args.duration))
+            await analyses_task
+
+            for log_id in log_ids:
+                await client.delete(f"{api_url}/api/food-logs/{log_id}")
+    finally:
+        api.terminate()
+        stub.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--analyses", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--api-port", type=int, default=8100)
+    parser.add_argument("--llm-port", type=int, default=9000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
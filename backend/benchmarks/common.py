@@ -0,0 +1,62 @@
+"""Helpers shared by the benchmark scripts"""
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+APP_DIR = BACKEND_DIR / "app"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies):
+    """p50/p95/p99 of a list of latencies in milliseconds"""
+    return {
+        "count": len(latencies),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+def migrate(env=None, app_dir=APP_DIR):
+    """Bring DATABASE_URL to the current schema; the API doesn't create tables itself"""
+    subprocess.run(
+        [sys.executable, "-m", "alembic", "upgrade", "head"],
+        cwd=app_dir, env=env, check=True, stdout=subprocess.DEVNULL,
+    )
+
+
+def start_server(module, port, cwd, env, workers=1):
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", module,
+            "--port", str(port),
+            "--workers", str(workers),
+            "--log-level", "warning",
+        ],
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_until_up(client, url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get(url)
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
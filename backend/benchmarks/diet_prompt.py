@@ -0,0 +1,178 @@
+"""
+Input tokens of the compact diet plan prompt vs the previous one.
+
+Builds synthetic 5-day histories for a light, a regular and a heavy logger
+(the heavy one logs the same staples with long descriptions several times a
+day) and counts the prompt tokens (system + user message) of the previous
+prompt format and of services.diet_prompt with the model's tokenizer.
+
+With --live, both prompts are also sent --requests times to the configured
+OpenAI endpoint (OPENAI_API_KEY / OPENAI_BASE_URL) and the reported prompt
+tokens, cached prompt tokens and completion latency are compared.
+
+Run from backend/:
+    python -m benchmarks.diet_prompt
+    OPENAI_API_KEY=sk-... python -m benchmarks.diet_prompt --live --requests 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from benchmarks.common import APP_DIR
+
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+sys.path.insert(0, str(APP_DIR))
+
+from services import ai_service, diet_prompt  # noqa: E402
+
+TARGET_REDUCTION = 0.5
+
+# The prompt as it was before services.diet_prompt
+LEGACY_SYSTEM_PROMPT = "You are a nutrition expert providing personalized diet recommendations. Always respond with valid JSON only."
+LEGACY_PROMPT = """Analyze the following food intake history over the past few days and provide personalized diet recommendations:
+
+{history_text}
+
+Average daily totals:
+- Calories: {avg_calories:.0f}
+- Protein: {avg_protein:.1f}g
+- Carbs: {avg_carbs:.1f}g
+- Fats: {avg_fats:.1f}g
+
+Provide recommendations in JSON format:
+{{
+    "high_calorie_foods": [
+        {{
+            "food": "<food name>",
+            "calories": <number>,
+            "issue": "<why it's problematic>",
+            "replacement": "<suggested replacement>",
+            "replacement_calories": <number>,
+            "benefit": "<why replacement is better>"
+        }}
+    ],
+    "general_recommendations": [
+        "<recommendation 1>",
+        "<recommendation 2>"
+    ],
+    "meal_timing_suggestions": "<suggestions about meal timing>"
+}}
+
+Focus on identifying high-calorie, low-nutrition foods and suggesting healthier alternatives that the user might already be eating or can easily prepare."""
+
+STAPLES = [
+    ("Large bowl of oatmeal made with whole milk, one sliced banana, a tablespoon of peanut butter and honey", 520),
+    ("Black coffee with two sugars and a splash of cream", 60),
+    ("Grilled chicken breast salad with romaine, cherry tomatoes, cucumber, feta and ranch dressing", 480),
+    ("Two slices of pepperoni pizza from the place near the office", 600),
+    ("Handful of salted cashews", 180),
+    ("Greek yogurt with granola and blueberries", 320),
+    ("Rice and dal with a spoon of ghee and mixed vegetable curry", 650),
+    ("Protein shake with whey, almond milk and a frozen banana", 300),
+    ("Chocolate chip cookies (3) with a glass of milk", 420),
+    ("Spaghetti bolognese with parmesan and garlic bread", 850),
+    ("Apple", 95),
+    ("Can of cola", 140),
+]
+PROFILES = {"light": (2, 3), "regular": (4, 6), "heavy": (9, 14)}
+MEALS = ("morning", "afternoon", "evening")
+
+
+def synthetic_history(logs_per_day, rng):
+    food_history = []
+    for offset in range(5):
+        logs = []
+        for _ in range(rng.randint(*logs_per_day)):
+            description, calories = rng.choice(STAPLES)
+            logs.append({"meal_time": rng.choice(MEALS), "food_description": description, "calories": calories})
+        logs.sort(key=lambda log: MEALS.index(log["meal_time"]))
+        calories = sum(log["calories"] for log in logs)
+        totals = {
+            "calories": calories, "protein": calories * 0.05, "carbs": calories * 0.12,
+            "fats": calories * 0.04, "fiber": calories * 0.01,
+        }
+        food_history.append({"date": date.today() - timedelta(days=4 - offset), "logs": logs, "totals": totals})
+    nutrient_totals = {
+        f"avg_{macro}": statistics.mean(day["totals"][macro] for day in food_history)
+        for macro in diet_prompt.MACROS
+    }
+    return food_history, nutrient_totals
+
+
+def legacy_messages(food_history, nutrient_totals):
+    history_text = ""
+    for day_data in food_history:
+        history_text += f"\nDate: {day_data['date']}\n"
+        for log in day_data["logs"]:
+            history_text += f"  {log['meal_time']}: {log['food_description']} (Calories: {log.get('calories', 'N/A')})\n"
+    prompt = LEGACY_PROMPT.format(history_text=history_text, **{
+        key: nutrient_totals.get(key, 0) for key in ("avg_calories", "avg_protein", "avg_carbs", "avg_fats")
+    })
+    return [{"role": "system", "content": LEGACY_SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+
+
+def message_tokens(messages):
+    return sum(diet_prompt.count_tokens(message["content"], ai_service.DIET_PLAN_MODEL) for message in messages)
+
+
+async def live(messages, requests):
+    usage, latencies = [], []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = await ai_service.get_client().chat.completions.create(
+            model=ai_service.DIET_PLAN_MODEL, messages=messages, temperature=0.5,
+            response_format={"type": "json_object"},
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        details = getattr(response.usage, "prompt_tokens_details", None)
+        usage.append((response.usage.prompt_tokens, getattr(details, "cached_tokens", None) or 0))
+    return {
+        "prompt_tokens": usage[-1][0],
+        "cached_prompt_tokens": usage[-1][1],
+        "p50_ms": round(statistics.median(latencies), 1),
+    }
+
+
+async def run(args):
+    await diet_prompt.load_encoding(ai_service.DIET_PLAN_MODEL)
+    rng = random.Random(42)
+    results = {}
+    for profile, logs_per_day in PROFILES.items():
+        food_history, nutrient_totals = synthetic_history(logs_per_day, rng)
+        legacy = legacy_messages(food_history, nutrient_totals)
+        compact = ai_service._diet_recommendations_request(food_history, nutrient_totals)["messages"]
+        legacy_tokens, compact_tokens = message_tokens(legacy), message_tokens(compact)
+        result = {
+            "logs": sum(len(day["logs"]) for day in food_history),
+            "legacy_tokens": legacy_tokens,
+            "compact_tokens": compact_tokens,
+            "reduction": round(1 - compact_tokens / legacy_tokens, 3),
+        }
+        if args.live:
+            result["legacy_live"] = await live(legacy, args.requests)
+            result["compact_live"] = await live(compact, args.requests)
+        results[profile] = result
+        print(f"{profile:>8}: {json.dumps(result)}")
+
+    results["heavy"]["meets_target"] = results["heavy"]["reduction"] >= TARGET_REDUCTION
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="also send the prompts to the LLM")
+    parser.add_argument("--requests", type=int, default=3)
+    parser.add_argument("--output", help="write the results as JSON")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+EXPLAIN ANALYZE of the hot food log queries on a large seeded table (PostgreSQL).
+
+Seeds --rows food logs (default 10M) spread over --users users, analyses for
+every other log, then prints the plans and execution times of the diet-plan
+range scan, the daily join and the per-log analysis lookup. Run it once at
+each schema revision to compare, e.g.:
+
+    cd app && alembic downgrade 0001_baseline && cd ..
+    python -m benchmarks.explain_food_logs --output before.json
+    cd app && alembic upgrade head && cd ..
+    python -m benchmarks.explain_food_logs --skip-seed --output after.json
+
+Run from backend/ with DATABASE_URL pointing at a scratch PostgreSQL database.
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from sqlalchemy import text
+
+sys.path.insert(0, "app")
+
+from database import dispose_engine, get_engine  # noqa: E402
+
+QUERIES = {
+    "diet_plan_range": """
+        SELECT id, date, meal_time FROM food_logs
+        WHERE user_id = :user_id AND date >= {start} AND date <= {end}
+        ORDER BY date, id
+    """,
+    "daily_join": """
+        SELECT l.meal_time, l.food_description, a.calories
+        FROM food_logs l LEFT JOIN food_analyses a ON a.food_log_id = l.id
+        WHERE l.user_id = :user_id AND l.date = {start}
+    """,
+    "analysis_lookup": """
+        SELECT * FROM food_analyses WHERE food_log_id = :food_log_id
+    """,
+}
+
+
+async def column_type(conn, table, column):
+    result = await conn.execute(
+        text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = :table AND column_name = :column"
+        ),
+        {"table": table, "column": column},
+    )
+    return result.scalar()
+
+
+async def seed(conn, rows, users):
+    typed = await column_type(conn, "food_logs", "date") == "date"
+    day = "(DATE '2020-01-01' + (i / :users) % 1500)"
+    date_expr = day if typed else f"to_char({day}, 'YYYY-MM-DD')"
+    time_expr = "NULL" if typed else "NULL::text"
+
+    await conn.execute(text("TRUNCATE food_logs, food_analyses RESTART IDENTITY CASCADE"))
+    await conn.execute(
+        text(
+            f"""
+            INSERT INTO food_logs (user_id, date, meal_time, time, food_description)
+            SELECT i % :users, {date_expr},
+                   (ARRAY['MORNING', 'AFTERNOON', 'EVENING'])[i % 3 + 1]::mealtime,
+                   {time_expr}, 'seeded meal ' || (i % 997)
+            FROM generate_series(1, :rows) AS i
+            """
+        ),
+        {"rows": rows, "users": users},
+    )
+    await conn.execute(
+        text(
+            """
+            INSERT INTO food_analyses (food_log_id, calories, protein, carbs, fats, fiber, summary)
+            SELECT id, 300, 15, 40, 10, 5, 'seeded' FROM food_logs WHERE id % 2 = 0
+            """
+        )
+    )
+    await conn.execute(text("ANALYZE food_logs"))
+    await conn.execute(text("ANALYZE food_analyses"))
+
+
+async def explain(conn, name, sql, params):
+    typed = await column_type(conn, "food_logs", "date") == "date"
+    start, end = ("DATE '2023-06-01'", "DATE '2023-06-05'") if typed else ("'2023-06-01'", "'2023-06-05'")
+    result = await conn.execute(
+        text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql.format(start=start, end=end)),
+        params,
+    )
+    plan = result.scalar()
+    plan = plan if isinstance(plan, list) else json.loads(plan)
+    return {
+        "query": name,
+        "execution_ms": plan[0]["Execution Time"],
+        "planning_ms": plan[0]["Planning Time"],
+        "plan": plan[0]["Plan"],
+    }
+
+
+def node_types(plan):
+    types = [plan["Node Type"] + (f" on {plan['Index Name']}" if "Index Name" in plan else "")]
+    for child in plan.get("Plans", []):
+        types.extend(node_types(child))
+    return types
+
+
+async def run(args):
+    engine = get_engine()
+    async with engine.begin() as conn:
+        if not args.skip_seed:
+            print(f"Seeding {args.rows} food logs...")
+            await seed(conn, args.rows, args.users)
+
+    results = []
+    async with engine.connect() as conn:
+        params = {"user_id": 42, "food_log_id": args.rows // 2}
+        for name, sql in QUERIES.items():
+            result = await explain(conn, name, sql, params)
+            results.append(result)
+            print(f"{name:>16}: {result['execution_ms']:.2f} ms  {' > '.join(node_types(result['plan']))}")
+    await dispose_engine()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--output")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Throughput of POST /api/food-logs/import and memory of GET /api/food-logs/export.
+
+Each round streams --rows generated food logs into the import endpoint, then
+exports the user's whole (growing) history while sampling the server's
+resident memory. Import should stay under 10 s per 100k rows, and the memory
+an export adds should not grow from round to round as the history does.
+Memory is read from /proc, so it is only reported on Linux.
+
+Run from backend/ with DATABASE_URL set (user 1's food logs are replaced):
+    python -m benchmarks.food_log_io --rows 100000 --rounds 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import httpx
+from sqlalchemy import delete, select
+
+from benchmarks.common import APP_DIR, migrate, start_server, wait_until_up
+
+sys.path.insert(0, str(APP_DIR))
+
+import models  # noqa: E402
+from database import SessionLocal, dispose_engine  # noqa: E402
+
+IMPORT_BUDGET_S = 10.0
+CHUNK_BYTES = 64 * 1024
+MEALS = ("morning", "afternoon", "evening")
+FOODS = ("oatmeal with banana", "chicken salad, no dressing", "2 eggs and toast", "rice and dal", "greek yogurt")
+
+
+def generated_rows(rows, seed):
+    rng = random.Random(seed)
+    first = date.today() - timedelta(days=3 * 365)
+    for index in range(rows):
+        day = first + timedelta(days=rng.randrange(3 * 365))
+        yield day.isoformat(), rng.choice(MEALS), f"{rng.randint(6, 21):02d}:{rng.choice((0, 30)):02d}", rng.choice(FOODS)
+
+
+async def upload_body(rows, fmt, seed):
+    """The upload, generated in ~64 KiB chunks so the client doesn't hold it either"""
+    parts = ["date,meal_time,time,food_description\n"] if fmt == "csv" else []
+    size = 0
+    for day, meal, at, food in generated_rows(rows, seed):
+        if fmt == "csv":
+            line = f'{day},{meal},{at},"{food}"\n'
+        else:
+            line = json.dumps({"date": day, "meal_time": meal, "time": at, "food_description": food}) + "\n"
+        parts.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield "".join(parts).encode()
+            parts, size = [], 0
+    if parts:
+        yield "".join(parts).encode()
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+async def sample_rss(pid, samples, stop):
+    while not stop.is_set():
+        value = rss_mb(pid)
+        if value is not None:
+            samples.append(value)
+        await asyncio.sleep(0.02)
+
+
+async def reset():
+    migrate()
+    async with SessionLocal() as db:
+        # Explicit, since SQLite doesn't cascade without PRAGMA foreign_keys
+        await db.execute(delete(models.FoodAnalysis).where(models.FoodAnalysis.food_log_id.in_(
+            select(models.FoodLog.id).where(models.FoodLog.user_id == 1)
+        )))
+        await db.execute(delete(models.FoodLog).where(models.FoodLog.user_id == 1))
+        await db.execute(delete(models.DailyNutrientTotal).where(models.DailyNutrientTotal.user_id == 1))
+        await db.commit()
+    await dispose_engine()
+
+
+async def run(args):
+    await reset()
+
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "stub")
+    env.setdefault("AUTH_REQUIRED", "false")
+    api = start_server("main:app", args.api_port, APP_DIR, env)
+    content_type = "text/csv" if args.format == "csv" else "application/x-ndjson"
+    results = {"format": args.format, "rows_per_round": args.rows, "rounds": []}
+    try:
+        async with httpx.AsyncClient(timeout=600) as client:
+            await wait_until_up(client, f"{api_url}/health")
+            for round_number in range(1, args.rounds + 1):
+                started = time.perf_counter()
+                response = await client.post(
+                    f"{api_url}/api/food-logs/import",
+                    content=upload_body(args.rows, args.format, seed=round_number),
+                    headers={"Content-Type": content_type},
+                )
+                response.raise_for_status()
+                import_s = time.perf_counter() - started
+                imported = response.json()["imported"]
+
+                baseline = rss_mb(api.pid)
+                samples, stop = [], asyncio.Event()
+                sampler = asyncio.create_task(sample_rss(api.pid, samples, stop))
+                started = time.perf_counter()
+                exported_bytes = exported_rows = 0
+                async with client.stream("GET", f"{api_url}/api/food-logs/export", params={"format": args.format}) as export:
+                    export.raise_for_status()
+                    async for chunk in export.aiter_bytes():
+                        exported_bytes += len(chunk)
+                        exported_rows += chunk.count(b"\n")
+                export_s = time.perf_counter() - started
+                stop.set()
+                await sampler
+
+                if args.format == "csv":
+                    exported_rows -= 1  # header
+                result = {
+                    "round": round_number,
+                    "imported": imported,
+                    "import_s": round(import_s, 2),
+                    "import_rows_per_s": round(imported / import_s),
+                    "within_budget": import_s * 100_000 / args.rows < IMPORT_BUDGET_S,
+                    "history_rows": exported_rows,
+                    "export_s": round(export_s, 2),
+                    "export_mb": round(exported_bytes / 2**20, 1),
+                }
+                if baseline is not None and samples:
+                    result["server_rss_mb"] = round(baseline, 1)
+                    result["export_rss_growth_mb"] = round(max(samples) - baseline, 1)
+                results["rounds"].append(result)
+                print(json.dumps(result))
+    finally:
+        api.terminate()
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="rows imported per round")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+    parser.add_argument("--api-port", type=int, default=8100)
+    parser.add_argument("--output", help="write the results as JSON")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Multi-tenant load test: a mixed workload from --users simulated users.
+
+Seeds --users accounts (default 100k, sharing one password hash so seeding
+doesn't spend minutes in bcrypt) with --logs-per-user food logs each, mints
+an access token per user with the server's secret, then drives --clients
+concurrent clients for --requests requests. Each request comes from a
+random user: list a day's logs, read one of their logs, read the day's
+nutrients or log a meal. Reported:
+
+  - p50/p95/p99 per operation and overall, and requests/sec
+  - the server's token cache hits and misses (scraped from /metrics): the
+    first request with a token verifies it, every later one is a cache hit
+  - cross-tenant isolation: users asking for other users' logs must get 404
+  - the cost of verifying a token with and without the cache, in process
+
+Run from backend/ with DATABASE_URL set (replaces the load-test accounts
+and their food logs):
+    python -m benchmarks.multi_tenant --users 100000 --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+
+import httpx
+from sqlalchemy import delete, func, insert, literal, select
+
+from benchmarks.common import APP_DIR, migrate, start_server, summarize, wait_until_up
+
+# The benchmark mints tokens, so it has to share the server's signing key
+os.environ.setdefault("SECRET_KEY", secrets.token_urlsafe(32))
+os.environ["AUTH_REQUIRED"] = "true"
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+sys.path.insert(0, str(APP_DIR))
+
+import models  # noqa: E402
+from database import SessionLocal, dispose_engine  # noqa: E402
+from services import auth  # noqa: E402
+
+EMAIL_DOMAIN = "loadtest.fitbuddy.invalid"
+SEED_BATCH_SIZE = 10_000
+DAYS = 7
+MEALS = list(models.MealTime)
+FOODS = ("oatmeal with banana", "chicken salad", "2 eggs and toast", "rice and dal", "greek yogurt")
+# Relative weights of the operations in the mix
+MIX = {"list_day": 4, "get_log": 3, "day_nutrients": 2, "create_log": 1}
+
+
+def _load_test_users():
+    return select(models.User.id).where(models.User.email.like(f"%@{EMAIL_DOMAIN}"))
+
+
+async def seed(users, logs_per_user):
+    migrate()
+
+    started = time.perf_counter()
+    first_day = date.today() - timedelta(days=DAYS - 1)
+    hashed_password = await auth.hash_password("load-test-password")
+    rng = random.Random(42)
+    async with SessionLocal() as db:
+        # Explicit, since SQLite doesn't cascade without PRAGMA foreign_keys
+        await db.execute(delete(models.FoodAnalysis).where(models.FoodAnalysis.food_log_id.in_(
+            select(models.FoodLog.id).where(models.FoodLog.user_id.in_(_load_test_users()))
+        )))
+        await db.execute(delete(models.FoodLog).where(models.FoodLog.user_id.in_(_load_test_users())))
+        await db.execute(
+            delete(models.DailyNutrientTotal).where(models.DailyNutrientTotal.user_id.in_(_load_test_users()))
+        )
+        await db.execute(delete(models.User).where(models.User.id.in_(_load_test_users())))
+
+        for offset in range(0, users, SEED_BATCH_SIZE):
+            await db.execute(insert(models.User.__table__), [
+                {"email": f"user{index}@{EMAIL_DOMAIN}", "hashed_password": hashed_password}
+                for index in range(offset, min(users, offset + SEED_BATCH_SIZE))
+            ])
+        user_ids = list((await db.execute(_load_test_users().order_by(models.User.id))).scalars())
+
+        batch = []
+        for user_id in user_ids:
+            for _ in range(logs_per_user):
+                batch.append({
+                    "user_id": user_id,
+                    "date": first_day + timedelta(days=rng.randrange(DAYS)),
+                    "meal_time": rng.choice(MEALS),
+                    "food_description": rng.choice(FOODS),
+                })
+            if len(batch) >= SEED_BATCH_SIZE:
+                await db.execute(insert(models.FoodLog.__table__), batch)
+                batch = []
+        if batch:
+            await db.execute(insert(models.FoodLog.__table__), batch)
+
+        # No analyses yet, so the rollup only counts the logs
+        await db.execute(insert(models.DailyNutrientTotal).from_select(
+            ["user_id", "date", "log_count", "analysis_count", "calories", "protein", "carbs", "fats", "fiber"],
+            select(
+                models.FoodLog.user_id, models.FoodLog.date, func.count(),
+                *(literal(0) for _ in range(6))
+            ).where(
+                models.FoodLog.user_id.in_(_load_test_users())
+            ).group_by(models.FoodLog.user_id, models.FoodLog.date)
+        ))
+        logs = defaultdict(list)
+        result = await db.execute(
+            select(models.FoodLog.user_id, models.FoodLog.id, models.FoodLog.date)
+            .where(models.FoodLog.user_id.in_(_load_test_users()))
+        )
+        for user_id, food_log_id, day in result:
+            logs[user_id].append((food_log_id, day))
+        await db.commit()
+    await dispose_engine()
+    print(f"Seeded {len(user_ids)} users with {logs_per_user} logs each in {time.perf_counter() - started:.1f}s")
+    return user_ids, logs, first_day
+
+
+def token_verification_cost(tokens, rounds=2000):
+    """Microseconds per verify_token call, without and with the token cache"""
+    sample = tokens[:rounds]
+    auth.token_cache = auth.TokenCache(maxsize=0)
+    started = time.perf_counter()
+    for token in sample:
+        auth.verify_token(token)
+    uncached = (time.perf_counter() - started) / len(sample) * 1e6
+
+    auth.token_cache = auth.TokenCache()
+    for token in sample:
+        auth.verify_token(token)
+    started = time.perf_counter()
+    for token in sample:
+        auth.verify_token(token)
+    cached = (time.perf_counter() - started) / len(sample) * 1e6
+    return {"uncached_us": round(uncached, 1), "cached_us": round(cached, 2)}
+
+
+async def token_cache_stats(client, api_url):
+    stats = {}
+    for line in (await client.get(f"{api_url}/metrics")).text.splitlines():
+        if line.startswith("fitbuddy_auth_token_cache_"):
+            name, value = line.rsplit(" ", 1)
+            stats[name[len("fitbuddy_auth_token_cache_"):]] = int(float(value))
+    return stats
+
+
+def request_for(operation, user_id, logs, first_day, rng):
+    food_log_id, day = rng.choice(logs[user_id])
+    if operation == "list_day":
+        return "GET", "/api/food-logs/", {"params": {"date": day.isoformat()}}
+    if operation == "get_log":
+        return "GET", f"/api/food-logs/{food_log_id}", {}
+    if operation == "day_nutrients":
+        return "GET", f"/api/ai/nutrients/{day.isoformat()}", {}
+    return "POST", "/api/food-logs/", {"json": {
+        "date": (first_day + timedelta(days=rng.randrange(DAYS))).isoformat(),
+        "meal_time": rng.choice(MEALS).value,
+        "food_description": rng.choice(FOODS),
+    }}
+
+
+async def client_loop(client, api_url, work, tokens, logs, first_day, latencies, errors, seed):
+    rng = random.Random(seed)
+    while work:
+        operation, user_id = work.pop()
+        method, path, kwargs = request_for(operation, user_id, logs, first_day, rng)
+        headers = {"Authorization": f"Bearer {tokens[user_id]}"}
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, api_url + path, headers=headers, **kwargs)
+            response.raise_for_status()
+        except httpx.HTTPError:
+            errors[operation] += 1
+            continue
+        latencies[operation].append((time.perf_counter() - started) * 1000)
+
+
+async def isolation_violations(client, api_url, user_ids, tokens, logs, checks, rng):
+    """Requests for another user's log that did not come back 404"""
+    violations = 0
+    for _ in range(checks):
+        user_id, other_id = rng.sample(user_ids, 2)
+        food_log_id, _ = logs[other_id][0]
+        response = await client.get(
+            f"{api_url}/api/food-logs/{food_log_id}",
+            headers={"Authorization": f"Bearer {tokens[user_id]}"}
+        )
+        violations += response.status_code != 404
+    return violations
+
+
+async def run(args):
+    user_ids, logs, first_day = await seed(args.users, args.logs_per_user)
+
+    started = time.perf_counter()
+    tokens = {user_id: auth.create_access_token(user_id) for user_id in user_ids}
+    print(f"Minted {len(tokens)} tokens in {time.perf_counter() - started:.1f}s")
+    results = {
+        "users": len(user_ids),
+        "logs_per_user": args.logs_per_user,
+        "clients": args.clients,
+        "token_verification": token_verification_cost(list(tokens.values())),
+    }
+
+    rng = random.Random(7)
+    operations = rng.choices(list(MIX), weights=list(MIX.values()), k=args.requests)
+    work = [(operation, rng.choice(user_ids)) for operation in operations]
+    results["distinct_users"] = len({user_id for _, user_id in work})
+
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    env = dict(os.environ)
+    env.setdefault("JOB_WORKERS", "0")
+    api = start_server("main:app", args.api_port, APP_DIR, env, workers=args.workers)
+    try:
+        limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+        async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+            await wait_until_up(client, f"{api_url}/health")
+            latencies, errors = defaultdict(list), defaultdict(int)
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                client_loop(client, api_url, work, tokens, logs, first_day, latencies, errors, seed)
+                for seed in range(args.clients)
+            ))
+            elapsed = time.perf_counter() - started
+
+            results["requests_per_sec"] = round(sum(map(len, latencies.values())) / elapsed, 1)
+            results["overall"] = summarize([value for values in latencies.values() for value in values])
+            results["operations"] = {
+                operation: {**summarize(values), "errors": errors[operation]}
+                for operation, values in latencies.items()
+            }
+            results["token_cache"] = await token_cache_stats(client, api_url)
+            results["isolation_violations"] = await isolation_violations(
+                client, api_url, user_ids, tokens, logs, args.isolation_checks, rng
+            )
+    finally:
+        api.terminate()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--logs-per-user", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--isolation-checks", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--api-port", type=int, default=8100)
+    parser.add_argument("--output", help="write the results as JSON")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
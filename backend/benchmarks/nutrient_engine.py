@@ -0,0 +1,139 @@
+"""
+Latency and agreement of the local nutrient engine against recorded LLM analyses.
+
+The fixture (benchmarks/fixtures/llm_analyses.json) holds one LLM analysis per
+line of benchmarks/fixtures/food_descriptions.txt, with the time each call
+took. Record it once against the real model (needs OPENAI_API_KEY):
+    python -m benchmarks.nutrient_engine --record
+
+then compare (run from backend/):
+    python -m benchmarks.nutrient_engine --output engine.json
+
+Reports the engine's per-call latency, the share of descriptions it answers
+without the LLM at the configured confidence threshold, and, for those, how far
+its nutrients are from the recorded LLM values.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.common import APP_DIR, summarize
+
+sys.path.insert(0, str(APP_DIR))
+
+from services import nutrient_engine  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+DESCRIPTIONS_FILE = FIXTURES_DIR / "food_descriptions.txt"
+FIXTURE_FILE = FIXTURES_DIR / "llm_analyses.json"
+
+
+def load_descriptions():
+    return [line.strip() for line in DESCRIPTIONS_FILE.read_text().splitlines() if line.strip()]
+
+
+async def record(descriptions):
+    from services import ai_service
+
+    analyses = []
+    for description in descriptions:
+        started = time.perf_counter()
+        analysis = await ai_service.analyze_food_nutrients(description)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if analysis.get("failed"):
+            raise RuntimeError(f"LLM analysis failed for {description!r}: {analysis['summary']}")
+        analyses.append({"description": description, "latency_ms": round(elapsed_ms, 1), **analysis})
+        print(f"{elapsed_ms:8.0f}ms  {description}")
+    FIXTURE_FILE.write_text(json.dumps({"model": ai_service.ANALYSIS_MODEL, "analyses": analyses}, indent=2))
+    print(f"Recorded {len(analyses)} analyses to {FIXTURE_FILE}")
+
+
+def relative_error(local, reference):
+    # Absolute floor so near-zero references (black coffee) don't dominate
+    return abs(local - reference) / max(abs(reference), 5.0)
+
+
+def compare(descriptions, repeat):
+    engine = nutrient_engine.get_engine()
+    threshold = nutrient_engine.NUTRIENT_ENGINE_MIN_CONFIDENCE
+
+    latencies_us = []
+    estimates = {}
+    for description in descriptions:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result, confidence = engine.analyze(description)
+            latencies_us.append((time.perf_counter() - started) * 1e6)
+        estimates[description] = (result, confidence)
+
+    confident = [d for d in descriptions if estimates[d][1] >= threshold]
+    latency = summarize(latencies_us)
+    report = {
+        "descriptions": len(descriptions),
+        "threshold": threshold,
+        "local": len(confident),
+        "coverage": round(len(confident) / len(descriptions), 3),
+        "engine_latency_us": {
+            "p50": latency["p50_ms"], "p95": latency["p95_ms"], "p99": latency["p99_ms"],
+        },
+    }
+
+    if not FIXTURE_FILE.exists():
+        print(f"No recorded LLM analyses at {FIXTURE_FILE}; run with --record for agreement numbers")
+        return report, estimates
+
+    fixture = json.loads(FIXTURE_FILE.read_text())
+    reference = {item["description"]: item for item in fixture["analyses"]}
+    compared = [d for d in confident if d in reference]
+    report["llm_model"] = fixture["model"]
+    report["llm_latency_ms"] = summarize([item["latency_ms"] for item in fixture["analyses"]])
+    report["agreement"] = {}
+    for nutrient in nutrient_engine.NUTRIENTS:
+        errors = [relative_error(estimates[d][0][nutrient], reference[d][nutrient]) for d in compared]
+        if errors:
+            report["agreement"][nutrient] = {
+                "median_relative_error": round(statistics.median(errors), 3),
+                "within_20_percent": round(sum(e <= 0.2 for e in errors) / len(errors), 3),
+            }
+    report["worst_calories"] = sorted(
+        (
+            {
+                "description": d,
+                "local": estimates[d][0]["calories"],
+                "llm": reference[d]["calories"],
+            }
+            for d in compared
+        ),
+        key=lambda item: -relative_error(item["local"], item["llm"]),
+    )[:5]
+    return report, estimates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", action="store_true", help="record LLM analyses into the fixture")
+    parser.add_argument("--repeat", type=int, default=200, help="engine calls per description")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="print every local estimate")
+    args = parser.parse_args()
+
+    descriptions = load_descriptions()
+    if args.record:
+        asyncio.run(record(descriptions))
+        return
+
+    report, estimates = compare(descriptions, args.repeat)
+    if args.verbose:
+        for description, (result, confidence) in estimates.items():
+            print(f"{confidence:5.2f} {result['calories']:7.1f} kcal  {description}")
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Throughput benchmark: requests/sec on GET /api/food-logs/ under concurrency.
+
+Seeds --logs food logs, then drives --clients concurrent clients for
+--duration seconds. To compare data layers, point --app-dir at the app/
+directory of another checkout (e.g. a git worktree of the sync version)
+and run once per checkout against the same DATABASE_URL.
+
+Run from backend/:
+    python -m benchmarks.read_throughput --clients 200
+    python -m benchmarks.read_throughput --clients 200 --app-dir ../sync-worktree/backend/app
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.common import APP_DIR, migrate, start_server, summarize, wait_until_up
+
+
+async def client_loop(client, url, deadline, latencies, errors):
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.get(url)
+            response.raise_for_status()
+        except httpx.HTTPError:
+            errors.append(1)
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def run(args):
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "stub")
+    env.setdefault("AUTH_REQUIRED", "false")
+    env.setdefault("JOB_WORKERS", "0")
+
+    app_dir = Path(args.app_dir)
+    # Checkouts from before migrations create their tables at startup
+    if (app_dir / "alembic.ini").exists():
+        migrate(env, app_dir)
+    api = start_server("main:app", args.api_port, app_dir, env, workers=args.workers)
+    try:
+        limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+        async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+            await wait_until_up(client, f"{api_url}/health")
+
+            for i in range(args.logs):
+                response = await client.post(
+                    f"{api_url}/api/food-logs/",
+                    json={
+                        "date": args.date,
+                        "meal_time": ("morning", "afternoon", "evening")[i % 3],
+                        "food_description": f"throughput meal {i}",
+                    },
+                )
+                response.raise_for_status()
+
+            latencies, errors = [], []
+            url = f"{api_url}/api/food-logs/?date={args.date}"
+            deadline = time.monotonic() + args.duration
+            started = time.monotonic()
+            await asyncio.gather(*(
+                client_loop(client, url, deadline, latencies, errors)
+                for _ in range(args.clients)
+            ))
+            elapsed = time.monotonic() - started
+
+        result = {
+            "app_dir": str(args.app_dir),
+            "clients": args.clients,
+            "requests_per_sec": round(len(latencies) / elapsed, 1),
+            "errors": len(errors),
+            **summarize(latencies),
+        }
+        print(json.dumps(result, indent=2))
+    finally:
+        api.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-dir", default=str(APP_DIR))
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--logs", type=int, default=20)
+    parser.add_argument("--date", default="2000-01-02")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--api-port", type=int, default=8100)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
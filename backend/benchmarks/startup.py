@@ -0,0 +1,133 @@
+"""
+Startup benchmark: how long a new API process takes to be useful.
+
+For each run a fresh process is timed through:
+    import   importing main (in a separate interpreter)
+    live     spawning uvicorn until /health answers
+    ready    until /ready answers 200
+    first    the first GET /api/food-logs/ after that
+
+Pass --app-dir to time the app/ directory of another checkout; one without
+/ready reports only import, live and first.
+
+Run from backend/ with DATABASE_URL set:
+    python -m benchmarks.startup --runs 10
+    python -m benchmarks.startup --runs 10 --app-dir ../baseline-worktree/backend/app
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from benchmarks.common import APP_DIR, BACKEND_DIR, migrate, start_server, wait_until_up
+
+IMPORT_SCRIPT = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+
+def time_import(app_dir, env):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], cwd=app_dir, env=env,
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return float(output.split()[-1]) * 1000
+
+
+async def poll(client, url, started, timeout=60):
+    """Milliseconds from started until url answers 200, or None if the app has no such route"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.get(url)
+            if response.status_code == 200:
+                return (time.perf_counter() - started) * 1000
+            if response.status_code == 404:
+                return None
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.005)
+    raise RuntimeError(f"{url} did not become ready")
+
+
+async def time_start(client, args, app_dir, env):
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    started = time.perf_counter()
+    api = start_server("main:app", args.api_port, app_dir, env)
+    try:
+        live = await poll(client, f"{api_url}/health", started)
+        ready = await poll(client, f"{api_url}/ready", started)
+        first_started = time.perf_counter()
+        response = await client.get(f"{api_url}/api/food-logs/", params={"limit": 1})
+        response.raise_for_status()
+        first = (time.perf_counter() - first_started) * 1000
+    finally:
+        api.terminate()
+        api.wait()
+    return live, ready, first
+
+
+def describe(samples):
+    samples = [sample for sample in samples if sample is not None]
+    if not samples:
+        return None
+    return {
+        "runs": len(samples),
+        "median_ms": round(statistics.median(samples), 1),
+        "min_ms": round(min(samples), 1),
+        "max_ms": round(max(samples), 1),
+    }
+
+
+async def run(args):
+    app_dir = Path(args.app_dir)
+    env = dict(os.environ)
+    env["STUB_LLM_LATENCY"] = "0"
+    env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}/v1"
+    env.setdefault("OPENAI_API_KEY", "stub")
+    env.setdefault("AUTH_REQUIRED", "false")
+
+    # Checkouts from before migrations create their tables at startup
+    if (app_dir / "alembic.ini").exists():
+        migrate(env, app_dir)
+    stub = start_server("benchmarks.stub_llm:app", args.llm_port, BACKEND_DIR, env)
+    samples = {"import": [], "live": [], "ready": [], "first": []}
+    try:
+        async with httpx.AsyncClient(timeout=60) as client:
+            await wait_until_up(client, f"http://127.0.0.1:{args.llm_port}/docs")
+            for _ in range(args.runs):
+                samples["import"].append(time_import(app_dir, env))
+                live, ready, first = await time_start(client, args, app_dir, env)
+                samples["live"].append(live)
+                samples["ready"].append(ready)
+                samples["first"].append(first)
+    finally:
+        stub.terminate()
+
+    results = {phase: describe(values) for phase, values in samples.items()}
+    for phase, stats in results.items():
+        if stats is None:
+            print(f"{phase:>7}: n/a")
+        else:
+            print(f"{phase:>7}: median={stats['median_ms']}ms min={stats['min_ms']}ms max={stats['max_ms']}ms")
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--app-dir", default=str(APP_DIR), help="app/ directory of the checkout to time")
+    parser.add_argument("--api-port", type=int, default=8100)
+    parser.add_argument("--llm-port", type=int, default=9000)
+    parser.add_argument("--output", help="write the results as JSON")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
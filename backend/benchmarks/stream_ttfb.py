@@ -0,0 +1,101 @@
+"""
+Time-to-first-byte of the blocking vs streaming summary and diet plan endpoints.
+
+Starts the stub LLM and the API as subprocesses, seeds a few days of food
+logs, then measures time to the first response byte and to the full
+response for each endpoint.
+
+Run from backend/ with DATABASE_URL set:
+    python -m benchmarks.stream_ttfb --requests 10
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import date, timedelta
+
+import httpx
+
+from benchmarks.common import APP_DIR, BACKEND_DIR, migrate, start_server, summarize, wait_until_up
+
+# The diet plan only looks at the last few days of logs
+DAYS = [(date.today() - timedelta(days=offset)).isoformat() for offset in range(3)]
+
+# force=true generates every time instead of returning the stored summary or plan
+ENDPOINTS = [
+    ("summarize", "/api/ai/summarize?force=true", {"date": DAYS[0]}),
+    ("summarize/stream", "/api/ai/summarize/stream?force=true", {"date": DAYS[0]}),
+    ("diet-plan", "/api/diet-plan/generate?force=true", None),
+    ("diet-plan/stream", "/api/diet-plan/generate/stream?force=true", None),
+]
+
+
+async def measure(client, url, body):
+    started = time.perf_counter()
+    first_byte = None
+    async with client.stream("POST", url, json=body) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_raw():
+            if first_byte is None:
+                first_byte = time.perf_counter()
+    finished = time.perf_counter()
+    return (first_byte - started) * 1000, (finished - started) * 1000
+
+
+async def run(args):
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    env = dict(os.environ)
+    env["STUB_LLM_LATENCY"] = str(args.llm_latency)
+    env["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}/v1"
+    env.setdefault("OPENAI_API_KEY", "stub")
+    env.setdefault("AUTH_REQUIRED", "false")
+    # Every request comes from the one default user
+    env.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    migrate(env)
+    stub = start_server("benchmarks.stub_llm:app", args.llm_port, BACKEND_DIR, env)
+    api = start_server("main:app", args.api_port, APP_DIR, env)
+    try:
+        async with httpx.AsyncClient(timeout=120) as client:
+            await wait_until_up(client, f"http://127.0.0.1:{args.llm_port}/docs")
+            await wait_until_up(client, f"{api_url}/health")
+
+            log_ids = []
+            for day in DAYS:
+                response = await client.post(
+                    f"{api_url}/api/food-logs/",
+                    json={"date": day, "meal_time": "morning", "food_description": "benchmark oats"},
+                )
+                response.raise_for_status()
+                log_ids.append(response.json()["id"])
+
+            for label, path, body in ENDPOINTS:
+                ttfb, total = [], []
+                for _ in range(args.requests):
+                    first, full = await measure(client, f"{api_url}{path}", body)
+                    ttfb.append(first)
+                    total.append(full)
+                ttfb_stats, total_stats = summarize(ttfb), summarize(total)
+                print(
+                    f"{label:>18}: ttfb p50={ttfb_stats['p50_ms']}ms p99={ttfb_stats['p99_ms']}ms"
+                    f"  total p50={total_stats['p50_ms']}ms"
+                )
+
+            for log_id in log_ids:
+                await client.delete(f"{api_url}/api/food-logs/{log_id}")
+    finally:
+        api.terminate()
+        stub.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    parser.add_argument("--api-port", type=int, default=8100)
+    parser.add_argument("--llm-port", type=int, default=9000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
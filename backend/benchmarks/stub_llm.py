@@ -0,0 +1,102 @@
+"""
+Deterministic local stand-in for the OpenAI chat completions API.
+
+Run with:
+    STUB_LLM_LATENCY=2.0 uvicorn stub_llm:app --port 9000
+
+and point the backend at it with OPENAI_BASE_URL=http://localhost:9000/v1
+
+Streaming requests ("stream": true) spread the same total latency over the
+chunks of the reply, so time-to-first-token is a fraction of it.
+"""
+import asyncio
+import json
+import os
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+STUB_LLM_LATENCY = float(os.getenv("STUB_LLM_LATENCY", "2.0"))
+STUB_LLM_STREAM_CHUNKS = int(os.getenv("STUB_LLM_STREAM_CHUNKS", "20"))
+
+app = FastAPI(title="FitBuddy stub LLM")
+
+NUTRIENTS = {
+    "calories": 250,
+    "protein": 12,
+    "carbs": 30,
+    "fats": 8,
+    "fiber": 3,
+    "summary": "Stub analysis",
+}
+COMPLETION_TOKENS = 50
+
+
+def _usage(body: dict) -> dict:
+    """Prompt tokens estimated at ~4 characters per token, so prompt size shows in the metrics"""
+    prompt_tokens = sum(len(message.get("content") or "") for message in body.get("messages", [])) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": COMPLETION_TOKENS,
+        "total_tokens": prompt_tokens + COMPLETION_TOKENS,
+    }
+
+
+def _content(body: dict) -> str:
+    if body.get("response_format", {}).get("type") == "json_object":
+        return json.dumps(NUTRIENTS)
+    return "Stub summary of the day."
+
+
+async def _stream(body: dict, content: str):
+    size = max(1, -(-len(content) // STUB_LLM_STREAM_CHUNKS))
+    pieces = [content[i:i + size] for i in range(0, len(content), size)]
+    for piece in pieces:
+        await asyncio.sleep(STUB_LLM_LATENCY / len(pieces))
+        chunk = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    if body.get("stream_options", {}).get("include_usage"):
+        usage = {**chunk, "choices": [], "usage": _usage(body)}
+        yield f"data: {json.dumps(usage)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    content = _content(body)
+    if body.get("stream"):
+        return StreamingResponse(_stream(body, content), media_type="text/event-stream")
+
+    await asyncio.sleep(STUB_LLM_LATENCY)
+
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o-mini"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": _usage(body),
+    }
+
+
+@app.get("/v1/models")
+async def models():
+    # Answered right away: the API's readiness check lists models
+    return {
+        "object": "list",
+        "data": [{"id": "gpt-4o-mini", "object": "model", "created": 0, "owned_by": "stub"}],
+    }
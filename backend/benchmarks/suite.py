@@ -0,0 +1,527 @@
+"""
+End-to-end benchmark: every API endpoint under a mixed read/write load.
+
+Seeds --users accounts (deterministically, from --seed) with --days days of
+food logs, --analyzed of them with analyses and the daily rollup, mints an
+access token per user, then starts the stub LLM (--llm-latency seconds per
+call) and the API and drives --clients concurrent clients for --requests
+requests drawn from MIX: every route of every router, weighted roughly like
+real use (mostly reads; writes, analyses, summaries, diet plans, jobs,
+imports, exports and logins in between). Clients remember ETags and
+revalidate like a browser does.
+
+Reported, and written to --output as JSON so runs can be compared:
+
+  - requests/sec, and p50/p95/p99 and errors per operation and overall
+  - database statements and time per request for each route and LLM calls
+    per operation, from the server's /metrics
+  - the API process' resident memory before and after the run and its peak
+  - the server's cache, coalescing and circuit breaker counters
+
+Use a PostgreSQL DATABASE_URL for numbers that mean something in production;
+SQLite works for quick comparisons. --compare prints the change against an
+earlier result file:
+
+Run from backend/ (replaces the benchmark accounts and their data):
+    DATABASE_URL=postgresql://... python -m benchmarks.suite --output before.json
+    DATABASE_URL=postgresql://... python -m benchmarks.suite --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import secrets
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+from sqlalchemy import delete, func, insert, select
+
+from benchmarks.common import APP_DIR, BACKEND_DIR, migrate, start_server, summarize, wait_until_up
+
+# The benchmark mints tokens, so it has to share the server's signing key
+os.environ.setdefault("SECRET_KEY", secrets.token_urlsafe(32))
+os.environ["AUTH_REQUIRED"] = "true"
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+sys.path.insert(0, str(APP_DIR))
+
+import models  # noqa: E402
+from database import SessionLocal, dispose_engine, get_engine  # noqa: E402
+from services import auth, nutrient_rollup  # noqa: E402
+
+EMAIL_DOMAIN = "suite.fitbuddy.invalid"
+PASSWORD = "benchmark-password"
+SEED_BATCH_SIZE = 5_000
+MEALS = list(models.MealTime)
+# Plain descriptions the local nutrient engine can estimate, and free text only the LLM can
+FOODS = (
+    "1 banana", "2 eggs", "1 cup rice", "100g chicken breast", "1 apple", "1 slice bread",
+    "leftover lasagna from the office party", "grandma's lentil soup with crusty bread",
+    "acai bowl with granola and honey", "street tacos al pastor with pineapple",
+)
+STUB_NUTRIENTS = {"calories": 250, "protein": 12, "carbs": 30, "fats": 8, "fiber": 3}
+SEED_RECOMMENDATIONS = {
+    "high_calorie_foods": [],
+    "general_recommendations": ["Seeded diet plan"],
+    "meal_timing_suggestions": "",
+}
+
+# Operation -> relative weight in the mix
+MIX = {
+    "GET /api/food-logs/ (day)": 12,
+    "GET /api/food-logs/ (page)": 6,
+    "GET /api/food-logs/{id}": 8,
+    "POST /api/food-logs/": 8,
+    "PUT /api/food-logs/{id}": 3,
+    "DELETE /api/food-logs/{id}": 2,
+    "POST /api/food-logs/import": 1,
+    "GET /api/food-logs/export": 1,
+    "GET /api/ai/nutrients/{date}": 8,
+    "GET /api/ai/trends": 3,
+    "POST /api/ai/analyze": 5,
+    "POST /api/ai/analyze/batch": 1,
+    "POST /api/ai/summarize": 1,
+    "POST /api/ai/summarize/stream": 1,
+    "GET /api/ai/cache/stats": 1,
+    "GET /api/diet-plan/": 4,
+    "POST /api/diet-plan/generate": 1,
+    "POST /api/diet-plan/generate/stream": 1,
+    "POST /api/jobs/": 1,
+    "GET /api/jobs/{id}": 2,
+    "GET /api/jobs/stats": 1,
+    "GET /api/auth/me": 3,
+    "POST /api/auth/token": 1,
+    "POST /api/auth/register": 1,
+    "GET /health": 1,
+}
+
+
+class BenchUser:
+    def __init__(self, user_id, email, token):
+        self.id = user_id
+        self.email = email
+        self.token = token
+        self.logs = []  # (food_log_id, date) of seeded logs
+        self.unanalyzed = []
+        self.created = []  # ids of logs created during the run, which may be updated and deleted
+        self.jobs = []
+        self.etags = {}
+
+
+def _bench_users():
+    return select(models.User.id).where(models.User.email.like(f"%@{EMAIL_DOMAIN}"))
+
+
+async def seed(args):
+    """Replace the benchmark accounts and their data; returns a BenchUser per account"""
+    migrate()
+
+    started = time.perf_counter()
+    rng = random.Random(args.seed)
+    today = date.today()
+    hashed_password = await auth.hash_password(PASSWORD)
+    async with SessionLocal() as db:
+        bench_logs = select(models.FoodLog.id).where(models.FoodLog.user_id.in_(_bench_users()))
+        # Explicit, since SQLite doesn't cascade without PRAGMA foreign_keys
+        await db.execute(delete(models.FoodAnalysis).where(models.FoodAnalysis.food_log_id.in_(bench_logs)))
+        for table in (models.FoodLog, models.DailyNutrientTotal, models.DailySummary, models.DietPlan, models.Job):
+            await db.execute(delete(table).where(table.user_id.in_(_bench_users())))
+        await db.execute(delete(models.User).where(models.User.id.in_(_bench_users())))
+
+        await db.execute(insert(models.User.__table__), [
+            {"email": f"user{index}@{EMAIL_DOMAIN}", "hashed_password": hashed_password}
+            for index in range(args.users)
+        ])
+        result = await db.execute(select(models.User.id, models.User.email).where(
+            models.User.id.in_(_bench_users())
+        ).order_by(models.User.id))
+        users = [BenchUser(user_id, email, auth.create_access_token(user_id)) for user_id, email in result]
+
+        batch = []
+        for user in users:
+            for offset in range(args.days):
+                day = today - timedelta(days=offset)
+                for _ in range(args.logs_per_day):
+                    batch.append({
+                        "user_id": user.id,
+                        "date": day,
+                        "meal_time": rng.choice(MEALS),
+                        "food_description": rng.choice(FOODS),
+                    })
+            if len(batch) >= SEED_BATCH_SIZE:
+                await db.execute(insert(models.FoodLog.__table__), batch)
+                batch = []
+        if batch:
+            await db.execute(insert(models.FoodLog.__table__), batch)
+
+        by_id = {user.id: user for user in users}
+        result = await db.execute(
+            select(models.FoodLog.user_id, models.FoodLog.id, models.FoodLog.date)
+            .where(models.FoodLog.user_id.in_(_bench_users())).order_by(models.FoodLog.id)
+        )
+        analyses = []
+        for user_id, food_log_id, day in result:
+            user = by_id[user_id]
+            user.logs.append((food_log_id, day))
+            if rng.random() < args.analyzed:
+                analyses.append({"food_log_id": food_log_id, "summary": "Seeded analysis", **STUB_NUTRIENTS})
+            else:
+                user.unanalyzed.append(food_log_id)
+        for offset in range(0, len(analyses), SEED_BATCH_SIZE):
+            await db.execute(insert(models.FoodAnalysis.__table__), analyses[offset:offset + SEED_BATCH_SIZE])
+
+        # Every user starts with a (stale) plan, so GET /api/diet-plan/ finds one
+        await db.execute(insert(models.DietPlan.__table__), [
+            {"user_id": user.id, "recommendations": SEED_RECOMMENDATIONS} for user in users
+        ])
+
+        # The rollup as the API would have maintained it
+        await db.execute(insert(models.DailyNutrientTotal).from_select(
+            ["user_id", "date", *nutrient_rollup.NUTRIENT_FIELDS, "log_count", "analysis_count"],
+            select(
+                models.FoodLog.user_id,
+                models.FoodLog.date,
+                *(func.coalesce(func.sum(getattr(models.FoodAnalysis, field)), 0)
+                  for field in nutrient_rollup.NUTRIENT_FIELDS),
+                func.count(models.FoodLog.id),
+                func.count(models.FoodAnalysis.id),
+            ).outerjoin(
+                models.FoodAnalysis, models.FoodAnalysis.food_log_id == models.FoodLog.id
+            ).where(
+                models.FoodLog.user_id.in_(_bench_users())
+            ).group_by(models.FoodLog.user_id, models.FoodLog.date)
+        ))
+        await db.commit()
+    await dispose_engine()
+
+    log_count = sum(len(user.logs) for user in users)
+    print(f"Seeded {len(users)} users, {log_count} food logs and {len(analyses)} analyses "
+          f"in {time.perf_counter() - started:.1f}s")
+    return users
+
+
+def _new_log(rng):
+    return {
+        "date": (date.today() - timedelta(days=rng.randrange(4))).isoformat(),
+        "meal_time": rng.choice(MEALS).value,
+        "food_description": rng.choice(FOODS),
+    }
+
+
+def request_for(operation, user, rng, counter):
+    """
+    (method, path, request kwargs, response callback) for one operation of
+    user, or None if the user has nothing to run it on yet
+    """
+    food_log_id, day = rng.choice(user.logs)
+    if operation == "GET /api/food-logs/ (day)":
+        return "GET", "/api/food-logs/", {"params": {"date": day.isoformat()}}, None
+    if operation == "GET /api/food-logs/ (page)":
+        return "GET", "/api/food-logs/", {"params": {"limit": 50}}, None
+    if operation == "GET /api/food-logs/{id}":
+        return "GET", f"/api/food-logs/{food_log_id}", {}, None
+    if operation == "POST /api/food-logs/":
+        return "POST", "/api/food-logs/", {"json": _new_log(rng)}, lambda body: user.created.append(body["id"])
+    if operation == "PUT /api/food-logs/{id}":
+        if not user.created:
+            return None
+        return "PUT", f"/api/food-logs/{rng.choice(user.created)}", {"json": _new_log(rng)}, None
+    if operation == "DELETE /api/food-logs/{id}":
+        if not user.created:
+            return None
+        return "DELETE", f"/api/food-logs/{user.created.pop()}", {}, None
+    if operation == "POST /api/food-logs/import":
+        rows = [_new_log(rng) for _ in range(20)]
+        csv = "date,meal_time,food_description\n" + "".join(
+            f"{row['date']},{row['meal_time']},{row['food_description']}\n" for row in rows
+        )
+        return "POST", "/api/food-logs/import", {"content": csv, "headers": {"Content-Type": "text/csv"}}, None
+    if operation == "GET /api/food-logs/export":
+        return "GET", "/api/food-logs/export", {"params": {
+            "format": rng.choice(("csv", "ndjson")), "start_date": (date.today() - timedelta(days=7)).isoformat()
+        }}, None
+    if operation == "GET /api/ai/nutrients/{date}":
+        return "GET", f"/api/ai/nutrients/{day.isoformat()}", {}, None
+    if operation == "GET /api/ai/trends":
+        return "GET", "/api/ai/trends", {}, None
+    if operation == "POST /api/ai/analyze":
+        if not user.unanalyzed:
+            return None
+        return "POST", "/api/ai/analyze", {"json": {"food_log_id": user.unanalyzed.pop()}}, None
+    if operation == "POST /api/ai/analyze/batch":
+        return "POST", "/api/ai/analyze/batch", {"json": {
+            "start_date": day.isoformat(), "end_date": day.isoformat()
+        }}, None
+    if operation in ("POST /api/ai/summarize", "POST /api/ai/summarize/stream"):
+        return "POST", operation.split(" ")[1], {"json": {"date": day.isoformat()}}, None
+    if operation == "GET /api/ai/cache/stats":
+        return "GET", "/api/ai/cache/stats", {}, None
+    if operation == "GET /api/diet-plan/":
+        return "GET", "/api/diet-plan/", {}, None
+    if operation in ("POST /api/diet-plan/generate", "POST /api/diet-plan/generate/stream"):
+        return "POST", operation.split(" ")[1], {}, None
+    if operation == "POST /api/jobs/":
+        kind = rng.choice(("analyze", "summarize", "diet_plan"))
+        payload = {"kind": kind}
+        if kind == "analyze":
+            payload["food_log_id"] = food_log_id
+        elif kind == "summarize":
+            payload["date"] = day.isoformat()
+        return "POST", "/api/jobs/", {"json": payload}, lambda body: user.jobs.append(body["id"])
+    if operation == "GET /api/jobs/{id}":
+        if not user.jobs:
+            return None
+        return "GET", f"/api/jobs/{rng.choice(user.jobs)}", {}, None
+    if operation == "GET /api/jobs/stats":
+        return "GET", "/api/jobs/stats", {}, None
+    if operation == "GET /api/auth/me":
+        return "GET", "/api/auth/me", {}, None
+    if operation == "POST /api/auth/token":
+        return "POST", "/api/auth/token", {"data": {"username": user.email, "password": PASSWORD}}, None
+    if operation == "POST /api/auth/register":
+        email = f"new{counter}@{EMAIL_DOMAIN}"
+        return "POST", "/api/auth/register", {"json": {"email": email, "password": PASSWORD}}, None
+    if operation == "GET /health":
+        return "GET", "/health", {}, None
+    raise ValueError(f"Unknown operation: {operation}")
+
+
+async def client_loop(client, api_url, work, rng, args, latencies, errors, statuses):
+    while work:
+        counter, operation, user = work.pop()
+        spec = request_for(operation, user, rng, counter)
+        if spec is None:
+            # Nothing to update, delete, analyze or poll yet: log a meal instead
+            operation = "POST /api/food-logs/"
+            spec = request_for(operation, user, rng, counter)
+        method, path, kwargs, on_response = spec
+
+        headers = {"Authorization": f"Bearer {user.token}", **kwargs.pop("headers", {})}
+        url = api_url + path
+        etag_key = (path, json.dumps(kwargs.get("params"), sort_keys=True))
+        if method == "GET" and args.revalidate and etag_key in user.etags:
+            headers["If-None-Match"] = user.etags[etag_key]
+
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, headers=headers, **kwargs)
+        except httpx.HTTPError:
+            errors[operation] += 1
+            continue
+        latencies[operation].append((time.perf_counter() - started) * 1000)
+        statuses[operation][response.status_code] += 1
+        if response.status_code >= 400:
+            errors[operation] += 1
+            continue
+        if "etag" in response.headers:
+            user.etags[etag_key] = response.headers["etag"]
+        if on_response is not None:
+            on_response(response.json())
+
+
+def scrape(text):
+    """The per-route database and per-operation LLM counters from a /metrics page"""
+    totals = defaultdict(float)
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            labels = sample.labels
+            if sample.name in (
+                "fitbuddy_db_queries_per_request_sum", "fitbuddy_db_queries_per_request_count",
+                "fitbuddy_db_time_per_request_seconds_sum",
+            ):
+                totals[(sample.name, labels["route"])] += sample.value
+            elif sample.name == "fitbuddy_llm_requests_total":
+                totals[(sample.name, f"{labels['operation']} {labels['outcome']}")] += sample.value
+            elif sample.name == "fitbuddy_llm_tokens_total":
+                totals[(sample.name, labels["kind"])] += sample.value
+    return totals
+
+
+def metrics_delta(before, after):
+    delta = {key: after[key] - before.get(key, 0) for key in after}
+    queries = {}
+    for (name, route), count in delta.items():
+        if name != "fitbuddy_db_queries_per_request_count" or not count:
+            continue
+        queries[route] = {
+            "requests": int(count),
+            "queries_per_request": round(delta[("fitbuddy_db_queries_per_request_sum", route)] / count, 2),
+            "db_ms_per_request": round(delta[("fitbuddy_db_time_per_request_seconds_sum", route)] / count * 1000, 2),
+        }
+    llm_calls = {key: int(value) for (name, key), value in delta.items() if name == "fitbuddy_llm_requests_total" and value}
+    llm_tokens = {key: int(value) for (name, key), value in delta.items() if name == "fitbuddy_llm_tokens_total" and value}
+    return dict(sorted(queries.items())), {"calls": dict(sorted(llm_calls.items())), "tokens": llm_tokens}
+
+
+def _processes(pid):
+    """pid and, with several uvicorn workers, its worker processes (Linux)"""
+    pids = [pid]
+    try:
+        children = Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+    except OSError:
+        return pids
+    return pids + [int(child) for child in children]
+
+
+def memory_mb(pid):
+    """Resident and peak resident memory of the API processes in MB; empty where /proc isn't available"""
+    totals = {}
+    for process in _processes(pid):
+        try:
+            status = Path(f"/proc/{process}/status").read_text()
+        except OSError:
+            continue
+        for line in status.splitlines():
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                totals[key] = totals.get(key, 0) + int(value.split()[0]) / 1024
+    return {"rss_mb": round(totals["VmRSS"], 1), "peak_rss_mb": round(totals["VmHWM"], 1)} if totals else {}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    def change(new, old):
+        return f"{new:>9} ({(new - old) / old * 100:+.0f}%)" if old else f"{new:>9}"
+
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('started_at')}):")
+    print(f"  requests/sec {change(results['requests_per_sec'], baseline['requests_per_sec'])}")
+    for operation, stats in {"overall": results["overall"], **results["operations"]}.items():
+        old = baseline["overall"] if operation == "overall" else baseline["operations"].get(operation)
+        if not old:
+            continue
+        print(f"  {operation:<38} p50 {change(stats['p50_ms'], old['p50_ms'])}  "
+              f"p95 {change(stats['p95_ms'], old['p95_ms'])}  p99 {change(stats['p99_ms'], old['p99_ms'])}")
+    for route, stats in results["queries"].items():
+        old = baseline["queries"].get(route)
+        if old and stats["queries_per_request"] != old["queries_per_request"]:
+            print(f"  {route:<38} queries/request {old['queries_per_request']} -> {stats['queries_per_request']}")
+    if results["memory"].get("peak_rss_mb") and baseline["memory"].get("peak_rss_mb"):
+        print(f"  peak RSS MB  {change(results['memory']['peak_rss_mb'], baseline['memory']['peak_rss_mb'])}")
+
+
+async def run(args):
+    users = await seed(args)
+
+    rng = random.Random(args.seed)
+    operations = rng.choices(list(MIX), weights=list(MIX.values()), k=args.warmup + args.requests)
+    work = [(counter, operation, rng.choice(users)) for counter, operation in enumerate(operations)]
+    # Clients pop from the end
+    warmup, measured = work[:args.warmup][::-1], work[args.warmup:][::-1]
+
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    llm_url = f"http://127.0.0.1:{args.llm_port}"
+    env = dict(os.environ)
+    env["STUB_LLM_LATENCY"] = str(args.llm_latency)
+    env["OPENAI_BASE_URL"] = f"{llm_url}/v1"
+    # Measures what the endpoints cost, not the per-user limits in front of them
+    env.setdefault("RATE_LIMIT_ENABLED", "false")
+    if args.workers > 1:
+        # Aggregate /metrics across the workers
+        env.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="fitbuddy-metrics-"))
+
+    results = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "database": get_engine().dialect.name,
+            "python": platform.python_version(),
+            "args": vars(args),
+        },
+    }
+    stub = start_server("benchmarks.stub_llm:app", args.llm_port, BACKEND_DIR, env)
+    api = start_server("main:app", args.api_port, APP_DIR, env, workers=args.workers)
+    try:
+        limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+        async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+            await wait_until_up(client, f"{llm_url}/docs")
+            await wait_until_up(client, f"{api_url}/health")
+
+            memory_before = memory_mb(api.pid)
+            for phase, phase_work in (("warmup", warmup), ("measured", measured)):
+                latencies, errors = defaultdict(list), defaultdict(int)
+                statuses = defaultdict(lambda: defaultdict(int))
+                before = scrape((await client.get(f"{api_url}/metrics")).text)
+                started = time.perf_counter()
+                await asyncio.gather(*(
+                    client_loop(client, api_url, phase_work, random.Random(args.seed + index), args,
+                                latencies, errors, statuses)
+                    for index in range(args.clients)
+                ))
+                elapsed = time.perf_counter() - started
+                after = scrape((await client.get(f"{api_url}/metrics")).text)
+            memory_after = memory_mb(api.pid)
+            results["memory"] = {
+                "start_rss_mb": memory_before.get("rss_mb"),
+                "end_rss_mb": memory_after.get("rss_mb"),
+                "peak_rss_mb": memory_after.get("peak_rss_mb"),
+            }
+
+            results["elapsed_s"] = round(elapsed, 2)
+            results["requests_per_sec"] = round(sum(map(len, latencies.values())) / elapsed, 1)
+            results["overall"] = {
+                **summarize([value for values in latencies.values() for value in values]),
+                "errors": sum(errors.values()),
+            }
+            results["operations"] = {
+                operation: {
+                    **summarize(latencies[operation]),
+                    "errors": errors[operation],
+                    "statuses": {str(status): count for status, count in sorted(statuses[operation].items())},
+                }
+                for operation in MIX if latencies[operation]
+            }
+            results["queries"], results["llm"] = metrics_delta(before, after)
+            token = users[0].token
+            results["server_stats"] = (await client.get(
+                f"{api_url}/api/ai/cache/stats", headers={"Authorization": f"Bearer {token}"}
+            )).json()
+    finally:
+        api.terminate()
+        stub.terminate()
+
+    print(json.dumps({key: value for key, value in results.items() if key != "meta"}, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2, default=str))
+    if args.compare:
+        compare(results, json.loads(Path(args.compare).read_text()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--days", type=int, default=30, help="days of seeded history per user")
+    parser.add_argument("--logs-per-day", type=int, default=4)
+    parser.add_argument("--analyzed", type=float, default=0.8, help="share of seeded logs with an analysis")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=500, help="requests run before measuring")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per stub LLM call")
+    parser.add_argument("--no-revalidate", dest="revalidate", action="store_false",
+                        help="don't send If-None-Match with remembered ETags")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--api-port", type=int, default=8100)
+    parser.add_argument("--llm-port", type=int, default=9000)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="an earlier --output file to compare with")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
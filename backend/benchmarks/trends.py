@@ -0,0 +1,146 @@
+"""
+Latency of GET /api/ai/trends on synthetic multi-year histories.
+
+Seeds --users users (user 1 is the one the API serves) with --years of
+history: each day is logged with probability --logged-share, with 2-5 meals
+spread over the meal times, every meal analyzed. The daily rollup is rebuilt
+from those rows, then the API is started and the trends endpoint is timed over
+the whole history and over the default 90 days.
+
+Run from backend/ with DATABASE_URL set (the seeded users' rows are replaced):
+    python -m benchmarks.trends --years 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import httpx
+from sqlalchemy import delete, insert, select
+
+from benchmarks.common import APP_DIR, migrate, start_server, summarize, wait_until_up
+
+sys.path.insert(0, str(APP_DIR))
+
+import models  # noqa: E402
+from database import SessionLocal, dispose_engine  # noqa: E402
+from services import nutrient_rollup  # noqa: E402
+
+BUDGET_MS = 50
+MEAL_TIMES = list(models.MealTime)
+
+
+def synthetic_logs(user_id, first, days, logged_share, rng):
+    for offset in range(days):
+        if rng.random() > logged_share:
+            continue
+        day = first + timedelta(days=offset)
+        for meal in range(rng.randint(2, 5)):
+            yield {
+                "user_id": user_id,
+                "date": day,
+                "meal_time": MEAL_TIMES[min(meal, len(MEAL_TIMES) - 1)],
+                "food_description": "synthetic meal",
+            }
+
+
+async def seed(users, years, logged_share):
+    migrate()
+
+    rng = random.Random(42)
+    days = int(years * 365)
+    first = date.today() - timedelta(days=days - 1)
+    user_ids = list(range(1, users + 1))
+    started = time.perf_counter()
+    async with SessionLocal() as db:
+        # Explicit, since SQLite doesn't cascade without PRAGMA foreign_keys
+        await db.execute(delete(models.FoodAnalysis).where(models.FoodAnalysis.food_log_id.in_(
+            select(models.FoodLog.id).where(models.FoodLog.user_id.in_(user_ids))
+        )))
+        await db.execute(delete(models.FoodLog).where(models.FoodLog.user_id.in_(user_ids)))
+        logs = 0
+        for user_id in user_ids:
+            rows = list(synthetic_logs(user_id, first, days, logged_share, rng))
+            await db.execute(insert(models.FoodLog), rows)
+            logs += len(rows)
+        # Deterministic per-log nutrients derived from the id
+        food_log_id = models.FoodLog.id
+        await db.execute(
+            insert(models.FoodAnalysis).from_select(
+                ["food_log_id", "calories", "protein", "carbs", "fats", "fiber", "summary"],
+                select(
+                    food_log_id,
+                    200 + (food_log_id * 37) % 500,
+                    5 + (food_log_id * 7) % 35,
+                    20 + (food_log_id * 11) % 60,
+                    5 + (food_log_id * 5) % 25,
+                    (food_log_id * 3) % 10,
+                    models.FoodLog.food_description
+                ).where(models.FoodLog.user_id.in_(user_ids))
+            )
+        )
+        await db.commit()
+        for user_id in user_ids:
+            await nutrient_rollup.rebuild(db, user_id)
+    print(f"Seeded {logs} logs for {users} users over {days} days in {time.perf_counter() - started:.1f}s")
+    return first
+
+
+async def sample(client, url, params, requests):
+    await client.get(url, params=params)  # warm-up
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = await client.get(url, params=params)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+async def run(args):
+    first = await seed(args.users, args.years, args.logged_share)
+    await dispose_engine()
+
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "stub")
+    env.setdefault("AUTH_REQUIRED", "false")
+    api = start_server("main:app", args.api_port, APP_DIR, env)
+    results = {}
+    try:
+        async with httpx.AsyncClient(timeout=60) as client:
+            await wait_until_up(client, f"{api_url}/health")
+            cases = {
+                "full_history": {"start_date": first.isoformat(), "end_date": date.today().isoformat()},
+                "last_90_days": {},
+            }
+            for label, params in cases.items():
+                stats = summarize(await sample(client, f"{api_url}/api/ai/trends", params, args.requests))
+                stats["within_budget"] = stats["p99_ms"] < BUDGET_MS
+                results[label] = stats
+                print(f"{label:>13}: p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms")
+    finally:
+        api.terminate()
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--years", type=float, default=3)
+    parser.add_argument("--logged-share", type=float, default=0.9)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--api-port", type=int, default=8100)
+    parser.add_argument("--output", help="write the latency summary as JSON")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
 "use client";
 
 import { useState, useEffect } from "react";
-import { FoodLog, getFoodLogs } from "@/lib/api";
+import { FoodLog, getFoodLogs, getToken, clearToken, UNAUTHORIZED_EVENT } from "@/lib/api";
 import FoodLogForm from "@/components/FoodLogForm";
 import FoodLogList from "@/components/FoodLogList";
 import DailySummary from "@/components/DailySummary";
 import DietPlan from "@/components/DietPlan";
 import CalorieTracker from "../components/CalorieTracker";
+import Login from "@/components/Login";
 
 export default function Home() {
   const [selectedDate, setSelectedDate] = useState(() => {
@@ -17,10 +18,25 @@ export default function Home() {
   const [loading, setLoading] = useState(false);
   const [activeTab, setActiveTab] = useState<"log" | "plan">("log");
   const [refreshKey, setRefreshKey] = useState(0);
+  // null until the stored token has been read on the client
+  const [signedIn, setSignedIn] = useState<boolean | null>(null);
 
   useEffect(() => {
-    loadFoodLogs();
-  }, [selectedDate]);
+    setSignedIn(getToken() !== null);
+    const onUnauthorized = () => setSignedIn(false);
+    window.addEventListener(UNAUTHORIZED_EVENT, onUnauthorized);
+    return () => window.removeEventListener(UNAUTHORIZED_EVENT, onUnauthorized);
+  }, []);
+
+  useEffect(() => {
+    if (signedIn) loadFoodLogs();
+  }, [selectedDate, signedIn]);
+
+  const signOut = () => {
+    clearToken();
+    setFoodLogs([]);
+    setSignedIn(false);
+  };
 
   const loadFoodLogs = async () => {
     setLoading(true);
@@ -38,13 +54,24 @@ export default function Home() {
     <div className="min-h-screen bg-gray-50">
       {/* Header */}
       <header className="bg-white/80 backdrop-blur border-b border-gray-200 sticky top-0 z-10">
-        <div className="max-w-4xl mx-auto px-4 py-4">
-          <h1 className="text-2xl font-bold text-brand">FitBuddy</h1>
-          <p className="text-sm text-gray-600">Track your food and get personalized recommendations</p>
+        <div className="max-w-4xl mx-auto px-4 py-4 flex items-center justify-between">
+          <div>
+            <h1 className="text-2xl font-bold text-brand">FitBuddy</h1>
+            <p className="text-sm text-gray-600">Track your food and get personalized recommendations</p>
+          </div>
+          {signedIn && (
+            <button onClick={signOut} className="text-sm text-gray-600 hover:text-gray-800">
+              Sign out
+            </button>
+          )}
         </div>
       </header>
 
       <main className="max-w-4xl mx-auto px-4 py-6">
+        {signedIn === false && <Login onSuccess={() => setSignedIn(true)} />}
+
+        {signedIn && (
+        <>
         {/* Tabs */}
         <div className="flex gap-2 mb-6 border-b border-gray-200">
           <button
@@ -125,6 +152,8 @@ export default function Home() {
             <DietPlan />
           </div>
         )}
+        </>
+        )}
       </main>
 
       {/* Footer */}
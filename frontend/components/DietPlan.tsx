@@ -17,11 +17,7 @@ export default function DietPlanComponent() {
     try {
       const data = await getDietPlan();
       setPlan(data);
-      try {
-        setRecommendations(JSON.parse(data.recommendations));
-      } catch {
-        setRecommendations(null);
-      }
+      setRecommendations(data.recommendations);
     } catch (err) {
       // No plan exists yet, that's okay
       setPlan(null);
@@ -34,11 +30,7 @@ export default function DietPlanComponent() {
     try {
       const data = await generateDietPlan();
       setPlan(data);
-      try {
-        setRecommendations(JSON.parse(data.recommendations));
-      } catch {
-        setRecommendations(null);
-      }
+      setRecommendations(data.recommendations);
     } catch (err) {
       setError(err instanceof Error ? err.message : "Failed to generate diet plan");
     } finally {
@@ -65,6 +57,12 @@ export default function DietPlanComponent() {
         </div>
       )}
 
+      {plan?.stale && (
+        <div className="mb-4 p-3 bg-yellow-50 border border-yellow-200 rounded-lg text-yellow-800 text-sm">
+          Your food logs have changed since this plan was generated. Regenerate to update it.
+        </div>
+      )}
+
       {!plan && !loading && (
         <div className="text-center py-8 text-gray-500">
           <p className="mb-4">
@@ -136,10 +134,6 @@ export default function DietPlanComponent() {
           )}
         </div>
       )}
-
-      {plan && !recommendations && (
-        <div className="text-gray-700 whitespace-pre-wrap">{plan.recommendations}</div>
-      )}
     </div>
   );
 }
@@ -0,0 +1,102 @@
+"use client";
+
+import { useState } from "react";
+import { login, register } from "@/lib/api";
+
+interface LoginProps {
+  onSuccess: () => void;
+}
+
+export default function Login({ onSuccess }: LoginProps) {
+  const [mode, setMode] = useState<"login" | "register">("login");
+  const [email, setEmail] = useState("");
+  const [password, setPassword] = useState("");
+  const [isSubmitting, setIsSubmitting] = useState(false);
+  const [error, setError] = useState<string | null>(null);
+
+  const handleSubmit = async (e: React.FormEvent) => {
+    e.preventDefault();
+    setError(null);
+    setIsSubmitting(true);
+
+    try {
+      if (mode === "login") {
+        await login(email, password);
+      } else {
+        await register(email, password);
+      }
+      setPassword("");
+      onSuccess();
+    } catch (err) {
+      setError(err instanceof Error ? err.message : "Failed to sign in");
+    } finally {
+      setIsSubmitting(false);
+    }
+  };
+
+  return (
+    <div className="max-w-sm mx-auto bg-white border border-gray-200 rounded-lg p-6">
+      <h2 className="text-xl font-bold text-gray-800 mb-4">
+        {mode === "login" ? "Sign in" : "Create an account"}
+      </h2>
+      <form onSubmit={handleSubmit} className="space-y-4">
+        <div>
+          <label htmlFor="email" className="block text-sm font-medium text-gray-700 mb-2">
+            Email
+          </label>
+          <input
+            type="email"
+            id="email"
+            value={email}
+            onChange={(e) => setEmail(e.target.value)}
+            autoComplete="email"
+            required
+            className="w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-green-500 focus:border-transparent"
+          />
+        </div>
+
+        <div>
+          <label htmlFor="password" className="block text-sm font-medium text-gray-700 mb-2">
+            Password
+          </label>
+          <input
+            type="password"
+            id="password"
+            value={password}
+            onChange={(e) => setPassword(e.target.value)}
+            autoComplete={mode === "login" ? "current-password" : "new-password"}
+            minLength={8}
+            maxLength={72}
+            required
+            className="w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-green-500 focus:border-transparent"
+          />
+        </div>
+
+        {error && (
+          <div className="p-3 bg-red-50 border border-red-200 rounded-lg text-red-700 text-sm">
+            {error}
+          </div>
+        )}
+
+        <button
+          type="submit"
+          disabled={isSubmitting}
+          className="btn-primary w-full px-4 py-2 disabled:bg-gray-400 disabled:cursor-not-allowed"
+        >
+          {isSubmitting ? "Please wait..." : mode === "login" ? "Sign in" : "Create account"}
+        </button>
+      </form>
+
+      <button
+        type="button"
+        onClick={() => {
+          setMode(mode === "login" ? "register" : "login");
+          setError(null);
+        }}
+        className="mt-4 w-full text-sm text-green-600 hover:text-green-700"
+      >
+        {mode === "login" ? "New here? Create an account" : "Already have an account? Sign in"}
+      </button>
+    </div>
+  );
+}
@@ -41,17 +41,93 @@ export interface DailyNutrients {
   fiber: number;
 }
 
+export interface DietPlanRecommendations {
+  high_calorie_foods?: any[];
+  general_recommendations?: string[];
+  meal_timing_suggestions?: string;
+}
+
 export interface DietPlan {
   id: number;
   user_id: number;
-  recommendations: string;
+  recommendations: DietPlanRecommendations;
   created_at: string;
   updated_at?: string;
+  stale?: boolean;
+  cached?: boolean;
+}
+
+// Auth
+const TOKEN_KEY = "fitbuddy_token";
+export const UNAUTHORIZED_EVENT = "fitbuddy:unauthorized";
+
+export interface User {
+  id: number;
+  email: string;
+  created_at: string;
+}
+
+export function getToken(): string | null {
+  if (typeof window === "undefined") return null;
+  return window.localStorage.getItem(TOKEN_KEY);
+}
+
+export function clearToken(): void {
+  window.localStorage.removeItem(TOKEN_KEY);
+}
+
+async function apiFetch(path: string, init: RequestInit = {}): Promise<Response> {
+  const headers = new Headers(init.headers);
+  const token = getToken();
+  if (token) headers.set("Authorization", `Bearer ${token}`);
+  const response = await fetch(`${API_BASE_URL}${path}`, { ...init, headers });
+  if (response.status === 401) {
+    // Expired or revoked: drop the token and let the page ask to sign in again
+    clearToken();
+    window.dispatchEvent(new Event(UNAUTHORIZED_EVENT));
+  }
+  return response;
+}
+
+async function errorDetail(response: Response, fallback: string): Promise<string> {
+  try {
+    const body = await response.json();
+    return typeof body.detail === "string" ? body.detail : fallback;
+  } catch {
+    return fallback;
+  }
+}
+
+export async function login(email: string, password: string): Promise<void> {
+  const response = await fetch(`${API_BASE_URL}/api/auth/token`, {
+    method: "POST",
+    headers: { "Content-Type": "application/x-www-form-urlencoded" },
+    body: new URLSearchParams({ username: email, password }),
+  });
+  if (!response.ok) throw new Error(await errorDetail(response, "Failed to sign in"));
+  const { access_token } = await response.json();
+  window.localStorage.setItem(TOKEN_KEY, access_token);
+}
+
+export async function register(email: string, password: string): Promise<void> {
+  const response = await fetch(`${API_BASE_URL}/api/auth/register`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ email, password }),
+  });
+  if (!response.ok) throw new Error(await errorDetail(response, "Failed to create account"));
+  await login(email, password);
+}
+
+export async function getMe(): Promise<User> {
+  const response = await apiFetch("/api/auth/me");
+  if (!response.ok) throw new Error("Failed to get account");
+  return response.json();
 }
 
 // Food Logs API
 export async function createFoodLog(data: FoodLogCreate): Promise<FoodLog> {
-  const response = await fetch(`${API_BASE_URL}/api/food-logs/`, {
+  const response = await apiFetch(`/api/food-logs/`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify(data),
@@ -61,16 +137,14 @@ export async function createFoodLog(data: FoodLogCreate): Promise<FoodLog> {
 }
 
 export async function getFoodLogs(date?: string): Promise<FoodLog[]> {
-  const url = date
-    ? `${API_BASE_URL}/api/food-logs/?date=${date}`
-    : `${API_BASE_URL}/api/food-logs/`;
-  const response = await fetch(url);
+  const path = date ? `/api/food-logs/?date=${date}` : "/api/food-logs/";
+  const response = await apiFetch(path);
   if (!response.ok) throw new Error("Failed to fetch food logs");
   return response.json();
 }
 
 export async function deleteFoodLog(id: number): Promise<void> {
-  const response = await fetch(`${API_BASE_URL}/api/food-logs/${id}`, {
+  const response = await apiFetch(`/api/food-logs/${id}`, {
     method: "DELETE",
   });
   if (!response.ok) throw new Error("Failed to delete food log");
@@ -80,7 +154,7 @@ export async function updateFoodLog(
   id: number,
   data: FoodLogCreate,
 ): Promise<FoodLog> {
-  const response = await fetch(`${API_BASE_URL}/api/food-logs/${id}`, {
+  const response = await apiFetch(`/api/food-logs/${id}`, {
     method: "PUT",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify(data),
@@ -91,7 +165,7 @@ export async function updateFoodLog(
 
 // AI Analysis API
 export async function analyzeFood(foodLogId: number): Promise<FoodAnalysis> {
-  const response = await fetch(`${API_BASE_URL}/api/ai/analyze`, {
+  const response = await apiFetch(`/api/ai/analyze`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({ food_log_id: foodLogId }),
@@ -103,7 +177,7 @@ export async function analyzeFood(foodLogId: number): Promise<FoodAnalysis> {
 export async function getDailySummary(
   date: string,
 ): Promise<{ summary: string; date: string }> {
-  const response = await fetch(`${API_BASE_URL}/api/ai/summarize`, {
+  const response = await apiFetch(`/api/ai/summarize`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({ date }),
@@ -113,14 +187,14 @@ export async function getDailySummary(
 }
 
 export async function getDailyNutrients(date: string): Promise<DailyNutrients> {
-  const response = await fetch(`${API_BASE_URL}/api/ai/nutrients/${date}`);
+  const response = await apiFetch(`/api/ai/nutrients/${date}`);
   if (!response.ok) throw new Error("Failed to get nutrients");
   return response.json();
 }
 
 // Diet Plan API
 export async function generateDietPlan(): Promise<DietPlan> {
-  const response = await fetch(`${API_BASE_URL}/api/diet-plan/generate`, {
+  const response = await apiFetch(`/api/diet-plan/generate`, {
     method: "POST",
   });
   if (!response.ok) throw new Error("Failed to generate diet plan");
@@ -128,7 +202,7 @@ export async function generateDietPlan(): Promise<DietPlan> {
 }
 
 export async function getDietPlan(): Promise<DietPlan> {
-  const response = await fetch(`${API_BASE_URL}/api/diet-plan/`);
+  const response = await apiFetch(`/api/diet-plan/`);
   if (!response.ok) throw new Error("Failed to get diet plan");
   return response.json();
 }